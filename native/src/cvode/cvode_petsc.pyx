@@ -19,8 +19,14 @@ cdef extern from "petsc/petscvec.h":
      
 cdef struct cv_userdata:
     void *rhs_fun
+    void *jtimes_fun
     void *y
     void *y_dot
+    # work vectors for the Jacobian-times-vector product
+    void *v
+    void *Jv
+    void *fy
+    void *tmp
 
 cdef inline  copy_arr2nv(np_c.ndarray[realtype, ndim=1,mode='c'] np_x, N_Vector v):
     cdef long int n = (<N_VectorContent_Parallel>v.content).local_length
@@ -36,9 +42,35 @@ cdef inline copy_nv2arr(N_Vector v, np_c.ndarray[realtype, ndim=1, mode='c'] np_
     memcpy(np_x.data, v_data, n*sizeof(realtype))
     return 0
 
+cdef inline PetscReal* nv_data(N_Vector v):
+    return (<N_VectorContent_Parallel>v.content).data
+
 cdef int jtv(N_Vector v, N_Vector Jv, realtype t, N_Vector y, N_Vector fy, void *user_data, N_Vector tmp) except -1:
-     
-     return 0
+
+    cdef cv_userdata *ud = <cv_userdata *>user_data
+
+    cdef Vec v_p = <Vec>ud.v
+    cdef Vec Jv_p = <Vec>ud.Jv
+    cdef Vec y_p = <Vec>ud.y
+    cdef Vec fy_p = <Vec>ud.fy
+    cdef Vec tmp_p = <Vec>ud.tmp
+
+    VecPlaceArray(v_p.vec, nv_data(v))
+    VecPlaceArray(Jv_p.vec, nv_data(Jv))
+    VecPlaceArray(y_p.vec, nv_data(y))
+    VecPlaceArray(fy_p.vec, nv_data(fy))
+    VecPlaceArray(tmp_p.vec, nv_data(tmp))
+
+    try:
+        (<object>ud.jtimes_fun)(v_p, Jv_p, t, y_p, fy_p, tmp_p)
+    finally:
+        VecResetArray(v_p.vec)
+        VecResetArray(Jv_p.vec)
+        VecResetArray(y_p.vec)
+        VecResetArray(fy_p.vec)
+        VecResetArray(tmp_p.vec)
+
+    return 0
 
 cdef int cv_rhs(realtype t, N_Vector yv, N_Vector yvdot, void* user_data) except -1:
 
@@ -53,14 +85,29 @@ cdef int cv_rhs(realtype t, N_Vector yv, N_Vector yvdot, void* user_data) except
     VecPlaceArray(y.vec, (<N_VectorContent_Parallel>yv.content).data)
     VecPlaceArray(ydot.vec, (<N_VectorContent_Parallel>yvdot.content).data)
     
-    (<object>ud.rhs_fun)(t,y,ydot)
-    
-    VecResetArray(y.vec)
-    VecResetArray(ydot.vec)
+    try:
+        (<object>ud.rhs_fun)(t,y,ydot)
+    finally:
+        VecResetArray(y.vec)
+        VecResetArray(ydot.vec)
 
     return 0
 
 cdef class CvodeSolver(object):
+    """
+    CVODE on the parallel N_Vector. The state is the local (owned) part of
+    the PETSc vector y0 on each process; CVODE works on its own copy of it,
+    `y_np`, which holds the solution after each call of advance_time.
+
+    The callbacks receive PETSc vectors whose arrays are CVODE's vectors:
+
+        callback_fun(t, y, ydot)              computes ydot = f(t, y)
+        jac_fun(v, Jv, t, y, fy, tmp)         computes Jv = J(t, y) v
+
+    The Jacobian-times-vector product is approximated by CVODE with finite
+    differences if jac_fun is None.
+
+    """
     
     cdef public double cur_t
     cdef public np_c.ndarray y_np
@@ -68,6 +115,7 @@ cdef class CvodeSolver(object):
     cdef int max_num_steps
     cdef Vec y
     cdef Vec y_dot  # time derivative of y
+    cdef Vec v, Jv, fy, tmp  # used by jtv
     cdef N_Vector y_nv  # the N_Vector version of y
     
     cdef void *cvode_mem
@@ -79,7 +127,7 @@ cdef class CvodeSolver(object):
     cdef long int nsteps,nfevals,njevals
 
     def __cinit__(self, callback_fun, t0, y0, jac_fun=None, rtol=1e-8, atol=1e-8, max_num_steps=100000):
-        # y0 should be a petsc array, and we update this y0 automatically when call the given call_back function
+        # y0 is a petsc vector with the initial state, it isn't modified (see y_np)
 	
         # Create the CVODE memory block and to specify the solution method (linear multistep method and nonlinear solver iteration type)
         self.cvode_mem = CVodeCreate(CV_BDF, CV_NEWTON);
@@ -91,20 +139,31 @@ cdef class CvodeSolver(object):
 
     def init_ode(self, callback_fun, t0, y0):
         """
-        
+        Initialise CVODE with the right hand side `callback_fun` and the
+        local part of the PETSc vector y0 at the time t0.
+
         """
         self.callback_fun = callback_fun
         self.cv_rhs = <void *>cv_rhs  # wrapper for callback_fun (which is a Python function)
 
-        self.y = y0
+        # Vectors without memory of their own, CVODE's arrays are placed
+        # into them for the duration of a callback.
+        sizes = (y0.getLocalSize(), y0.getSize())
+        self.y = PETSc.Vec().createMPI(sizes, comm=y0.getComm())
         self.y_dot = self.y.duplicate()
+        self.v = self.y.duplicate()
+        self.Jv = self.y.duplicate()
+        self.fy = self.y.duplicate()
+        self.tmp = self.y.duplicate()
         self.cur_t = t0
 
-        self.user_data = cv_userdata(<void*>self.callback_fun,
-                                     <void *>self.y,<void *>self.y_dot)
+        self.user_data = cv_userdata(<void*>self.callback_fun, <void*>self.jac_fun,
+                                     <void *>self.y, <void *>self.y_dot,
+                                     <void *>self.v, <void *>self.Jv,
+                                     <void *>self.fy, <void *>self.tmp)
 
         cdef MPI_Comm comm_c = PETSC_COMM_WORLD
-        cdef np_c.ndarray[double, ndim=1, mode="c"] y_np = y0.getArray()
+        cdef np_c.ndarray[double, ndim=1, mode="c"] y_np = y0.getArray().copy()
         self.y_np = y_np
         self.y_nv = N_VMake_Parallel(comm_c, y0.getLocalSize(), y0.getSize(), &y_np[0])
         
@@ -115,19 +174,38 @@ cdef class CvodeSolver(object):
         self.check_flag(flag,"CVodeSetUserData")
 
     def set_options(self, rtol, atol, max_num_steps=100000):
+        self.set_scalar_tolerances(rtol, atol)
+        self.set_max_num_steps(max_num_steps)
+
+        # Set options for the CVODE scaled, preconditioned GMRES linear solver, CVSPGMR
+        flag = CVSpgmr(self.cvode_mem, PREC_NONE, 300);
+        self.check_flag(flag, "CVSpgmr")
+        #flag = CVSpilsSetGSType(self.cvode_mem, 1);
+
+        if self.jac_fun is not None:
+            flag = CVSpilsSetJacTimesVecFn(self.cvode_mem, <CVSpilsJacTimesVecFn>jtv)
+            self.check_flag(flag, "CVSpilsSetJacTimesVecFn")
+
+    def set_scalar_tolerances(self, rtol, atol):
         self.rtol = rtol
         self.atol = atol
-        self.max_num_steps = max_num_steps
-
-        # Set tolerances
         flag = CVodeSStolerances(self.cvode_mem, self.rtol, self.atol)
-        
-        # Set maximum number of iteration steps (?)
+        self.check_flag(flag, "CVodeSStolerances")
+
+    def set_max_num_steps(self, max_num_steps):
+        self.max_num_steps = max_num_steps
         flag = CVodeSetMaxNumSteps(self.cvode_mem, max_num_steps)
+        self.check_flag(flag, "CVodeSetMaxNumSteps")
 
-        # Set options for the CVODE scaled, preconditioned GMRES linear solver, CVSPGMR
-        flag = CVSpgmr(self.cvode_mem, PREC_NONE, 300);
-        #flag = CVSpilsSetGSType(self.cvode_mem, 1);
+    def reinit(self, double t0, np_c.ndarray[double, ndim=1, mode="c"] y):
+        """
+        Restart the integration at time t0 from the local state y.
+
+        """
+        self.y_np[:] = y
+        flag = CVodeReInit(self.cvode_mem, t0, self.y_nv)
+        self.check_flag(flag, "CVodeReInit")
+        self.cur_t = t0
 
     #def set_initial_value(self,np.ndarray[double, ndim=1, mode="c"] spin, t):
     #    self.t = t
@@ -168,6 +246,25 @@ cdef class CvodeSolver(object):
         CVodeGetCurrentStep(self.cvode_mem, &step)
         return step
 
+    def get_current_time(self):
+        cdef double t
+        CVodeGetCurrentTime(self.cvode_mem, &t)
+        return t
+
+    def get_integrator_stats(self):
+        """
+        Same as cvode.get_integrator_stats() of the serial integrator.
+
+        """
+        cdef long int nsteps, nfevals, nlinsetups, netfails
+        cdef int qlast, qcur
+        cdef double hinused, hlast, hcur, tcur
+        flag = CVodeGetIntegratorStats(self.cvode_mem, &nsteps, &nfevals, &nlinsetups,
+                                       &netfails, &qlast, &qcur, &hinused, &hlast,
+                                       &hcur, &tcur)
+        self.check_flag(flag, "CVodeGetIntegratorStats")
+        return nsteps, nfevals, nlinsetups, netfails, qlast, qcur, hinused, hlast, hcur, tcur
+
     def __repr__(self):
         s = []
         s.append("nsteps = %d,"      % self.nsteps)
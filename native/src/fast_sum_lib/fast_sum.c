@@ -4,6 +4,9 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <math.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 static const double dunavant_x[4][6] = {
     {0.333333333333333, 0, 0, 0, 0, 0},
@@ -572,6 +575,7 @@ void create_tree(fastsum_plan *plan, struct octree_node *tree, int begin, int en
     tree->num_particle = end - begin;
 
     plan->tree->have_moment = 0;
+    tree->moment = NULL;
 
     tree->rx = (bnd[1] - bnd[0]) / 2.0;
     tree->ry = (bnd[3] - bnd[2]) / 2.0;
@@ -632,17 +636,29 @@ void free_tree(fastsum_plan *plan, struct octree_node *tree) {
     if (tree == NULL) {
         return;
     }
-    if (tree->num_children > 0) {
-        for (i = 0; i < tree->num_children; i++) {
-            free_tree(plan, tree->children[i]);
-        }
-    } else {
-        if (tree->have_moment) {
-            free_3d_double(tree->moment, plan->p + 1);
-        }
-        free(tree);
+    for (i = 0; i < tree->num_children; i++) {
+        free_tree(plan, tree->children[i]);
+    }
+    if (tree->have_moment) {
+        free_3d_double(tree->moment, plan->p + 1);
+    }
+    free(tree);
+
+}
+
+int collect_nodes(struct octree_node *tree, struct octree_node **nodes, int n) {
+    int i;
+
+    if (nodes != NULL) {
+        nodes[n] = tree;
     }
+    n++;
 
+    for (i = 0; i < tree->num_children; i++) {
+        n = collect_nodes(tree->children[i], nodes, n);
+    }
+
+    return n;
 }
 
 void build_tree(fastsum_plan *plan) {
@@ -664,6 +680,11 @@ void build_tree(fastsum_plan *plan) {
     //printf("start to build tree  %d\n", plan->N_source);
     create_tree(plan, plan->tree, 0, plan->N_source, bnd);
 
+    free(plan->nodes);
+    plan->num_nodes = collect_nodes(plan->tree, NULL, 0);
+    plan->nodes = malloc(plan->num_nodes * sizeof (struct octree_node *));
+    collect_nodes(plan->tree, plan->nodes, 0);
+
     //printf("build tree okay\n");
 
 }
@@ -672,8 +693,8 @@ void compute_Taylor(double ***a, double dx, double dy, double dz, int p) {
     int i, j, k;
     double R, r, r3, r5;
 
-    double *cf = (double *) malloc((p + 1) * sizeof (double));
-    double *cf2 = (double *) malloc((p + 1) * sizeof (double));
+    // on the stack, as this is called concurrently by several threads
+    double cf[p + 1], cf2[p + 1];
 
     double ddx = 2 * dx;
     double ddy = 2 * dy;
@@ -775,9 +796,6 @@ void compute_Taylor(double ***a, double dx, double dy, double dz, int p) {
         }
     }
 
-    free(cf);
-    free(cf2);
-
     return;
 }
 
@@ -833,20 +851,8 @@ double compute_potential_single_target(fastsum_plan *plan, struct octree_node *t
 
 
     if (plan->mac_square * R > tree->radius_square) {
-        if (!tree->have_moment) {
-            tree->moment = alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);
-            tree->have_moment = 1;
-            tree->need_upadte_moment = 1;
-        }
-
-
-        if (tree->need_upadte_moment) {
-            compute_moment(plan, tree, tree->moment, tree->x, tree->y, tree->z);
-            tree->need_upadte_moment = 0;
-            //printf("index=%d  xyz= %g %g  %g\n", index, plan->x_t[3 * index], plan->x_t[3 * index + 1], plan->x_t[3 * index + 2]);
-            //printf("R=%g   begin=%d  end=%d  xyz=%g  %g  %g\n", R, tree->begin, tree->end, tree->x, tree->y, tree->z);
-        }
 
+        // the moments have been computed by compute_moments
 
         dx = plan->x_t[3 * index] - tree->x;
         dy = plan->x_t[3 * index + 1] - tree->y;
@@ -903,6 +909,8 @@ fastsum_plan *create_plan() {
 
     fastsum_plan *str = (fastsum_plan*) malloc(sizeof (fastsum_plan));
     str->tree = NULL;
+    str->nodes = NULL;
+    str->num_nodes = 0;
 
     return str;
 }
@@ -1211,6 +1219,7 @@ void fastsum_exact(fastsum_plan *plan, double *phi) {
     int i, j, k;
     double r;
 
+    #pragma omp parallel for private(i, k, r)
     for (j = 0; j < plan->N_target; j++) {
         phi[j] = 0;
         for (k = 0; k < plan->N_source; k++) {
@@ -1225,22 +1234,64 @@ void fastsum_exact(fastsum_plan *plan, double *phi) {
     }
 }
 
+/*
+ * Compute the moments of all nodes for the current charge density, the
+ * nodes in parallel, so that the parallel loop over the targets in fastsum
+ * only reads the tree.
+ */
+void compute_moments(fastsum_plan *plan) {
+    int i;
+    struct octree_node *node;
+
+    // the storage is only allocated once and reused
+    for (i = 0; i < plan->num_nodes; i++) {
+        node = plan->nodes[i];
+        if (!node->have_moment) {
+            node->moment = alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);
+            node->have_moment = 1;
+        }
+    }
+
+    #pragma omp parallel for private(node) schedule(dynamic)
+    for (i = 0; i < plan->num_nodes; i++) {
+        node = plan->nodes[i];
+        compute_moment(plan, node, node->moment, node->x, node->y, node->z);
+        node->need_upadte_moment = 0;
+    }
+}
+
 void fastsum(fastsum_plan *plan, double *phi) {
-    int j = 0;
 
-    double ***a;
-    //#pragma omp parallel private(a)
+    compute_moments(plan);
+
+    #pragma omp parallel
     {
-        a=alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);  
-	//#pragma omp for
+        int j;
+        // thread-private buffer for the Taylor coefficients
+        double ***a = alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);
+
+        #pragma omp for schedule(dynamic, 16)
         for (j = 0; j < plan->N_target; j++) {
             phi[j] = compute_potential_single_target(plan, plan->tree, j, a);
         }
+
         free_3d_double(a, plan->p + 1);
     }
 
+}
 
+void set_num_threads(int n) {
+#ifdef _OPENMP
+    omp_set_num_threads(n);
+#endif
+}
 
+int get_max_threads(void) {
+#ifdef _OPENMP
+    return omp_get_max_threads();
+#else
+    return 1;
+#endif
 }
 
 void fastsum_finalize(fastsum_plan *plan) {
@@ -1259,6 +1310,7 @@ void fastsum_finalize(fastsum_plan *plan) {
     free(plan->x_s);
     free(plan->x_s_bak);
     free(plan->x_t);
+    free(plan->nodes);
 
     free(plan);
 
@@ -1331,6 +1383,7 @@ int main(void) {
         plan->p=p;
         build_tree(plan);
         a = alloc_3d_double(p + 1, p + 1, p + 1);
+        compute_moments(plan);
         res=compute_potential_single_target(plan, plan->tree, 0, a);
         printf("p=%d    %0.15f   rel_error=%e\n",p,res,(exact[0]-res)/exact[0]);
     }
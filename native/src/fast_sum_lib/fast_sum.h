@@ -58,6 +58,9 @@ typedef struct {
     int p;
     double mac_square;
     int num_limit;
+
+    struct octree_node **nodes; // all nodes of the tree, to loop over them in parallel
+    int num_nodes;
     
 } fastsum_plan;
 
@@ -74,6 +77,10 @@ void init_fastsum(fastsum_plan *plan, int N_target, int triangle_p,
 
 void compute_correction(fastsum_plan *plan, double *m, double *phi);
 void compute_source_nodes_weights(fastsum_plan *plan);
+void compute_moments(fastsum_plan *plan);
+
+void set_num_threads(int n);
+int get_max_threads(void);
 
 #endif	/* FAST_SUM_H */
 
@@ -12,8 +12,8 @@ cdef extern from "fast_sum.h":
         int *triangle_nodes, int *tetrahedron_nodes)
     void fastsum_finalize(fastsum_plan *plan)
     void update_charge_density(fastsum_plan *plan,double *m)
-    void fastsum_exact(fastsum_plan *plan, double *phi)
-    void fastsum(fastsum_plan *plan, double *phi)
+    void fastsum_exact(fastsum_plan *plan, double *phi) nogil
+    void fastsum(fastsum_plan *plan, double *phi) nogil
     void init_fastsum(fastsum_plan *plan, int N_target, int triangle_p,\
         int tetrahedron_p, int triangle_num, int tetrahedron_num, int p, double mac, int num_limit)
 
@@ -21,6 +21,9 @@ cdef extern from "fast_sum.h":
     void compute_correction(fastsum_plan *plan, double *m, double *phi)
     void compute_source_nodes_weights(fastsum_plan *plan) 
 
+    void set_num_threads(int n)
+    int get_max_threads()
+
 	
 
 cdef class FastSum:
@@ -67,10 +70,17 @@ cdef class FastSum:
         #print 'update charge ok'
 
     def exactsum(self,np.ndarray[double, ndim=1, mode="c"] phi):
-        fastsum_exact(self._c_plan,&phi[0])
+        cdef double *phi_ptr = &phi[0]
+        cdef fastsum_plan *plan = self._c_plan
+        with nogil:
+            fastsum_exact(plan, phi_ptr)
         
     def fastsum(self,np.ndarray[double, ndim=1, mode="c"] phi):
-        fastsum(self._c_plan,&phi[0])
+        cdef double *phi_ptr = &phi[0]
+        cdef fastsum_plan *plan = self._c_plan
+        # the evaluation is parallelised with OpenMP and doesn't need the GIL
+        with nogil:
+            fastsum(plan, phi_ptr)
 
     def compute_correction(self,np.ndarray[double, ndim=1, mode="c"] m,np.ndarray[double, ndim=1, mode="c"] phi):
         compute_correction(self._c_plan,&m[0],&phi[0])
@@ -79,4 +89,16 @@ cdef class FastSum:
         if self._c_plan is not NULL:
             fastsum_finalize(self._c_plan)
             self._c_plan=NULL
-        
\ No newline at end of file
+
+
+def set_openmp_threads(n):
+    """
+    Set the number of OpenMP threads used by the treecode (the default is
+    given by the environment variable OMP_NUM_THREADS).
+
+    """
+    set_num_threads(n)
+
+
+def get_openmp_threads():
+    return get_max_threads()
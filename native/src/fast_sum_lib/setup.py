@@ -13,8 +13,8 @@ ext_modules = [
               sources = ['fast_sum.c','fast_sum_lib.pyx'],
               include_dirs = [numpy.get_include()],
               libraries=['m'],
-              #extra_compile_args=["-fopenmp"],
-              #extra_link_args=["-g"],
+              extra_compile_args=["-fopenmp"],
+              extra_link_args=["-fopenmp"],
         )
     ]
 
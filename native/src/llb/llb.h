@@ -20,6 +20,8 @@ namespace finmag { namespace llb {
 
     void register_sllg_stt();
 
+    void register_sllg_ensemble();
+
     void register_random();
 
 }}
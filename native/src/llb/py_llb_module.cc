@@ -24,6 +24,7 @@ BOOST_PYTHON_MODULE(llb)
     finmag::llb::register_llb_material();
     finmag::llb::register_sllg();
     finmag::llb::register_sllg_stt();
+    finmag::llb::register_sllg_ensemble();
     finmag::llb::register_random();
 
 }
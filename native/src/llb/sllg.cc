@@ -1,5 +1,8 @@
 #include "finmag_includes.h"
 
+#include <vector>
+#include <algorithm>
+
 #include "util/np_array.h"
 
 #include "mt19937.h"
@@ -26,12 +29,24 @@ namespace finmag { namespace llb {
         	RandomMT19937 mt_random;
         	bool check_magnetisation_length;
 
+        	// adaptive time stepping (method "Heun_adaptive")
+        	bool adaptive;
+        	double tol, dt_min, dt_max, t, h_next, h_last;
+        	long n_steps, n_fevals, n_rejected;
+        	double *m_old, *h_old;
+        	// Wiener increments which have been drawn but not used yet, the
+        	// next one is at the back
+        	std::vector<double> stack_h;
+        	std::vector<std::vector<double> > stack_W;
+
         	void (StochasticSLLGIntegrator::*run_step_fun)(const np_array<double> &H);
 
         	void calc_llg_adt_bdw(double *m,double *h,double *dm);
         	void run_step_rk2(const np_array<double> &H);
         	void run_step_rk3(const np_array<double> &H);
         	void check_normalise();
+        	double run_step_heun_embedded(const np_array<double> &H, double h, const std::vector<double> &W, bool field_is_current);
+        	void split_top_increment(double s);
 
     	public:
         	StochasticSLLGIntegrator(
@@ -48,6 +63,11 @@ namespace finmag { namespace llb {
 
         	void set_parameters(double dt,double gamma,unsigned int seed, bool checking);
         	void run_step(const np_array<double> &H);
+        	void run_steps(const np_array<double> &H, int n);
+        	void set_adaptive_parameters(double tol, double dt_min, double dt_max);
+        	void advance_adaptive(const np_array<double> &H, double t0, double t1);
+        	double get_time() { return t; }
+        	bp::tuple get_stats();
     };
 
 
@@ -61,12 +81,22 @@ namespace finmag { namespace llb {
     		delete[] dm2;
     	}
 
-    	//delete[] dm3;
+    	if (dm3!=0){
+    		delete[] dm3;
+    	}
 
     	if (eta!=0){
     	    delete[] eta;
     	}
 
+    	if (m_old!=0){
+    		delete[] m_old;
+    	}
+
+    	if (h_old!=0){
+    		delete[] h_old;
+    	}
+
     }
 
 
@@ -86,7 +116,12 @@ namespace finmag { namespace llb {
     							T_arr(T),
     							V_arr(V),
     							alpha_arr(alpha),
-    							rhs_func(_rhs_func){
+    							dm1(0), dm2(0), dm3(0), eta(0),
+    							rhs_func(_rhs_func),
+    							adaptive(false),
+    							tol(1e-4), dt_min(1e-17), dt_max(1e-11), t(0), h_next(0), h_last(0),
+    							n_steps(0), n_fevals(0), n_rejected(0),
+    							m_old(0), h_old(0){
 
         							assert(M.size()==3*T.size());
         							assert(M_pred.size()==M.size());
@@ -118,8 +153,17 @@ namespace finmag { namespace llb {
         							}else if(method_name=="RK3"){
         								run_step_fun=&StochasticSLLGIntegrator::run_step_rk3;
         								dm3= new double[length];
+        							}else if(method_name=="Heun_adaptive"){
+        								// run_step performs fixed Heun steps
+        								run_step_fun=&StochasticSLLGIntegrator::run_step_rk2;
+        								theta=1.0;
+        								theta1=0.5;
+        								theta2=0.5;
+        								adaptive=true;
+        								m_old= new double[length];
+        								h_old= new double[length];
         							}else{
-        								throw std::invalid_argument("StochasticSLLGIntegrator:Only RK2a, RK2b, RK2c and RK3 are implemented!");
+        								throw std::invalid_argument("StochasticSLLGIntegrator:Only RK2a, RK2b, RK2c, RK3 and Heun_adaptive are implemented!");
         							}
 
 
@@ -132,6 +176,16 @@ namespace finmag { namespace llb {
 
     }
 
+    // Performs n steps without returning to Python in between (apart from
+    // the calls of rhs_func to update the field H).
+    void StochasticSLLGIntegrator::run_steps(const np_array<double> &H, int n) {
+
+    	for (int i = 0; i < n; i++) {
+    		(this->*run_step_fun)(H);
+    	}
+
+    }
+
     void StochasticSLLGIntegrator::check_normalise(){
     	double *m = M.data();
     	int len=length/3;
@@ -192,6 +246,10 @@ namespace finmag { namespace llb {
 
     		check_normalise();
 
+    		n_steps++;
+    		n_fevals += 2;
+    		h_last = dt;
+
     }
 
     void StochasticSLLGIntegrator::run_step_rk3(const np_array<double> &H) {
@@ -222,6 +280,10 @@ namespace finmag { namespace llb {
 
     		check_normalise();
 
+    		n_steps++;
+    		n_fevals += 3;
+    		h_last = dt;
+
     }
 
     void StochasticSLLGIntegrator::set_parameters(double dt,double gamma,unsigned int seed,bool checking){
@@ -233,6 +295,167 @@ namespace finmag { namespace llb {
     	this->seed=seed;
     	this->check_magnetisation_length=checking;
     	mt_random.initial_random(seed);
+    	this->h_next=dt;
+    	stack_h.clear();
+    	stack_W.clear();
+    }
+
+    void StochasticSLLGIntegrator::set_adaptive_parameters(double tol, double dt_min, double dt_max){
+    	if (tol<=0 || dt_min<=0 || dt_max<dt_min)
+    		throw std::invalid_argument("StochasticSLLGIntegrator::set_adaptive_parameters: expected tol>0 and 0<dt_min<=dt_max");
+    	this->tol=tol;
+    	this->dt_min=dt_min;
+    	this->dt_max=dt_max;
+    	h_next=std::min(std::max(h_next, dt_min), dt_max);
+    }
+
+    bp::tuple StochasticSLLGIntegrator::get_stats(){
+    	return bp::make_tuple(n_steps, n_fevals, n_rejected, h_last, h_next);
+    }
+
+    /*
+     * Replaces the Wiener increment W over the interval h at the back of the
+     * stack by its two parts over s*h and (1-s)*h, the first of which is
+     * sampled from the Brownian bridge conditioned on the total increment W.
+     * So refining a rejected step doesn't change the path of the noise.
+     */
+    void StochasticSLLGIntegrator::split_top_increment(double s){
+    	double h = stack_h.back();
+    	std::vector<double> &W = stack_W.back();
+    	std::vector<double> W1(length);
+
+    	mt_random.gaussian_random_vec(&W1[0], length, sqrt(s*(1-s)*h));
+    	for (int i = 0; i < length; i++){
+    		W1[i] += s*W[i];
+    		W[i] -= W1[i];
+    	}
+
+    	stack_h.back() = (1-s)*h;
+    	stack_h.push_back(s*h);
+    	stack_W.push_back(W1);
+    }
+
+    /*
+     * One step of the Heun scheme (RK2a) of size h with the Wiener increment
+     * W. Returns the maximum difference between the Heun and the embedded
+     * Euler-Maruyama update, which is used as the local error estimate.
+     * M is saved to m_old (and the field at M to h_old) before the step, so
+     * a rejected step can be undone without evaluating the field again.
+     */
+    double StochasticSLLGIntegrator::run_step_heun_embedded(const np_array<double> &H, double h,
+    		const std::vector<double> &W, bool field_is_current) {
+
+    		double *hf = H.data();
+    		double *m = M.data();
+    		double *m_pred=M_pred.data();
+
+    		if (field_is_current){
+    			std::copy(h_old, h_old+length, hf);
+    		}else{
+    			bp::call<void>(rhs_func.ptr(),M);
+    			n_fevals++;
+    			std::copy(hf, hf+length, h_old);
+    		}
+    		std::copy(m, m+length, m_old);
+
+    		dt = h;
+    		std::copy(W.begin(), W.end(), eta);
+    		calc_llg_adt_bdw(m,hf,dm1);
+
+    		for (int i = 0; i < length; i++){
+    			m_pred[i] = m[i] + dm1[i];
+    		}
+
+    		bp::call<void>(rhs_func.ptr(),M_pred);
+    		n_fevals++;
+
+    		calc_llg_adt_bdw(m_pred,hf,dm2);
+
+    		double err = 0;
+    		for (int i = 0; i < length; i++){
+    			m[i] += 0.5*(dm1[i] + dm2[i]);
+    			double e = 0.5*fabs(dm2[i] - dm1[i]);
+    			if (e > err){
+    				err = e;
+    			}
+    		}
+
+    		return err;
+    }
+
+    /*
+     * Integrates from t0 to t1 (in seconds) with the Heun scheme, choosing
+     * the step size such that the local error estimate stays below tol.
+     * A rejected step is repeated as two half steps whose Wiener increments
+     * are sampled from the Brownian bridge, so the accepted steps are a
+     * refinement of the same realisation of the noise.
+     */
+    void StochasticSLLGIntegrator::advance_adaptive(const np_array<double> &H, double t0, double t1) {
+
+    	if (!adaptive)
+    		throw std::invalid_argument("StochasticSLLGIntegrator::advance_adaptive: only available for the method Heun_adaptive");
+
+    	double *m = M.data();
+    	double dt_fixed = dt;
+    	bool field_is_current = false;
+
+    	t = t0;
+    	while (t < t1) {
+    		if (t1 - t < 1e-3*dt_min){
+    			t = t1;
+    			break;
+    		}
+
+    		if (stack_h.empty()){
+    			stack_h.push_back(h_next);
+    			stack_W.push_back(std::vector<double>(length));
+    			mt_random.gaussian_random_vec(&stack_W.back()[0], length, sqrt(h_next));
+    		}
+
+    		// don't step beyond t1, the rest of the increment is kept for later
+    		bool last_step = false;
+    		if (stack_h.back() >= t1 - t){
+    			if (stack_h.back() > t1 - t){
+    				split_top_increment((t1 - t)/stack_h.back());
+    			}
+    			last_step = true;
+    		}
+
+    		double h = stack_h.back();
+    		std::vector<double> W;
+    		W.swap(stack_W.back());
+    		stack_h.pop_back();
+    		stack_W.pop_back();
+
+    		double err = run_step_heun_embedded(H, h, W, field_is_current);
+
+    		if (err > tol && h > dt_min){
+    			std::copy(m_old, m_old+length, m);
+    			field_is_current = true;
+    			n_rejected++;
+
+    			stack_h.push_back(h);
+    			stack_W.push_back(std::vector<double>());
+    			stack_W.back().swap(W);
+    			split_top_increment(0.5);
+    			h_next = std::max(0.5*h, dt_min);
+    			continue;
+    		}
+
+    		check_normalise();
+    		field_is_current = false;
+    		n_steps++;
+    		h_last = h;
+    		t = last_step ? t1 : t + h;
+
+    		if (!last_step && stack_h.empty()){
+    			double fac = err > 0 ? 0.9*sqrt(tol/err) : 5.0;
+    			fac = std::min(std::max(fac, 0.2), 5.0);
+    			h_next = std::min(std::max(fac*h, dt_min), dt_max);
+    		}
+    	}
+
+    	dt = dt_fixed;
     }
 
 
@@ -286,7 +509,12 @@ namespace finmag { namespace llb {
     			    bp::object,
     			    std::string>())
     	        	.def("run_step", &StochasticSLLGIntegrator::run_step)
-    	        	.def("set_parameters", &StochasticSLLGIntegrator::set_parameters);
+    	        	.def("run_steps", &StochasticSLLGIntegrator::run_steps)
+    	        	.def("set_parameters", &StochasticSLLGIntegrator::set_parameters)
+    	        	.def("set_adaptive_parameters", &StochasticSLLGIntegrator::set_adaptive_parameters)
+    	        	.def("advance_adaptive", &StochasticSLLGIntegrator::advance_adaptive)
+    	        	.def("get_time", &StochasticSLLGIntegrator::get_time)
+    	        	.def("get_stats", &StochasticSLLGIntegrator::get_stats);
     }
 
 
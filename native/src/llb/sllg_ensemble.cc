@@ -0,0 +1,337 @@
+#include "finmag_includes.h"
+
+#include <vector>
+#include <algorithm>
+
+#include "util/np_array.h"
+
+#include "mt19937.h"
+
+#include "llb.h"
+
+#include "util/python_threading.h"
+
+namespace finmag { namespace llb {
+
+    /*
+     * Same time stepping as StochasticSLLGIntegrator, but for a block of
+     * n_replicas independent thermal realisations of the same system,
+     * stored in the rows of M (shape (n_replicas, 3N)). Each replica draws
+     * its thermal field from its own Mersenne-Twister stream, and the
+     * effective field of all replicas is computed by a single call of
+     * rhs_func with the whole block per stage.
+     */
+    class StochasticSLLGEnsembleIntegrator {
+
+        double theta;
+        double theta1;
+        double theta2;
+
+    	private:
+        	int n_replicas;
+        	int length;
+        	int size;
+        	np_array<double> M,M_pred,Ms_arr,T_arr,V_arr,alpha_arr;
+        	double dt,gamma,Q;
+        	double *dm1, *dm2, *dm3, *eta;
+        	bp::object rhs_func;
+        	std::vector<RandomMT19937> mt_random;
+        	bool check_magnetisation_length;
+
+        	void (StochasticSLLGEnsembleIntegrator::*run_step_fun)(const np_array<double> &H);
+
+        	void calc_llg_adt_bdw(double *m,double *h,double *dm);
+        	void gaussian_random_vec();
+        	void run_step_rk2(const np_array<double> &H);
+        	void run_step_rk3(const np_array<double> &H);
+        	void check_normalise();
+
+    	public:
+        	StochasticSLLGEnsembleIntegrator(
+        			const np_array<double> &M,
+        			const np_array<double> &M_pred,
+        			const np_array<double> &Ms,
+        			const np_array<double> &T,
+        			const np_array<double> &V,
+					const np_array<double> &alpha,
+					const bp::object _rhs_func,
+					const std::string method_name);
+
+        	~StochasticSLLGEnsembleIntegrator();
+
+        	void set_parameters(double dt,double gamma,const np_array<long> &seeds, bool checking);
+        	void run_step(const np_array<double> &H);
+    };
+
+
+    StochasticSLLGEnsembleIntegrator::~StochasticSLLGEnsembleIntegrator(){
+
+    	if (dm1!=0){
+    		delete[] dm1;
+    	}
+
+    	if (dm2!=0){
+    		delete[] dm2;
+    	}
+
+    	if (dm3!=0){
+    		delete[] dm3;
+    	}
+
+    	if (eta!=0){
+    	    delete[] eta;
+    	}
+
+    }
+
+
+
+    StochasticSLLGEnsembleIntegrator::StochasticSLLGEnsembleIntegrator(
+    							const np_array<double> &M,
+    							const np_array<double> &M_pred,
+    							const np_array<double> &Ms,
+    							const np_array<double> &T,
+    							const np_array<double> &V,
+    							const np_array<double> &alpha,
+    					        bp::object _rhs_func,
+    							std::string method_name):
+    							M(M),
+    							M_pred(M_pred),
+    							Ms_arr(Ms),
+    							T_arr(T),
+    							V_arr(V),
+    							alpha_arr(alpha),
+    							dm1(0), dm2(0), dm3(0), eta(0),
+    							rhs_func(_rhs_func){
+
+        							length=3*T.size();
+        							size=M.size();
+        							n_replicas=size/length;
+
+        							M.check_shape(n_replicas, length, "StochasticSLLGEnsembleIntegrator: M");
+        							M_pred.check_shape(n_replicas, length, "StochasticSLLGEnsembleIntegrator: M_pred");
+
+        							mt_random.resize(n_replicas);
+
+        							dm1= new double[size];
+        							dm2= new double[size];
+        							eta= new double[size];
+
+        							if (_rhs_func.is_none())
+        								throw std::invalid_argument("StochasticSLLGEnsembleIntegrator: _rhs_func is None");
+
+        							if (method_name=="RK2a"){
+        								run_step_fun=&StochasticSLLGEnsembleIntegrator::run_step_rk2;
+        								theta=1.0;
+        						        theta1=0.5;
+        						        theta2=0.5;
+        							}else if(method_name=="RK2b"){
+        								run_step_fun=&StochasticSLLGEnsembleIntegrator::run_step_rk2;
+        								theta=2.0/3.0;
+        								theta1=0.25;
+        								theta2=0.75;
+        							}else if(method_name=="RK2c"){
+        								run_step_fun=&StochasticSLLGEnsembleIntegrator::run_step_rk2;
+        								theta=0.5;
+        								theta1=0;
+        								theta2=1.0;
+        							}else if(method_name=="RK3"){
+        								run_step_fun=&StochasticSLLGEnsembleIntegrator::run_step_rk3;
+        								dm3= new double[size];
+        							}else{
+        								throw std::invalid_argument("StochasticSLLGEnsembleIntegrator:Only RK2a, RK2b, RK2c and RK3 are implemented!");
+        							}
+
+
+        }
+
+
+    void StochasticSLLGEnsembleIntegrator::run_step(const np_array<double> &H) {
+
+    	H.check_shape(n_replicas, length, "StochasticSLLGEnsembleIntegrator::run_step: H");
+
+    	(this->*run_step_fun)(H);
+
+    }
+
+    void StochasticSLLGEnsembleIntegrator::gaussian_random_vec() {
+
+    	finmag::util::scoped_gil_release release_gil;
+
+    	// Each replica uses its own stream, so the result doesn't depend on
+    	// the number of threads.
+		#pragma omp parallel for
+    	for (int r = 0; r < n_replicas; r++) {
+    		mt_random[r].gaussian_random_vec(eta + r*length, length, sqrt(dt));
+    	}
+
+    }
+
+    void StochasticSLLGEnsembleIntegrator::check_normalise(){
+    	double *m = M.data();
+    	int len=length/3;
+
+    	std::vector<double> max_m_replica(n_replicas, 0.0);
+
+		#pragma omp parallel for
+    	for (int r = 0; r < n_replicas; r++) {
+    		double *m_r = m + r*length;
+    		for (int i = 0; i < len; i++) {
+    			int j = i + len;
+    			int k = j + len;
+    			double mm = sqrt(m_r[i] * m_r[i] + m_r[j] * m_r[j] + m_r[k] * m_r[k]);
+    			if (mm>max_m_replica[r]){
+    				max_m_replica[r]=mm;
+    			}
+
+    			mm=1.0/mm;
+    			m_r[i] *= mm;
+    			m_r[j] *= mm;
+    			m_r[k] *= mm;
+    		}
+    	}
+
+    	double max_m = *std::max_element(max_m_replica.begin(), max_m_replica.end());
+
+    	if (check_magnetisation_length){
+
+    		if (max_m>1.05 || max_m<0.95){
+    			std::ostringstream ostr;
+    			ostr << "maxm=" << max_m <<", so dt="<< dt << " is probably too large!";
+    			throw std::invalid_argument(ostr.str());
+    		}
+    	}
+
+
+    }
+
+    void StochasticSLLGEnsembleIntegrator::run_step_rk2(const np_array<double> &H) {
+
+    		double *h = H.data();
+    		double *m = M.data();
+    		double *m_pred=M_pred.data();
+
+    		bp::call<void>(rhs_func.ptr(),M);
+
+    		gaussian_random_vec();
+    		calc_llg_adt_bdw(m,h,dm1);
+
+    		for (int i = 0; i < size; i++){
+    			m_pred[i] = m[i] + theta*dm1[i];
+    		}
+
+    		bp::call<void>(rhs_func.ptr(),M_pred);
+
+    		calc_llg_adt_bdw(m_pred,h,dm2);
+
+    		for (int i = 0; i < size; i++){
+    			m[i] += theta1*dm1[i] + theta2*dm2[i];
+    		}
+
+    		check_normalise();
+
+    }
+
+    void StochasticSLLGEnsembleIntegrator::run_step_rk3(const np_array<double> &H) {
+    		double *h = H.data();
+    		double *m = M.data();
+    		double *m_pred=M_pred.data();
+    		double two_three=2.0/3.0;
+
+    		gaussian_random_vec();
+
+    		bp::call<void>(rhs_func.ptr(),M);
+    		calc_llg_adt_bdw(m,h,dm1);
+    		for (int i = 0; i < size; i++){
+    			m_pred[i] = m[i] + two_three*dm1[i];
+    		}
+
+    		bp::call<void>(rhs_func.ptr(),M_pred);
+    		calc_llg_adt_bdw(m_pred,h,dm2);
+    		for (int i = 0; i < size; i++){
+    			m_pred[i] = m[i] - dm1[i]+ dm2[i];
+    		}
+
+    		bp::call<void>(rhs_func.ptr(),M_pred);
+    		calc_llg_adt_bdw(m_pred,h,dm3);
+    		for (int i = 0; i < size; i++){
+    			m[i] += 0.75*dm2[i] + 0.25*dm3[i];
+    		}
+
+    		check_normalise();
+
+    }
+
+    void StochasticSLLGEnsembleIntegrator::set_parameters(double dt,double gamma,const np_array<long> &seeds,bool checking){
+    	double k_B = 1.3806505e-23;
+    	double mu_0 = 4 * M_PI * 1e-7;
+    	seeds.check_shape(n_replicas, "StochasticSLLGEnsembleIntegrator::set_parameters: seeds");
+    	this->dt=dt;
+    	this->gamma=gamma;
+    	this->Q = k_B / (gamma * mu_0);
+    	this->check_magnetisation_length=checking;
+    	long *s = seeds.data();
+    	for (int r = 0; r < n_replicas; r++) {
+    		mt_random[r].initial_random((unsigned int) s[r]);
+    	}
+    }
+
+
+    void StochasticSLLGEnsembleIntegrator::calc_llg_adt_bdw(double *m,double *h,double *dm){
+
+    	double *T = T_arr.data();
+        double *V = V_arr.data();
+        double *Ms = Ms_arr.data();
+        double *alpha=alpha_arr.data();
+        int len=length/3;
+
+        finmag::util::scoped_gil_release release_gil;
+
+		#pragma omp parallel for
+    	for (int n = 0; n < n_replicas*len; n++) {
+    		// node p of replica n / len
+    		int p = n % len;
+    		int i = (n / len)*length + p;
+    		int j = i + len;
+    		int k = j + len;
+
+    		double alpha_inv= 1.0/ (1.0 + alpha[p] * alpha[p]);
+    		double coeff = -gamma*alpha_inv ;
+    		double q = sqrt(2 * Q * alpha[p] *alpha_inv * T[p] / (Ms[p]* V[p]));
+
+    		double mth0 = coeff * (m[j] * h[k] - m[k] * h[j]) * dt;
+    		double mth1 = coeff * (m[k] * h[i] - m[i] * h[k]) * dt;
+    		double mth2 = coeff * (m[i] * h[j] - m[j] * h[i]) * dt;
+
+    		mth0 += coeff * (m[j] * eta[k] - m[k] * eta[j]) * q;
+    		mth1 += coeff * (m[k] * eta[i] - m[i] * eta[k]) * q;
+    		mth2 += coeff * (m[i] * eta[j] - m[j] * eta[i]) * q;
+
+    		dm[i] = mth0 + alpha[p] * (m[j] * mth2 - m[k] * mth1);
+    		dm[j] = mth1 + alpha[p] * (m[k] * mth0 - m[i] * mth2);
+    		dm[k] = mth2 + alpha[p] * (m[i] * mth1 - m[j] * mth0);
+
+    	}
+
+    }
+
+
+
+    void register_sllg_ensemble() {
+    	using namespace bp;
+
+    	class_<StochasticSLLGEnsembleIntegrator>("StochasticSLLGEnsembleIntegrator", init<
+    			 	np_array<double>,
+    			 	np_array<double>,
+    			    np_array<double>,
+    			    np_array<double>,
+    			    np_array<double>,
+    			    np_array<double>,
+    			    bp::object,
+    			    std::string>())
+    	        	.def("run_step", &StochasticSLLGEnsembleIntegrator::run_step)
+    	        	.def("set_parameters", &StochasticSLLGEnsembleIntegrator::set_parameters);
+    }
+
+
+}}
@@ -113,7 +113,7 @@ namespace finmag { namespace llg {
 
                     		hx[i] += K2[i]*(t1*u1_x+t2*u2_x+t3*u3_x);
                     		hy[i] += K2[i]*(t1*u1_y+t2*u2_y+t3*u3_y);
-                    		hz[i] += K2[2]*(t1*u1_z+t2*u2_z+t3*u3_z);
+                    		hz[i] += K2[i]*(t1*u1_z+t2*u2_z+t3*u3_z);
                     	}
 
                     	if (K3[i]!=0){
@@ -142,6 +142,150 @@ namespace finmag { namespace llg {
 
     	}
 
+
+    	/*
+    	 * Directional derivative Hp = dH(m + a mp)/da at a = 0 of the
+    	 * uniaxial anisotropy field computed by compute_anisotropy_field,
+    	 * as needed for the Jacobian-times-vector product of the LLG.
+    	 */
+    	void compute_anisotropy_jtimes(const np_array<double> &m,
+    	    						const np_array<double> &mp,
+    	    						const np_array<double> &Ms_arr,
+    	            				const np_array<double> &Hp,
+    	            				const np_array<double> &u,
+    	            				const np_array<double> &K1_arr,
+    	            				const np_array<double> &K2_arr){
+
+    	                    m.check_ndim(2, "compute_anisotropy_jtimes: m");
+    	                    int const nodes = m.dim()[1];
+
+    	                    m.check_shape(3, nodes, "compute_anisotropy_jtimes: m");
+    	                    mp.check_shape(3, nodes, "compute_anisotropy_jtimes: mp");
+    	                    Hp.check_shape(3, nodes, "compute_anisotropy_jtimes: Hp");
+    	                    u.check_shape(3, nodes, "compute_anisotropy_jtimes: u");
+
+    	                    Ms_arr.check_shape(nodes, "compute_anisotropy_jtimes: Ms");
+
+    	                    double *mx = m(0), *my = m(1), *mz = m(2);
+    	                    double *mpx = mp(0), *mpy = mp(1), *mpz = mp(2);
+    	                    double *hx = Hp(0), *hy = Hp(1), *hz = Hp(2);
+    	                    double *ux = u(0), *uy = u(1), *uz = u(2);
+
+    	                    double *Ms = Ms_arr.data();
+    	                    double *K1 = K1_arr.data();
+    	                    double *K2 = K2_arr.data();
+
+    						#pragma omp parallel for schedule(guided)
+    	                    for (int i=0; i < nodes; i++) {
+
+    	                    	double u_m=mx[i]*ux[i]+my[i]*uy[i]+mz[i]*uz[i];
+    	                    	double u_mp=mpx[i]*ux[i]+mpy[i]*uy[i]+mpz[i]*uz[i];
+    	                    	double coeff=0;
+
+    	                    	// d/da [(K1 + 2 K2 (u.m)^2) (u.m)] = (K1 + 6 K2 (u.m)^2) (u.mp)
+    	                    	if (Ms[i]!=0){
+    	                    		coeff=2.0/(const_mu_0*Ms[i])*(K1[i]+6*K2[i]*u_m*u_m);
+    	                    	}
+
+    	                    	hx[i] = coeff*u_mp*ux[i];
+    	                    	hy[i] = coeff*u_mp*uy[i];
+    	                    	hz[i] = coeff*u_mp*uz[i];
+
+    	                    }
+    	}
+
+
+    	/*
+    	 * Directional derivative Hp = dH(m + a mp)/da at a = 0 of the cubic
+    	 * anisotropy field computed by compute_cubic_field. With a_k = u_k.m
+    	 * and the components b_k = u_k.mp of the direction, the derivatives
+    	 * of the terms t_k in compute_cubic_field are (for K1, K2, K3)
+    	 *
+    	 *   d[(a_j^2 + a_l^2) a_k]     = (a_j^2 + a_l^2) b_k + 2 a_k (a_j b_j + a_l b_l)
+    	 *   d[a_j^2 a_l^2 a_k]         = a_j^2 a_l^2 b_k + 2 a_j a_l a_k (a_l b_j + a_j b_l)
+    	 *   d[(a_j^4 + a_l^4) a_k^3]   = 3 (a_j^4 + a_l^4) a_k^2 b_k + 4 a_k^3 (a_j^3 b_j + a_l^3 b_l)
+    	 *
+    	 * where (k, j, l) runs over the cyclic permutations of (1, 2, 3).
+    	 */
+    	void compute_cubic_jtimes(const np_array<double> &m,
+    						const np_array<double> &mp,
+    						const np_array<double> &Ms_arr,
+            				const np_array<double> &Hp,
+            				const np_array<double> &uv,
+            				const np_array<double> &K1_arr,
+            				const np_array<double> &K2_arr,
+            				const np_array<double> &K3_arr){
+
+                    m.check_ndim(2, "compute_cubic_jtimes: m");
+                    int const nodes = m.dim()[1];
+
+                    m.check_shape(3, nodes, "compute_cubic_jtimes: m");
+                    mp.check_shape(3, nodes, "compute_cubic_jtimes: mp");
+                    Hp.check_shape(3, nodes, "compute_cubic_jtimes: Hp");
+
+                    Ms_arr.check_shape(nodes, "compute_cubic_jtimes: Ms");
+                    uv.check_shape(9, "compute_cubic_jtimes: uv");
+
+                    double *mx = m(0), *my = m(1), *mz = m(2);
+                    double *mpx = mp(0), *mpy = mp(1), *mpz = mp(2);
+                    double *hx = Hp(0), *hy = Hp(1), *hz = Hp(2);
+
+                    double u[3][3];
+                    for (int k=0; k < 3; k++) {
+                    	for (int c=0; c < 3; c++) {
+                    		u[k][c] = *uv[3*k+c];
+                    	}
+                    }
+
+                    double *Ms = Ms_arr.data();
+                    double *K1 = K1_arr.data();
+                    double *K2 = K2_arr.data();
+                    double *K3 = K3_arr.data();
+
+					#pragma omp parallel for schedule(guided)
+                    for (int i=0; i < nodes; i++) {
+                    	double a[3], b[3], dt[3];
+                    	for (int k=0; k < 3; k++) {
+                    		a[k]=mx[i]*u[k][0]+my[i]*u[k][1]+mz[i]*u[k][2];
+                    		b[k]=mpx[i]*u[k][0]+mpy[i]*u[k][1]+mpz[i]*u[k][2];
+                    	}
+
+                    	hx[i]=0;
+                    	hy[i]=0;
+                    	hz[i]=0;
+
+                    	if (Ms[i]==0){
+                    		continue;
+                    	}
+
+                    	for (int k=0; k < 3; k++) {
+                    		int j=(k+1)%3, l=(k+2)%3;
+                    		double aj_sq=a[j]*a[j], al_sq=a[l]*a[l], ak_sq=a[k]*a[k];
+                    		dt[k]=0;
+
+                    		if (K1[i]!=0){
+                    			dt[k] += K1[i]*((aj_sq+al_sq)*b[k]+2*a[k]*(a[j]*b[j]+a[l]*b[l]));
+                    		}
+
+                    		if (K2[i]!=0){
+                    			dt[k] += K2[i]*(aj_sq*al_sq*b[k]+2*a[j]*a[l]*a[k]*(a[l]*b[j]+a[j]*b[l]));
+                    		}
+
+                    		if (K3[i]!=0){
+                    			dt[k] += 2*K3[i]*(3*(aj_sq*aj_sq+al_sq*al_sq)*ak_sq*b[k]
+                    					+4*ak_sq*a[k]*(aj_sq*a[j]*b[j]+al_sq*a[l]*b[l]));
+                    		}
+                    	}
+
+                    	double coeff=-2.0/(const_mu_0*Ms[i]);
+                    	for (int k=0; k < 3; k++) {
+                    		hx[i] += coeff*dt[k]*u[k][0];
+                    		hy[i] += coeff*dt[k]*u[k][1];
+                    		hz[i] += coeff*dt[k]*u[k][2];
+                    	}
+                    }
+    	}
+
     }
 
     void register_energy() {
@@ -165,6 +309,27 @@ namespace finmag { namespace llg {
             arg("K1_arr"),
             arg("K2_arr")
         ));
+
+        def("compute_cubic_jtimes", &compute_cubic_jtimes, (
+            arg("m"),
+            arg("mp"),
+            arg("Ms_arr"),
+            arg("Hp"),
+            arg("uv"),
+            arg("K1_arr"),
+            arg("K2_arr"),
+            arg("K3_arr")
+        ));
+
+        def("compute_anisotropy_jtimes", &compute_anisotropy_jtimes, (
+            arg("m"),
+            arg("mp"),
+            arg("Ms_arr"),
+            arg("Hp"),
+            arg("u"),
+            arg("K1_arr"),
+            arg("K2_arr")
+        ));
     }
 
 }}
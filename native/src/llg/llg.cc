@@ -338,6 +338,130 @@ namespace finmag { namespace llg {
             pin(jtimes, pins);
         }
 
+        /*
+        The *_dofs variants below work directly on arrays in dolfin dof order,
+        so that the caller does not have to permute m, H and dmdt into the
+        "xxx" vertex order first. The (3 x nodes) array v2d gives the index in
+        the dof-ordered arrays of component j at mesh vertex i as v2d(j, i).
+        alpha and pins are in vertex order, as for the other functions.
+        */
+        int check_dimensions_dofs(
+                const np_array<double> &alpha,
+                const np_array<double> &m,
+                const np_array<double> &H,
+                const np_array<double> &dmdt,
+                const np_array<long> &v2d) {
+            v2d.check_ndim(2, "check_dimensions_dofs: v2d");
+            int const nodes = v2d.dim()[1];
+            v2d.check_shape(3, nodes, "check_dimensions_dofs: v2d");
+
+            m.check_ndim(1, "check_dimensions_dofs: m");
+            int const dofs = m.dim()[0];
+            H.check_shape(dofs, "check_dimensions_dofs: H");
+            dmdt.check_shape(dofs, "check_dimensions_dofs: dmdt");
+
+            alpha.check_ndim(1, "check_dimensions_dofs: alpha");
+            alpha.check_shape(nodes, "check_dimensions_dofs: alpha");
+
+            return nodes;
+        }
+
+        /*
+        Set the values of dm/dt to zero for all nodes in pins, dof ordering.
+        */
+        void pin_dofs(const np_array<double> &dmdt, const np_array<long> &pins, const np_array<long> &v2d) {
+            double *dm = dmdt.data();
+            long *i0 = v2d(0), *i1 = v2d(1), *i2 = v2d(2);
+
+            pins.check_ndim(1, "pins");
+            int const nb_pins = pins.dim()[0];
+            int const nodes = v2d.dim()[1];
+
+            int pin;
+            for (int i = 0; i < nb_pins; i++) {
+                pin = * pins[i];
+                if ( pin >= 0 && pin < nodes ) {
+                    dm[i0[pin]] = 0;
+                    dm[i1[pin]] = 0;
+                    dm[i2[pin]] = 0;
+                }
+            }
+        }
+
+        void calc_llg_dmdt_dofs(
+                const np_array<double> &m,
+                const np_array<double> &H,
+                double t,
+                const np_array<double> &dmdt,
+                const np_array<long> &pins,
+                double gamma,
+                const np_array<double> &alpha,
+                double char_time,
+                bool do_precession,
+                const np_array<long> &v2d) {
+            int const nodes = check_dimensions_dofs(alpha, m, H, dmdt, v2d);
+            double *mv = m.data(), *h = H.data(), *dm = dmdt.data();
+            double *a = alpha.data();
+            long *i0 = v2d(0), *i1 = v2d(1), *i2 = v2d(2);
+
+            finmag::util::scoped_gil_release release_gil;
+
+            // dmdt is not assumed to be zero on entry (it is usually a buffer
+            // owned by the time integrator), so every node is overwritten
+            #pragma omp parallel for schedule(guided)
+            for (int i=0; i < nodes; i++) {
+                long const x = i0[i], y = i1[i], z = i2[i];
+                dm[x] = 0; dm[y] = 0; dm[z] = 0;
+                damping_i(a[i], gamma, mv[x], mv[y], mv[z], h[x], h[y], h[z], dm[x], dm[y], dm[z]);
+                relaxation_i(0.1/char_time, mv[x], mv[y], mv[z], dm[x], dm[y], dm[z]);
+
+                if (do_precession)
+                    precession_i(a[i], gamma, mv[x], mv[y], mv[z], h[x], h[y], h[z], dm[x], dm[y], dm[z]);
+            }
+            pin_dofs(dmdt, pins, v2d);
+        }
+
+        void calc_llg_jtimes_dofs(
+                const np_array<double> &m,
+                const np_array<double> &H,
+                const np_array<double> &mp,
+                const np_array<double> &Hp,
+                double t,
+                const np_array<double> &jtimes,
+                double gamma,
+                const np_array<double> &alpha,
+                double char_time,
+                bool do_precession,
+                const np_array<long> &pins,
+                const np_array<long> &v2d) {
+            int const nodes = check_dimensions_dofs(alpha, m, H, jtimes, v2d);
+            int const dofs = m.dim()[0];
+            mp.check_shape(dofs, "calc_llg_jtimes_dofs: mp");
+            Hp.check_shape(dofs, "calc_llg_jtimes_dofs: Hp");
+
+            double *mv = m.data(), *h = H.data(), *jt = jtimes.data();
+            double *mpv = mp.data(), *hp = Hp.data();
+            double *a = alpha.data();
+            long *i0 = v2d(0), *i1 = v2d(1), *i2 = v2d(2);
+
+            finmag::util::scoped_gil_release release_gil;
+
+            #pragma omp parallel for schedule(guided)
+            for (int i = 0; i < nodes; i++) {
+                long const x = i0[i], y = i1[i], z = i2[i];
+                jt[x] = 0; jt[y] = 0; jt[z] = 0;
+
+                if ( do_precession ) {
+                    dm_precession_i(a[i], gamma, mv[x], mv[y], mv[z], mpv[x], mpv[y], mpv[z],
+                        h[x], h[y], h[z], hp[x], hp[y], hp[z], jt[x], jt[y], jt[z]);
+                }
+                dm_damping_i(a[i], gamma, mv[x], mv[y], mv[z], mpv[x], mpv[y], mpv[z],
+                        h[x], h[y], h[z], hp[x], hp[y], hp[z], jt[x], jt[y], jt[z]);
+                dm_relaxation_i(0.1/char_time, mv[x], mv[y], mv[z], mpv[x], mpv[y], mpv[z], jt[x], jt[y], jt[z]);
+            }
+            pin_dofs(jtimes, pins, v2d);
+        }
+
         /*
             Computes the solid angle subtended by the triangular mesh Ts, as seen from xs
               r - 3 x m array of points in space
@@ -788,6 +912,32 @@ namespace finmag { namespace llg {
             arg("do_precession"),
             arg("pins")
         ));
+        def("calc_llg_dmdt_dofs", &calc_llg_dmdt_dofs, (
+            arg("m"),
+            arg("H"),
+            arg("t"),
+            arg("dmdt"),
+            arg("pins"),
+            arg("gamma_LL"),
+            arg("alpha"),
+            arg("char_time"),
+            arg("do_precession"),
+            arg("v2d")
+        ));
+        def("calc_llg_jtimes_dofs", &calc_llg_jtimes_dofs, (
+            arg("m"),
+            arg("H"),
+            arg("mp"),
+            arg("Hp"),
+            arg("t"),
+            arg("jtimes"),
+            arg("gamma_LL"),
+            arg("alpha"),
+            arg("char_time"),
+            arg("do_precession"),
+            arg("pins"),
+            arg("v2d")
+        ));
         def("compute_solid_angle", &compute_solid_angle, (
             arg("r"),
             arg("T"),
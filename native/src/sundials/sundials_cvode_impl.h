@@ -162,6 +162,8 @@ namespace finmag { namespace sundials {
         // solver functions
         double advance_time(double tout, const np_array<double> &yout, int itask);
 
+        int advance_time_dense(double tout, const np_array<double> &yout, const np_array<double> &ts, const np_array<double> &ys);
+
         // main solver optional input functions
         void set_max_ord(int max_order) {
             CHECK_SUNDIALS_RET(CVodeSetMaxOrd, (cvode_mem, max_order));
@@ -169,6 +171,8 @@ namespace finmag { namespace sundials {
 
         void set_max_num_steps(int max_steps) {
             CHECK_SUNDIALS_RET(CVodeSetMaxNumSteps, (cvode_mem, max_steps));
+            // a non-positive value restores the default of CVODE
+            max_num_steps = max_steps > 0 ? max_steps : 500;
         }
 
         void set_max_hnil_warns(int max_hnil) {
@@ -256,7 +260,56 @@ namespace finmag { namespace sundials {
             CHECK_SUNDIALS_RET(CVSpilsSetMaxl, (cvode_mem, maxl));
         }
 
-        // TODO: add rootfinding and interpolation methods
+        // rootfinding functions
+
+        /* Let CVODE locate the roots of the n components of g(t, y), which
+           should return a sequence of n floats. advance_time stops at the
+           first root it finds, see get_root_info. n = 0 disables the
+           rootfinding. */
+        void set_root_fn(int n, const bp::object &g) {
+            root_fn = g;
+            n_root_fns = n;
+            CHECK_SUNDIALS_RET(CVodeRootInit, (cvode_mem, n, n > 0 ? &root_callback : NULL));
+        }
+
+        /* Only locate the roots of the i-th function where it is increasing
+           (directions[i] = 1), decreasing (-1) or both (0, the default). */
+        void set_root_direction(const bp::object &directions) {
+            std::vector<int> dirs(n_root_fns);
+            for (int i = 0; i < n_root_fns; i++) {
+                dirs[i] = bp::extract<int>(directions[i]);
+            }
+            CHECK_SUNDIALS_RET(CVodeSetRootDirection, (cvode_mem, n_root_fns > 0 ? &dirs[0] : NULL));
+        }
+
+        /* Returns a list with an entry for each root function, which is
+           nonzero (the direction of the crossing) if the last call of
+           advance_time stopped at a root of this function. The list is
+           empty if advance_time reached tout instead. */
+        bp::list get_root_info() {
+            bp::list result;
+            if (!root_return) return result;
+            std::vector<int> info(n_root_fns);
+            CHECK_SUNDIALS_RET(CVodeGetRootInfo, (cvode_mem, &info[0]));
+            for (int i = 0; i < n_root_fns; i++) result.append(info[i]);
+            return result;
+        }
+
+        long get_num_g_evals() {
+            long retval = 0;
+            CHECK_SUNDIALS_RET(CVodeGetNumGEvals, (cvode_mem, &retval));
+            return retval;
+        }
+
+        // interpolation functions
+
+        /* Computes the k-th derivative of the solution at time t, which must
+           lie within the last internal step, from the Nordsieck history
+           array of CVODE. */
+        void get_dky(double t, int k, const np_array<double> &dky) {
+            array_nvector dky_nvec(dky);
+            CHECK_SUNDIALS_RET(CVodeGetDky, (cvode_mem, t, k, dky_nvec.ptr()));
+        }
 
         // optional output functions
 
@@ -541,6 +594,50 @@ namespace finmag { namespace sundials {
             }
         }
 
+        // Rootfinding
+        static int root_callback(realtype t, N_Vector y, realtype *gout, void *user_data) {
+            cvode *cv = (cvode*) user_data;
+
+            // call back into Python code
+            finmag::util::scoped_gil_ensure gil_ensure;
+            bp::object y_arr = nvector_to_array_object(y);
+
+            try {
+                bp::object res = cv->root_fn(t, y_arr);
+                if (bp::len(res) != cv->n_root_fns) {
+                    error_handler::set_error("Error in root callback: User-supplied Python root function must return one value per root function");
+                    return -1;
+                }
+                for (int i = 0; i < cv->n_root_fns; i++) {
+                    gout[i] = bp::extract<double>(res[i]);
+                }
+                return 0;
+            } catch (bp::error_already_set&) {
+                // Don't let the exception propagate through the sundials code. Report it as
+                // a failure of the root function instead, which makes CVode return an error.
+                std::string msg("Error in root callback: User-supplied Python root function raised an exception");
+                PyObject *type, *value, *traceback;
+                PyErr_Fetch(&type, &value, &traceback);
+                PyErr_NormalizeException(&type, &value, &traceback);
+                if (value) {
+                    PyObject *value_str = PyObject_Str(value);
+                    if (value_str) {
+                        const char *s = PyString_AsString(value_str);
+                        if (s) {
+                            msg += std::string(": ") + s;
+                        }
+                        Py_DECREF(value_str);
+                    }
+                }
+                Py_XDECREF(type);
+                Py_XDECREF(value);
+                Py_XDECREF(traceback);
+                PyErr_Clear();
+                error_handler::set_error(msg.c_str());
+                return -1;
+            }
+        }
+
         // Jacobian information (direct method with dense Jacobian)
         static int dls_dense_jac_callback(sundials_long_param_t n, realtype t, N_Vector y, N_Vector fy, DlsMat Jac,
                     void *user_data, N_Vector tmp1, N_Vector tmp2, N_Vector tmp3) {
@@ -625,8 +722,11 @@ namespace finmag { namespace sundials {
         }
 
         void* cvode_mem;
+        int n_root_fns;
+        bool root_return; // whether the last call of advance_time stopped at a root
+        long max_num_steps;
 
-        bp::object rhs_fn, dls_jac_fn, dls_band_jac_fn, spils_prec_setup_fn, spils_prec_solve_fn, spils_jac_times_vec_fn;
+        bp::object rhs_fn, dls_jac_fn, dls_band_jac_fn, spils_prec_setup_fn, spils_prec_solve_fn, spils_jac_times_vec_fn, root_fn;
     };
 
     void register_sundials_cvode();
@@ -650,7 +750,7 @@ namespace finmag { namespace sundials {
         error_handler::set_error(buf);
     }
 
-    cvode::cvode(int lmm, int iter): cvode_mem(0) {
+    cvode::cvode(int lmm, int iter): cvode_mem(0), n_root_fns(0), root_return(false), max_num_steps(500) {
         if (lmm != CV_ADAMS && lmm != CV_BDF)
             throw std::invalid_argument("sundials_cvode: lmm parameter must be either CV_ADAMS or CV_BDF");
         if (iter != CV_NEWTON && iter != CV_FUNCTIONAL)
@@ -711,15 +811,77 @@ namespace finmag { namespace sundials {
         CHECK_SUNDIALS_RET(CVodeSStolerances, (cvode_mem, reltol, abstol));
     }
 
+    /* Returns the time reached, which is tout unless CVODE stopped at a
+       root (see get_root_info) or itask is CV_ONE_STEP. */
     double cvode::advance_time(double tout, const np_array<double> &yout, int itask) {
         array_nvector yout_nvec(yout);
         double tret = 0;
+        root_return = false;
         // Release GIL while we are performing time integration
         finmag::util::scoped_gil_release gil_release;
-        CHECK_SUNDIALS_RET(CVode, (cvode_mem, tout, yout_nvec.ptr(), &tout, itask));
+        error_handler eh;
+        int retcode = CVode(cvode_mem, tout, yout_nvec.ptr(), &tret, itask);
+        eh.check_error(retcode, "CVode");
+        root_return = (retcode == CV_ROOT_RETURN);
         return tret;
     }
 
+    /* Integrates to tout in internal steps (CV_ONE_STEP) and, after each
+       step, interpolates the solution at the increasing output times ts[i]
+       passed in the step (see get_dky) into the rows of ys, an array of
+       shape (len(ts), len(yout)). Only the times ts[i] <= tout are used,
+       and they must not lie before the last internal step. yout is set to
+       the solution at tout as in advance_time, and the number of rows
+       filled is returned.
+
+       At most max_num_steps steps are taken between two output times, as
+       between two calls of advance_time. Roots of the root functions are
+       not reported. */
+    int cvode::advance_time_dense(double tout, const np_array<double> &yout, const np_array<double> &ts, const np_array<double> &ys) {
+        int n = yout.size();
+        int n_ts = ts.size();
+        ys.check_shape(n_ts, n, "advance_time_dense: ys");
+        const double *t = ts.data();
+        double *ys_data = ys.data();
+        array_nvector yout_nvec(yout);
+        // a vector of length n which points to the rows of ys in turn
+        array_nvector row_nvec(ys);
+        N_Vector row = row_nvec.ptr();
+        NV_LENGTH_S(row) = n;
+        root_return = false;
+
+        // Release GIL while we are performing time integration
+        finmag::util::scoped_gil_release gil_release;
+        error_handler eh;
+        long n_steps = 0, steps_since_output = 0;
+        double tret = 0, tcur = 0;
+        int i = 0;
+        eh.check_error(CVodeGetNumSteps(cvode_mem, &n_steps), "CVodeGetNumSteps");
+        eh.check_error(CVodeGetCurrentTime(cvode_mem, &tcur), "CVodeGetCurrentTime");
+        // Before the first step the step size is 0 and the history array
+        // can't be interpolated, even at the initial time.
+        bool have_step = n_steps > 0;
+        while (true) {
+            if (have_step) {
+                for (; i < n_ts && t[i] <= tcur && t[i] <= tout; i++) {
+                    NV_DATA_S(row) = ys_data + (long) i * n;
+                    eh.check_error(CVodeGetDky(cvode_mem, t[i], 0, row), "CVodeGetDky");
+                    steps_since_output = 0;
+                }
+                if (tcur >= tout) break;
+            }
+            if (steps_since_output++ >= max_num_steps) {
+                throw std::runtime_error("Error in CVODE:CVode (CV_TOO_MUCH_WORK): At t = " + boost::lexical_cast<std::string>(tcur) +
+                    ", mxstep steps taken before reaching the next output time.");
+            }
+            eh.check_error(CVode(cvode_mem, tout, yout_nvec.ptr(), &tret, CV_ONE_STEP), "CVode");
+            eh.check_error(CVodeGetCurrentTime(cvode_mem, &tcur), "CVodeGetCurrentTime");
+            have_step = true;
+        }
+        eh.check_error(CVodeGetDky(cvode_mem, tout, 0, yout_nvec.ptr()), "CVodeGetDky");
+        return i;
+    }
+
     boost::thread_specific_ptr<std::string> error_handler::cvode_error;
 
     std::string cvode::get_return_flag_name(int flag) {
@@ -786,6 +948,7 @@ namespace finmag { namespace sundials {
         cv.def("set_linear_solver_sp_tfqmr", &cvode::set_linear_solver_sp_tfqmr, (arg("pretype"), arg("maxl")=0));
         // solver functions
         cv.def("advance_time", &cvode::advance_time, (arg("tout"), arg("yout"), arg("itask")=CV_NORMAL));
+        cv.def("advance_time_dense", &cvode::advance_time_dense, (arg("tout"), arg("yout"), arg("ts"), arg("ys")));
         // main solver optional input functions
         cv.def("set_max_ord", &cvode::set_max_ord, (arg("max_order")));
         cv.def("set_max_num_steps", &cvode::set_max_num_steps, (arg("max_steps")));
@@ -810,6 +973,13 @@ namespace finmag { namespace sundials {
         cv.def("set_spils_gs_type", &cvode::set_spils_gs_type, (arg("gstype")));
         cv.def("set_spils_eps_lin", &cvode::set_spils_eps_lin, (arg("eplifac")));
         cv.def("set_spils_maxl", &cvode::set_spils_maxl, (arg("maxl")));
+        // rootfinding functions
+        cv.def("set_root_fn", &cvode::set_root_fn, (arg("n"), arg("g")));
+        cv.def("set_root_direction", &cvode::set_root_direction, (arg("directions")));
+        cv.def("get_root_info", &cvode::get_root_info);
+        cv.def("get_num_g_evals", &cvode::get_num_g_evals);
+        // interpolation functions
+        cv.def("get_dky", &cvode::get_dky, (arg("t"), arg("k"), arg("dky")));
         // optional output functions
         cv.def("get_work_space", &cvode::get_work_space);
         cv.def("get_num_steps", &cvode::get_num_steps);
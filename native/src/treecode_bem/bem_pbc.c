@@ -32,5 +32,79 @@ void build_matrix_T(double *x_t, int *tri_nodes, double *bm, double *T, int n_no
 }
 
 
+//a face touching the column col of a matrix block, at its local node k
+typedef struct {
+	int face, col, k;
+} face_incidence;
 
+static int compare_face_incidences(const void *a, const void *b) {
+	return ((const face_incidence *) a)->face - ((const face_incidence *) b)->face;
+}
+
+//compute the entries bm[rows, cols] of the boundary matrix (without the solid
+//angle term on the diagonal). The faces around node i are
+//node_faces[node_face_ptr[i]:node_face_ptr[i+1]], so only the faces touching
+//one of the columns are visited, each of them once per row.
+void build_matrix_block_T(double *x_t, int *tri_nodes, int *node_face_ptr, int *node_faces,
+		double *bm, double *T, int *rows, int n_rows, int *cols, int n_cols) {
+	int i, j, k, p, c, g, n_inc, n_group;
+	double be[3];
+	double *v;
+	int *nodes, *group_start;
+	face_incidence *inc;
+
+	n_inc = 0;
+	for (j = 0; j < n_cols; j++) {
+		n_inc += node_face_ptr[cols[j] + 1] - node_face_ptr[cols[j]];
+	}
+	if (n_inc == 0) {
+		return;
+	}
 
+	inc = (face_incidence *) malloc(n_inc * sizeof(face_incidence));
+	group_start = (int *) malloc((n_inc + 1) * sizeof(int));
+
+	n_inc = 0;
+	for (j = 0; j < n_cols; j++) {
+		for (i = node_face_ptr[cols[j]]; i < node_face_ptr[cols[j] + 1]; i++) {
+			c = node_faces[i];
+			inc[n_inc].face = c;
+			inc[n_inc].col = j;
+			for (k = 0; k < 3; k++) {
+				if (tri_nodes[3*c+k] == cols[j]) {
+					inc[n_inc].k = k;
+				}
+			}
+			n_inc++;
+		}
+	}
+
+	//group the incidences by face, so that each face is integrated only once
+	qsort(inc, n_inc, sizeof(face_incidence), compare_face_incidences);
+	n_group = 0;
+	for (i = 0; i < n_inc; i++) {
+		if (i == 0 || inc[i].face != inc[i-1].face) {
+			group_start[n_group++] = i;
+		}
+	}
+	group_start[n_group] = n_inc;
+
+	#pragma omp parallel for private(i,g,be,v,nodes) if(n_rows * n_group > 1000)
+	for (p = 0; p < n_rows; p++) {
+
+		v = &x_t[3*rows[p]];
+
+		for (g = 0; g < n_group; g++) {
+			nodes = &tri_nodes[3*inc[group_start[g]].face];
+
+			boundary_element(v, &x_t[3*nodes[0]], &x_t[3*nodes[1]], &x_t[3*nodes[2]], be, T);
+
+			for (i = group_start[g]; i < group_start[g+1]; i++) {
+				bm[p*n_cols + inc[i].col] += be[inc[i].k];
+			}
+		}
+	}
+
+	free(inc);
+	free(group_start);
+}
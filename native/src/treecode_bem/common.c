@@ -1,4 +1,7 @@
 #include "common.h"
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 
 static int ccc[35]={
@@ -147,6 +150,20 @@ double solid_angle_single(double *p, double *x1, double *x2, double *x3) {
     return (2 * omega);
 }
 
+//add the solid angle of each tetrahedron at its vertices to bsa
+void vertex_solid_angles(double *x, int *cells, int n_cell, double *bsa) {
+	int i, j;
+	int *c;
+
+	for (i = 0; i < n_cell; i++) {
+		c = &cells[4*i];
+		for (j = 0; j < 4; j++) {
+			bsa[c[j]] += solid_angle_single(&x[3*c[j]], &x[3*c[(j+1)%4]],
+					&x[3*c[(j+2)%4]], &x[3*c[(j+3)%4]]);
+		}
+	}
+}
+
 //compute the solid angle if the given point p coincide one vertex of the triangle
 double solid_angle_single_reduced(double *p, double *x1, double *x2, double *x3, double *T, double *res) {
 
@@ -611,22 +628,34 @@ void free_tree(fastsum_plan *plan, struct octree_node *tree) {
     if (tree == NULL) {
         return;
     }
-    if (tree->num_children > 0) {
-        for (i = 0; i < tree->num_children; i++) {
-            free_tree(plan, tree->children[i]);
-        }
-    } else {
+    for (i = 0; i < tree->num_children; i++) {
+        free_tree(plan, tree->children[i]);
+    }
 
-        if (tree->have_moment&&tree->moment != NULL) {
-            free_3d_double(tree->moment, plan->p + 1  );
-        }
-        if (tree->have_moment&&tree->mom != NULL) {
-        	free(tree->mom);
-        }
+    if (tree->have_moment&&tree->moment != NULL) {
+        free_3d_double(tree->moment, plan->p + 1  );
+    }
+    if (tree->have_moment&&tree->mom != NULL) {
+    	free(tree->mom);
+    }
+
+    free(tree);
 
-        free(tree);
+}
+
+int collect_nodes(struct octree_node *tree, struct octree_node **nodes, int n) {
+    int i;
+
+    if (nodes != NULL) {
+        nodes[n] = tree;
+    }
+    n++;
+
+    for (i = 0; i < tree->num_children; i++) {
+        n = collect_nodes(tree->children[i], nodes, n);
     }
 
+    return n;
 }
 
 void build_tree(fastsum_plan *plan) {
@@ -646,6 +675,10 @@ void build_tree(fastsum_plan *plan) {
 
     create_tree(plan, plan->tree, 0, plan->triangle_num, bnd);
 
+    plan->num_nodes = collect_nodes(plan->tree, NULL, 0);
+    plan->nodes = malloc(plan->num_nodes * sizeof (struct octree_node *));
+    collect_nodes(plan->tree, plan->nodes, 0);
+
     //printf("r_eps=%g  with mac=%g\n",plan->r_eps,plan->mac*plan->r_eps);
     //printree(plan->tree);
 
@@ -655,8 +688,8 @@ void compute_coefficient(double ***a, double dx, double dy, double dz, int p) {
     int i, j, k;
     double R, r, r3, r5;
 
-    double *cf = (double *) malloc((p + 1) * sizeof (double));
-    double *cg = (double *) malloc((p + 1) * sizeof (double));
+    // on the stack, as this is called concurrently by several threads
+    double cf[p + 1], cg[p + 1];
 
     double ddx = 2 * dx;
     double ddy = 2 * dy;
@@ -754,9 +787,6 @@ void compute_coefficient(double ***a, double dx, double dy, double dz, int p) {
         }
     }
 
-    free(cf);
-    free(cg);
-
     return;
 }
 
@@ -1064,6 +1094,8 @@ fastsum_plan * create_plan() {
 
     fastsum_plan *plan = (fastsum_plan*) malloc(sizeof (fastsum_plan));
     plan->tree = NULL;
+    plan->nodes = NULL;
+    plan->num_nodes = 0;
 
     return plan;
 }
@@ -1103,6 +1135,7 @@ void init_fastsum(fastsum_plan *plan, int N_target, int triangle_num, int p, dou
     plan->vert_bsa = (double *) malloc(N_target * (sizeof (double)));
 
     plan->id_nn = (int *) malloc(N_target * (sizeof (int)));
+    plan->id_offset = (int *) malloc((N_target + 1) * (sizeof (int)));
 
     plan->r_eps_factor=correct_factor;
 
@@ -1186,7 +1219,7 @@ void update_potential_u1(fastsum_plan *plan, double *u1) {
     double sa, sb, sc;
     double tmp = 0;
 
-
+	#pragma omp parallel for private(f, i1, i2, i3, sa, sb, sc, tmp)
     for (face = 0; face < plan->triangle_num; face++) {
 
         f = 3 * face;
@@ -1213,16 +1246,156 @@ void reset_moment(fastsum_plan *plan, struct octree_node *tree){
 	    return;
 	}
 
+	if (tree == plan->tree) {
+		for (i = 0; i < plan->num_nodes; i++) {
+			plan->nodes[i]->need_upadte_moment = 1;
+		}
+		return;
+	}
+
 	tree->need_upadte_moment = 1;
-	if (tree->num_children > 0) {
-	        for (i = 0; i < tree->num_children; i++) {
-	        	reset_moment(plan, tree->children[i]);
-	        }
+	for (i = 0; i < tree->num_children; i++) {
+		reset_moment(plan, tree->children[i]);
 	}
 
 }
 
 
+/*
+ * Compute the moments of all nodes of the tree for the current charge
+ * density, the nodes in parallel. This is done before the potential is
+ * evaluated, so that the (parallel) loop over the targets only reads the
+ * tree. If directly > 0, the moments used by fast_sum_I are computed
+ * (only for nodes with at least 10 particles, the others are summed up
+ * directly), otherwise those used by fast_sum_II.
+ */
+void compute_moments(fastsum_plan *plan, int directly) {
+
+	int i;
+	struct octree_node *node;
+
+	// the storage is only allocated once and reused
+	for (i = 0; i < plan->num_nodes; i++) {
+		node = plan->nodes[i];
+		if (!node->have_moment) {
+			if (directly > 0) {
+				node->mom = (double *)malloc(35 * sizeof (double));
+			} else {
+				node->moment = alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);
+			}
+			node->have_moment = 1;
+			node->need_upadte_moment = 1;
+		}
+	}
+
+	#pragma omp parallel for private(node) schedule(dynamic)
+	for (i = 0; i < plan->num_nodes; i++) {
+		node = plan->nodes[i];
+		if (!node->need_upadte_moment) {
+			continue;
+		}
+		if (directly > 0) {
+			if (node->num_particle >= 10) {
+				compute_moment_directly(plan, node, node->mom, node->x, node->y, node->z);
+			}
+		} else {
+			compute_moment(plan, node, node->moment, node->x, node->y, node->z);
+		}
+		node->need_upadte_moment = 0;
+	}
+
+}
+
+
+/*
+ * Set up the sparse near-field correction (id_nn, id_offset, id_n and b_m)
+ * using build_indices_single to find the boundary nodes that are close to
+ * a target. The targets are processed in parallel, each thread with its own
+ * marker and value buffers of length N_target.
+ */
+void build_indices(fastsum_plan *plan, build_indices_single_fn build_indices_single) {
+
+	int i;
+	int n = plan->N_target;
+
+	// first pass: count the entries of every target
+	#pragma omp parallel private(i)
+	{
+		int j, length;
+		int *indices_n = calloc(n, sizeof (int));
+		double *values = calloc(n, sizeof (double));
+
+		#pragma omp for schedule(dynamic, 16)
+		for (i = 0; i < n; i++) {
+			build_indices_single(plan, plan->tree, i, indices_n, values, 0);
+			length = 0;
+			for (j = 0; j < n; j++) {
+				if (indices_n[j] > 0) {
+					length++;
+					indices_n[j] = 0;
+				}
+			}
+			plan->id_nn[i] = length;
+		}
+
+		free(indices_n);
+		free(values);
+	}
+
+	plan->id_offset[0] = 0;
+	for (i = 0; i < n; i++) {
+		plan->id_offset[i + 1] = plan->id_offset[i] + plan->id_nn[i];
+	}
+	plan->total_length_n = plan->id_offset[n];
+
+	plan->id_n = malloc(plan->total_length_n * sizeof (int));
+	plan->b_m = malloc(plan->total_length_n * sizeof (double));
+
+	// second pass: compute the entries, every target writes to its own range
+	#pragma omp parallel private(i)
+	{
+		int j, k;
+		int *indices_n = calloc(n, sizeof (int));
+		double *values = calloc(n, sizeof (double));
+
+		#pragma omp for schedule(dynamic, 16)
+		for (i = 0; i < n; i++) {
+			build_indices_single(plan, plan->tree, i, indices_n, values, 1);
+			k = plan->id_offset[i];
+			for (j = 0; j < n; j++) {
+				if (indices_n[j] > 0) {
+					plan->id_n[k] = j;
+					plan->b_m[k] = values[j];
+					k++;
+					indices_n[j] = 0;
+					values[j] = 0;
+				}
+			}
+		}
+
+		free(indices_n);
+		free(values);
+	}
+
+}
+
+
+void set_num_threads(int n) {
+#ifdef _OPENMP
+	omp_set_num_threads(n);
+#endif
+}
+
+
+int get_max_threads(void) {
+#ifdef _OPENMP
+	return omp_get_max_threads();
+#else
+	return 1;
+#endif
+}
+
+
 void fastsum_finalize(fastsum_plan * plan) {
 
     free_tree(plan, plan->tree);
@@ -1237,6 +1410,8 @@ void fastsum_finalize(fastsum_plan * plan) {
     free(plan->b_m);
     free(plan->id_n);
     free(plan->id_nn);
+    free(plan->id_offset);
+    free(plan->nodes);
 
     free(plan);
 
@@ -71,13 +71,24 @@ typedef struct {
     int *id_n; // indices nodes
     double *b_m;//boundary matrix
     int *id_nn;
+    int *id_offset; // position of the first entry of each target in id_n and b_m
 
     int total_length_n;
+
+    struct octree_node **nodes; // all nodes of the tree, to loop over them in parallel
+    int num_nodes;
 } fastsum_plan;
 
+typedef void (*build_indices_single_fn)(fastsum_plan *plan, struct octree_node *tree,
+        int index, int *in, double *value, int compute_bm);
+
 void compute_coefficient(double ***a, double dx, double dy, double dz, int p);
 void compute_moment(fastsum_plan *plan, struct octree_node *tree, double ***moment, double x, double y, double z);
 void reset_moment(fastsum_plan *plan, struct octree_node *tree);
+void compute_moments(fastsum_plan *plan, int directly);
+void build_indices(fastsum_plan *plan, build_indices_single_fn build_indices_single);
+void set_num_threads(int n);
+int get_max_threads(void);
 
 fastsum_plan *create_plan(void);
 void update_potential_u1(fastsum_plan *plan,double *u1);
@@ -97,8 +108,11 @@ void compute_source_nodes_weights(fastsum_plan *plan);
 void direct_sum_I(fastsum_plan *plan, double *phi, double *u1);
 
 double solid_angle_single(double *p, double *x1, double *x2, double *x3);
+void vertex_solid_angles(double *x, int *cells, int n_cell, double *bsa);
 void boundary_element(double *xp, double *x1, double *x2, double *x3, double *res, double *T);
 void build_matrix_T(double *x_t, int *tri_nodes, double *bm, double *T, int n_node, int n_face);
+void build_matrix_block_T(double *x_t, int *tri_nodes, int *node_face_ptr, int *node_faces,
+		double *bm, double *T, int *rows, int n_rows, int *cols, int n_cols);
 int get_total_length(fastsum_plan *plan);
 
 
@@ -17,7 +17,7 @@ ext_modules = [
 	          libraries=['m'],
               #libraries=['m','gomp'],
               extra_compile_args=["-fopenmp"],
-              #extra_link_args=["-g"],
+              extra_link_args=["-fopenmp"],
         )
     ]
 
@@ -62,70 +62,7 @@ void bulid_indices_single_I(fastsum_plan *plan, struct octree_node *tree,
 
 void bulid_indices_I(fastsum_plan *plan) {
 
-    int i, j;
-
-    int *indices_n = malloc(plan->N_target * sizeof ( int));
-    double *values = malloc(plan->N_target * sizeof ( double));
-
-
-    int tmp_length_n = 0;
-    int total_length_n = 0;
-
-    for (i = 0; i < plan->N_target; i++) {
-        indices_n[i] = 0;
-        values[i] = 0;
-    }
-
-    
-    for (i = 0; i < plan->N_target; i++) {
-
-    	bulid_indices_single_I(plan, plan->tree, i, indices_n, values, 0);
-
-        for (j = 0; j < plan->N_target; j++) {
-            if (indices_n[j] > 0) {
-                total_length_n++;
-                indices_n[j] = 0;
-            }
-        }
-
-    }
-
-    plan->total_length_n=total_length_n;
-
-    plan->id_n = malloc(total_length_n * sizeof ( int));
-    plan->b_m = malloc(total_length_n * sizeof ( double));
-
-    for (i = 0; i < total_length_n; i++) {
-        plan->id_n[i] = 0;
-        plan->b_m[i] = 0;
-    }
-
-
-    total_length_n = 0;
-    for (i = 0; i < plan->N_target; i++) {
-
-    	bulid_indices_single_I(plan, plan->tree, i, indices_n, values, 1);
-
-        tmp_length_n = 0;
-
-        for (j = 0; j < plan->N_target; j++) {
-            if (indices_n[j] > 0) {
-                plan->id_n[total_length_n] = j;
-                plan->b_m[total_length_n] = values[j];
-
-                total_length_n++;
-                tmp_length_n++;
-                indices_n[j] = 0;
-                values[j] = 0;
-            }
-        }
-
-        plan->id_nn[i] = tmp_length_n;
-    }
-
-
-    free(indices_n);
-    free(values);
+	build_indices(plan, bulid_indices_single_I);
 
 }
 
@@ -180,18 +117,7 @@ double compute_potential_single_target_I(fastsum_plan *plan, struct octree_node
     	}
 
 
-        if (!tree->have_moment) {
-            tree->mom = (double *)malloc(35 * sizeof (double));
-            tree->have_moment = 1;
-            tree->need_upadte_moment = 1;
-        }
-
-
-        if (tree->need_upadte_moment) {
-        	compute_moment_directly(plan, tree, tree->mom, tree->x, tree->y, tree->z);
-            tree->need_upadte_moment = 0;
-        }
-
+        // the moments have been computed by compute_moments
 
         dx = plan->x_t[3 * index] - tree->x;
         dy = plan->x_t[3 * index + 1] - tree->y;
@@ -227,10 +153,13 @@ double compute_potential_single_target_I(fastsum_plan *plan, struct octree_node
 
 
 void fast_sum_I(fastsum_plan *plan, double *phi, double *u1) {
-    int i, j, k;
+    int i, j;
 
     if (plan->mac > 0) {
 
+        compute_moments(plan, 1);
+
+		#pragma omp parallel for schedule(dynamic, 16)
         for (j = 0; j < plan->N_target; j++) {
             phi[j] = compute_potential_single_target_I(plan, plan->tree, j);
         }
@@ -238,14 +167,11 @@ void fast_sum_I(fastsum_plan *plan, double *phi, double *u1) {
     }
 
 
-    int total_j = 0;
-
+	#pragma omp parallel for private(j)
     for (i = 0; i < plan->N_target; i++) {
 
-        for (j = 0; j < plan->id_nn[i]; j++) {
-            k = plan->id_n[total_j];
-            phi[i] += plan->b_m[total_j] * u1[k];
-            total_j++;
+        for (j = plan->id_offset[i]; j < plan->id_offset[i + 1]; j++) {
+            phi[i] += plan->b_m[j] * u1[plan->id_n[j]];
         }
 
         phi[i] += plan->vert_bsa[i] * u1[i];
@@ -254,7 +180,3 @@ void fast_sum_I(fastsum_plan *plan, double *phi, double *u1) {
     reset_moment(plan,plan->tree);
 
 }
-
-
-
-
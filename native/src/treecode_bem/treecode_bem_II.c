@@ -72,70 +72,7 @@ void bulid_indices_single_II(fastsum_plan *plan, struct octree_node *tree,
 
 void bulid_indices_II(fastsum_plan *plan) {
 
-    int i, j;
-
-    int *indices_n = malloc(plan->N_target * sizeof ( int));
-    double *values = malloc(plan->N_target * sizeof ( double));
-
-
-    int tmp_length_n = 0;
-    int total_length_n = 0;
-
-    for (i = 0; i < plan->N_target; i++) {
-        indices_n[i] = 0;
-        values[i] = 0;
-    }
-
-
-    for (i = 0; i < plan->N_target; i++) {
-
-    	bulid_indices_single_II(plan, plan->tree, i, indices_n, values, 0);
-
-        for (j = 0; j < plan->N_target; j++) {
-            if (indices_n[j] > 0) {
-                total_length_n++;
-                indices_n[j] = 0;
-            }
-        }
-
-    }
-
-    plan->total_length_n=total_length_n;
-
-    plan->id_n = malloc(total_length_n * sizeof ( int));
-    plan->b_m = malloc(total_length_n * sizeof ( double));
-
-    for (i = 0; i < total_length_n; i++) {
-        plan->id_n[i] = 0;
-        plan->b_m[i] = 0;
-    }
-
-
-    total_length_n = 0;
-    for (i = 0; i < plan->N_target; i++) {
-
-    	bulid_indices_single_II(plan, plan->tree, i, indices_n, values, 1);
-
-        tmp_length_n = 0;
-
-        for (j = 0; j < plan->N_target; j++) {
-            if (indices_n[j] > 0) {
-                plan->id_n[total_length_n] = j;
-                plan->b_m[total_length_n] = values[j];
-
-                total_length_n++;
-                tmp_length_n++;
-                indices_n[j] = 0;
-                values[j] = 0;
-            }
-        }
-
-        plan->id_nn[i] = tmp_length_n;
-    }
-
-
-    free(indices_n);
-    free(values);
+	build_indices(plan, bulid_indices_single_II);
 
 }
 
@@ -195,18 +132,7 @@ double compute_potential_single_target_II(fastsum_plan *plan, struct octree_node
 
         }
 
-        if (!tree->have_moment) {
-                tree->moment = alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);
-                tree->have_moment = 1;
-                tree->need_upadte_moment = 1;
-        }
-
-
-        if (tree->need_upadte_moment) {
-            compute_moment(plan, tree, tree->moment, tree->x, tree->y, tree->z);
-            tree->need_upadte_moment = 0;
-        }
-
+        // the moments have been computed by compute_moments
 
         dx = plan->x_t[3 * index] - tree->x;
         dy = plan->x_t[3 * index + 1] - tree->y;
@@ -246,20 +172,16 @@ double compute_potential_single_target_II(fastsum_plan *plan, struct octree_node
 
 
 void compute_analytical_potential(fastsum_plan *plan, double *phi, double *u1) {
+	int i, j;
 
-	int i, j, k;
-    int total_j = 0;
-
+	#pragma omp parallel for private(j)
     for (i = 0; i < plan->N_target; i++) {
 
-        for (j = 0; j < plan->id_nn[i]; j++) {
-            k = plan->id_n[total_j];
-            phi[i] += plan->b_m[total_j] * u1[k];
-            total_j++;
+        for (j = plan->id_offset[i]; j < plan->id_offset[i + 1]; j++) {
+            phi[i] += plan->b_m[j] * u1[plan->id_n[j]];
         }
 
         phi[i]+=plan->vert_bsa[i] * u1[i];
-
     }
 
 }
@@ -271,6 +193,7 @@ void direct_sum_I(fastsum_plan *plan, double *phi, double *u1) {
     double dx,dy,dz;
     double res,R;
 
+	#pragma omp parallel for private(i, k, dx, dy, dz, res, R)
     for (j = 0; j < plan->N_target; j++) {
     	 res=0;
     	 phi[j]=0;
@@ -309,21 +232,24 @@ void direct_sum_I(fastsum_plan *plan, double *phi, double *u1) {
 
 void fast_sum_II(fastsum_plan *plan, double *phi, double *u1) {
 
-	int j;
+    compute_moments(plan, 0);
 
-    double ***a = alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);
+	#pragma omp parallel
+    {
+    	int j;
+    	// thread-private buffer for the Taylor coefficients
+    	double ***a = alloc_3d_double(plan->p + 1, plan->p + 1, plan->p + 1);
 
-    for (j = 0; j < plan->N_target; j++) {
-
-         phi[j] = compute_potential_single_target_II(plan, plan->tree, j, a);
+		#pragma omp for schedule(dynamic, 16)
+    	for (j = 0; j < plan->N_target; j++) {
+    		phi[j] = compute_potential_single_target_II(plan, plan->tree, j, a);
+    	}
 
-     }
+    	free_3d_double(a, plan->p + 1);
+    }
 
     compute_analytical_potential(plan,phi,u1);
 
     reset_moment(plan,plan->tree);
 
-    free_3d_double(a, plan->p + 1);
-
 }
-
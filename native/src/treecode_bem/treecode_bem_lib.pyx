@@ -10,7 +10,7 @@ cdef extern from "common.h":
 
     fastsum_plan* create_plan()
     void fastsum_finalize(fastsum_plan *plan)
-    void update_potential_u1(fastsum_plan *plan,double *u1)
+    void update_potential_u1(fastsum_plan *plan,double *u1) nogil
     
     void init_fastsum(fastsum_plan *plan, int N_target, int triangle_num, int p, double mac, int num_limit, double correct_factor)
     void init_mesh(fastsum_plan *plan, double *x_t, double *t_normal, int *triangle_nodes, double *vert_bsa)
@@ -19,16 +19,22 @@ cdef extern from "common.h":
     void bulid_indices_I(fastsum_plan *plan)
     void bulid_indices_II(fastsum_plan *plan)
     
-    void fast_sum_I(fastsum_plan *plan, double *phi,double *u1)
-    void fast_sum_II(fastsum_plan *plan, double *phi,double *u1)
+    void fast_sum_I(fastsum_plan *plan, double *phi,double *u1) nogil
+    void fast_sum_II(fastsum_plan *plan, double *phi,double *u1) nogil
 
     void compute_source_nodes_weights(fastsum_plan *plan)
     double solid_angle_single(double *p, double *x1, double *x2, double *x3)
+    void vertex_solid_angles(double *x, int *cells, int n_cell, double *bsa)
     void boundary_element(double *xp, double *x1, double *x2, double *x3, double *res, double *T)
     void build_matrix_T(double *x_t, int *tri_nodes, double *bm, double *T, int n_node, int n_face)
+    void build_matrix_block_T(double *x_t, int *tri_nodes, int *node_face_ptr, int *node_faces,
+                              double *bm, double *T, int *rows, int n_rows, int *cols, int n_cols)
     
     int get_total_length(fastsum_plan *plan)
-    void direct_sum_I(fastsum_plan *plan, double *phi, double *u1)
+    void direct_sum_I(fastsum_plan *plan, double *phi, double *u1) nogil
+
+    void set_num_threads(int n)
+    int get_max_threads()
 
 cdef class FastSum:
     cdef fastsum_plan *_c_plan
@@ -85,15 +91,25 @@ cdef class FastSum:
 
 
     def fastsum(self,np.ndarray[double, ndim=1, mode="c"] phi,np.ndarray[double, ndim=1, mode="c"] u1):
-        update_potential_u1(self._c_plan, &u1[0])
-        if self.type_I:
-            fast_sum_I(self._c_plan,&phi[0],&u1[0])
-        else:
-            fast_sum_II(self._c_plan,&phi[0],&u1[0])
+        cdef double *phi_ptr = &phi[0]
+        cdef double *u1_ptr = &u1[0]
+        cdef fastsum_plan *plan = self._c_plan
+        cdef bint type_I = self.type_I
+        # the evaluation is parallelised with OpenMP and doesn't need the GIL
+        with nogil:
+            update_potential_u1(plan, u1_ptr)
+            if type_I:
+                fast_sum_I(plan, phi_ptr, u1_ptr)
+            else:
+                fast_sum_II(plan, phi_ptr, u1_ptr)
             
     def directsum(self,np.ndarray[double, ndim=1, mode="c"] phi,np.ndarray[double, ndim=1, mode="c"] u1):
-        update_potential_u1(self._c_plan, &u1[0])
-        direct_sum_I(self._c_plan,&phi[0],&u1[0])
+        cdef double *phi_ptr = &phi[0]
+        cdef double *u1_ptr = &u1[0]
+        cdef fastsum_plan *plan = self._c_plan
+        with nogil:
+            update_potential_u1(plan, u1_ptr)
+            direct_sum_I(plan, phi_ptr, u1_ptr)
 
     def get_B_length(self):
         return get_total_length(self._c_plan)
@@ -104,6 +120,19 @@ cdef class FastSum:
             self._c_plan=NULL
 
 
+def set_openmp_threads(n):
+    """
+    Set the number of OpenMP threads used by the treecode (the default is
+    given by the environment variable OMP_NUM_THREADS).
+
+    """
+    set_num_threads(n)
+
+
+def get_openmp_threads():
+    return get_max_threads()
+
+
 def compute_solid_angle_single(np.ndarray[double, ndim=1, mode="c"] p,
                         np.ndarray[double, ndim=1, mode="c"] x1,
                         np.ndarray[double, ndim=1, mode="c"] x2,
@@ -112,6 +141,18 @@ def compute_solid_angle_single(np.ndarray[double, ndim=1, mode="c"] p,
     tmp=solid_angle_single(&p[0], &x1[0], &x2[0], &x3[0])
     return tmp
 
+def compute_vertex_solid_angles(np.ndarray[double, ndim=2, mode="c"] x,
+                        np.ndarray[int, ndim=2, mode="c"] cells):
+    """
+    Return the sum of the solid angles of the tetrahedra `cells` at each
+    of the vertices `x`.
+
+    """
+    cdef np.ndarray[double, ndim=1, mode="c"] bsa = np.zeros(len(x))
+    if len(cells) > 0:
+        vertex_solid_angles(&x[0,0], &cells[0,0], len(cells), &bsa[0])
+    return bsa
+
 def compute_boundary_element(np.ndarray[double, ndim=1, mode="c"] xp,
                         np.ndarray[double, ndim=1, mode="c"] x1,
                         np.ndarray[double, ndim=1, mode="c"] x2,
@@ -134,3 +175,14 @@ def build_boundary_matrix(np.ndarray[double, ndim=2, mode="c"] x_t,
                         np.ndarray[double, ndim=1, mode="c"] T,
                         n_node, n_face):
     build_matrix_T(&x_t[0,0], &face_nodes[0,0], &bm[0,0], &T[0], n_node, n_face)
+
+def build_boundary_matrix_block(np.ndarray[double, ndim=2, mode="c"] x_t,
+                        np.ndarray[int, ndim=2, mode="c"] face_nodes,
+                        np.ndarray[int, ndim=1, mode="c"] node_face_ptr,
+                        np.ndarray[int, ndim=1, mode="c"] node_faces,
+                        np.ndarray[double, ndim=2, mode="c"] bm,
+                        np.ndarray[double, ndim=1, mode="c"] T,
+                        np.ndarray[int, ndim=1, mode="c"] rows,
+                        np.ndarray[int, ndim=1, mode="c"] cols):
+    build_matrix_block_T(&x_t[0,0], &face_nodes[0,0], &node_face_ptr[0], &node_faces[0],
+                         &bm[0,0], &T[0], &rows[0], len(rows), &cols[0], len(cols))
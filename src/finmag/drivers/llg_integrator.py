@@ -24,6 +24,9 @@ def llg_integrator(llg, m0, backend="sundials", **kwargs):
     if backend == "scipy":
         return ScipyIntegrator(llg, m0, **kwargs)
     elif backend == "sundials":
+        if getattr(llg, 'dof_order', False):
+            # the llg object works on the dolfin vector directly
+            return SundialsIntegrator(llg, m0.get_numpy_array_debug(), **kwargs)
         return SundialsIntegrator(llg, m0.get_ordered_numpy_array_xxx(), **kwargs)
     else:
         raise ValueError("backend must be either scipy or sundials")
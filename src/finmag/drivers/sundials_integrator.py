@@ -1,5 +1,7 @@
 import logging
+import numpy as np
 from finmag.native import sundials
+from finmag.physics.preconditioner import ExchangePreconditioner
 
 EPSILON = 1e-15
 
@@ -18,11 +20,14 @@ class SundialsIntegrator(object):
     def __init__(self, llg, m0, t0=0.0, reltol=1e-6, abstol=1e-6,
                  nsteps=10000, method="bdf_gmres_prec_id", tablewriter=None):
         assert method in ("adams", "bdf_diag",
-                          "bdf_gmres_no_prec", "bdf_gmres_prec_id")
+                          "bdf_gmres_no_prec", "bdf_gmres_prec_id",
+                          "bdf_gmres_prec_exchange")
         self.llg = llg
         self.cur_t = t0
         self.m = m0.copy()
         self.tablewriter = tablewriter
+        self.root_functions = []
+        self.roots_found = []
 
         if method == "adams":
             integrator = sundials.cvode(
@@ -43,6 +48,14 @@ class SundialsIntegrator(object):
             integrator.set_spils_jac_times_vec_fn(self.llg.sundials_jtimes)
             integrator.set_spils_preconditioner(
                 llg.sundials_psetup, llg.sundials_psolve)
+        elif method == "bdf_gmres_prec_exchange":
+            # preconditioner built from the assembled exchange (and other
+            # linear) interaction matrices, see ExchangePreconditioner
+            llg.preconditioner = ExchangePreconditioner(llg)
+            integrator.set_linear_solver_sp_gmr(sundials.PREC_LEFT)
+            integrator.set_spils_jac_times_vec_fn(self.llg.sundials_jtimes)
+            integrator.set_spils_preconditioner(
+                llg.sundials_psetup, llg.sundials_psolve)
 
         integrator.set_scalar_tolerances(reltol, abstol)
         self.max_steps = nsteps
@@ -67,6 +80,11 @@ class SundialsIntegrator(object):
         Returns ``True`` or ``False`` depending on whether target time ``t``
         has been reached.
 
+        If root functions were set (see ``set_root_functions``), we stop at
+        the first root found before ``t`` and return False, with ``cur_t``
+        set to the time of the root and the indices of the functions which
+        have a root there in ``roots_found``.
+
         Given a target time ``t``, this function integrates towards ``t``. If
         ``max_steps`` was set and the number of steps for the integration are
         reached, we interrupt the calculation and return False.
@@ -86,8 +104,10 @@ class SundialsIntegrator(object):
                 "t={:.3g}, self.cur_t={:.3g} -- why are we integrating "
                 "into the past?".format(t, self.cur_t))
 
+        self.roots_found = []
+        self.llg.refresh_alpha_cache()
         try:
-            self.integrator.advance_time(t, self.m)
+            t_reached = self.integrator.advance_time(t, self.m)
         except RuntimeError, msg:
             # if we have reached max_num_steps, the error message will read
             # something like "Error in CVODE:CVode (CV_TOO_MUCH_WORK):
@@ -108,8 +128,14 @@ class SundialsIntegrator(object):
                 reached_tout = False
                 raise
         else:
-            self.cur_t = t
-            reached_tout = True
+            root_info = self.integrator.get_root_info() if self.root_functions else []
+            if root_info:
+                self.cur_t = t_reached
+                self.roots_found = [i for i, r in enumerate(root_info) if r != 0]
+                reached_tout = False
+            else:
+                self.cur_t = t
+                reached_tout = True
 
         # in any case: put integrated degrees of freedom from cvode object
         # back into llg object
@@ -118,6 +144,45 @@ class SundialsIntegrator(object):
         self.llg.sundials_m = self.m  # actually writes to the field class (c.f. llg.py)
         return reached_tout
 
+    def record(self, ts, out=None):
+        """
+        Integrate to the last of the increasing times `ts` and return an
+        array whose rows are the state vectors (see llg.sundials_m) at the
+        times `ts`, which must not lie before ``cur_t``.
+
+        Unlike calling advance_time for each time, this doesn't stop the
+        integration at the output times. CVODE takes its usual internal
+        steps, and after each step the state at the times passed in that
+        step is interpolated from its history array in native code. This
+        makes sampling at high rates much cheaper.
+
+        The rows are written to the array `out` of shape (len(ts), len(m))
+        if given.
+
+        """
+        ts = np.ascontiguousarray(ts, dtype=float)
+        if out is None:
+            out = np.zeros((len(ts), len(self.m)))
+        t = ts[-1]
+        if t <= self.cur_t or ts[0] < self.cur_t:
+            raise RuntimeError(
+                "Can't record at times between {:.3g} and {:.3g} from "
+                "self.cur_t={:.3g}.".format(ts[0], t, self.cur_t))
+
+        self.llg.refresh_alpha_cache()
+        try:
+            self.integrator.advance_time_dense(t, self.m, ts, out)
+        except RuntimeError, msg:
+            if "CV_TOO_MUCH_WORK" in msg.message:
+                self.cur_t = self.integrator.get_current_time()
+                log.error("The integrator has reached its maximum of {} steps "
+                          "between two output times at t = {}.".format(
+                              self.max_steps, self.cur_t))
+            raise
+        self.cur_t = t
+        self.llg.sundials_m = self.m
+        return out
+
     def advance_steps(self, steps):
         """
         Run the integrator for `steps` internal steps.
@@ -125,6 +190,7 @@ class SundialsIntegrator(object):
         """
         old_max_steps = self.max_steps
         self.max_steps = steps
+        self.llg.refresh_alpha_cache()
         try:
             # we can't tell sundials to run a certain number of steps
             # so we try integrating for a very long time but set it to
@@ -139,6 +205,32 @@ class SundialsIntegrator(object):
         self.llg.sundials_m = self.m
         self.max_steps = old_max_steps
 
+    def set_root_functions(self, functions, directions=None):
+        """
+        Let CVODE locate the roots of the event functions g(t, y) in the list
+        `functions`, where y is the state vector of the integrator (see
+        llg.sundials_m) and g returns a float. From now on, advance_time
+        stops at every root it finds.
+
+        Only roots where g is increasing are located if its entry in
+        `directions` is 1, only those where g is decreasing if it is -1 and
+        both if it is 0 (the default).
+
+        Pass an empty list to stop locating roots.
+
+        """
+        self.root_functions = list(functions)
+        self.roots_found = []
+        if not self.root_functions:
+            self.integrator.set_root_fn(0, None)
+            return
+        self.integrator.set_root_fn(len(self.root_functions), self._root_fn)
+        if directions is not None:
+            self.integrator.set_root_direction(list(directions))
+
+    def _root_fn(self, t, y):
+        return [g(t, y) for g in self.root_functions]
+
     # TODO: Remove debug flag again once we are sure that re-initialising the integrator
     #       doesn't cause a performance overhead.
     def reinit(self, debug=True):
@@ -190,3 +282,77 @@ class SundialsIntegrator(object):
              'tcur': tcur
              }
         return d
+
+
+class SundialsPetscIntegrator(SundialsIntegrator):
+
+    """
+    Sundials time integrator for a magnetisation which is distributed over
+    several MPI processes. Each process integrates the part of the
+    magnetisation it owns with cvode_petsc.CvodeSolver, using the
+    distributed right hand side and Jacobian-times-vector product of the
+    LLG (see LLG.sundials_rhs_petsc), without a preconditioner.
+
+    Attributes:
+        cur_t       The time up to which integration has been carried out.
+    """
+
+    def __init__(self, llg, t0=0.0, reltol=1e-6, abstol=1e-6, nsteps=10000):
+        try:
+            from finmag.native import cvode_petsc
+        except ImportError:
+            raise ImportError("The parallel integrator needs the cvode_petsc extension "
+                              "module, build it with `make -C native cvode_petsc`.")
+        llg.setup_distributed()
+        self.llg = llg
+        self.cur_t = t0
+        self.tablewriter = None
+        self.integrator = cvode_petsc.CvodeSolver(
+            llg.sundials_rhs_petsc, t0, llg._m_field.petsc_vector(),
+            jac_fun=llg.sundials_jtimes_petsc, rtol=reltol, atol=abstol,
+            max_num_steps=nsteps)
+        self._max_steps = nsteps
+
+    @property
+    def m(self):
+        return self.integrator.y_np
+
+    def advance_time(self, t):
+        """
+        Integrate to the time `t` and return True, see
+        SundialsIntegrator.advance_time.
+
+        """
+        if t == 0 and abs(t - self.cur_t) < EPSILON:
+            return True
+        elif t <= self.cur_t:
+            raise RuntimeError(
+                "t={:.3g}, self.cur_t={:.3g} -- why are we integrating "
+                "into the past?".format(t, self.cur_t))
+
+        self.integrator.advance_time(t)
+        self.cur_t = t
+        self.llg.sundials_m_petsc = self.m
+        return True
+
+    def advance_steps(self, steps):
+        raise NotImplementedError(
+            "advance_steps is not supported by the parallel integrator.")
+
+    def record(self, ts, out=None):
+        raise NotImplementedError(
+            "record is not supported by the parallel integrator.")
+
+    def set_root_functions(self, functions, directions=None):
+        if functions:
+            raise NotImplementedError(
+                "Locating roots of event functions is not supported by the "
+                "parallel integrator.")
+
+    def reinit(self, debug=True):
+        if debug:
+            log.debug("Re-initialising CVODE integrator.")
+        self.integrator.reinit(self.cur_t, self.llg.sundials_m_petsc)
+
+    n_rhs_evals = property(lambda self: self.stats()['nfevals'],
+                           "Number of function evaluations performed")
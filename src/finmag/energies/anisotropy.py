@@ -133,7 +133,13 @@ class UniaxialAnisotropy(EnergyBase):
             self.K1_arr = self.K1.get_numpy_array_debug()
             self.K2_arr = self.K2.get_numpy_array_debug()
             self.volumes = df.assemble(df.TestFunction(cg_scalar_functionspace) * df.dx)
+            self.Hp = np.zeros(self.H.shape)
             self.compute_field = self.__compute_field_directly
+            self.compute_field_derivative = self.__compute_field_derivative_directly
+
+    def field_is_linear(self):
+        # With K2 != 0 the field is computed natively and is not linear in m.
+        return self.assemble and super(UniaxialAnisotropy, self).field_is_linear()
 
     def __compute_field_directly(self):
 
@@ -149,3 +155,23 @@ class UniaxialAnisotropy(EnergyBase):
         self.u.shape = (-1,)
 
         return self.H
+
+    def __compute_field_derivative_directly(self, mp):
+        """
+        Return the derivative dH(m + a mp)/da at a = 0 for the current
+        magnetisation m and the direction `mp` (in dof order), which is used
+        for the Jacobian of the LLG equation.
+
+        """
+        m = self.m.get_numpy_array_debug()
+
+        m.shape = (3, -1)
+        self.Hp.shape = (3, -1)
+        self.u.shape = (3, -1)
+        native_llg.compute_anisotropy_jtimes(
+            m, mp.reshape((3, -1)), self.Ms, self.Hp, self.u, self.K1_arr, self.K2_arr)
+        m.shape = (-1,)
+        self.Hp.shape = (-1,)
+        self.u.shape = (-1,)
+
+        return self.Hp
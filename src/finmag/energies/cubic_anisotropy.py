@@ -101,7 +101,9 @@ class CubicAnisotropy(EnergyBase):
         if not self.assemble:
             self.H = self.m.get_numpy_array_debug()
             self.Ms = self.Ms.get_numpy_array_debug()
+            self.Hp = np.zeros(self.H.shape)
             self.compute_field = self.__compute_field_directly
+            self.compute_field_derivative = self.__compute_field_derivative_directly
 
     def __compute_field_directly(self):
 
@@ -115,3 +117,20 @@ class CubicAnisotropy(EnergyBase):
         self.H.shape = (-1,)
 
         return self.H
+
+    def __compute_field_derivative_directly(self, mp):
+        """
+        Return the derivative dH(m + a mp)/da at a = 0 for the current
+        magnetisation m and the direction `mp` (in dof order).
+
+        """
+        m = self.m.get_numpy_array_debug()
+
+        m.shape = (3, -1)
+        self.Hp.shape = (3, -1)
+        native_llg.compute_cubic_jtimes(
+            m, mp.reshape((3, -1)), self.Ms, self.Hp, self.uv, self.K1, self.K2, self.K3)
+        m.shape = (-1,)
+        self.Hp.shape = (-1,)
+
+        return self.Hp
@@ -0,0 +1,172 @@
+"""
+On-disk cache for boundary element matrices.
+
+Computing the dense boundary element matrix scales quadratically with the
+number of boundary nodes and can take minutes, although it only depends on
+the boundary mesh (and the macro geometry for periodic boundary conditions).
+The matrices are therefore stored as .npy files in a cache directory, keyed
+by a hash of everything they depend on, and loaded memory-mapped so that
+simulations running in parallel on the same mesh share the same pages.
+
+The least recently used entries are removed when the total size of the
+cache exceeds its limit. The cache is switched off by default and can be
+enabled and configured in the 'demag' section of the .finmagrc file:
+
+    [demag]
+    bem_cache = True
+    bem_cache_dir = ~/.finmag/bem_cache
+    # maximum size in MB
+    bem_cache_size = 4096
+
+"""
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
+from finmag.util import configuration
+
+logger = logging.getLogger('finmag')
+
+DEFAULT_CACHE_DIR = "~/.finmag/bem_cache"
+DEFAULT_CACHE_SIZE = 4096  # MB
+
+# Part of every key, so that entries computed by older code aren't used.
+# Increase this when the computation or the storage format of any of the
+# cached arrays changes.
+CACHE_VERSION = 1
+
+
+def boundary_mesh_hash(bmesh, kind, Ts=None, version=CACHE_VERSION):
+    """
+    Return a hash identifying the boundary element matrix of type `kind`
+    (e.g. 'fk') for the boundary mesh `bmesh` and the macro geometry
+    translations `Ts`, as computed by version `version` of the code. Besides
+    the coordinates and the triangles of the boundary mesh this includes the
+    map to the vertices of the volume mesh, which is returned together with
+    the matrix.
+
+    """
+    h = hashlib.sha1("{}-v{}".format(kind, version))
+    h.update(np.ascontiguousarray(bmesh.coordinates(), dtype=np.float).tostring())
+    h.update(np.ascontiguousarray(bmesh.cells(), dtype=np.int64).tostring())
+    h.update(np.ascontiguousarray(bmesh.entity_map(0).array(), dtype=np.int64).tostring())
+    if Ts is not None:
+        h.update(np.ascontiguousarray(Ts, dtype=np.float).tostring())
+    return h.hexdigest()
+
+
+class BEMCache(object):
+
+    """
+    A directory containing one subdirectory per cache entry, which holds
+    the arrays of that entry as .npy files. The modification time of the
+    subdirectory records when the entry was last used.
+
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        """
+        `directory` and `max_size` (in MB) default to the values of the
+        options 'bem_cache_dir' and 'bem_cache_size' in the 'demag' section
+        of the .finmagrc file.
+
+        """
+        if directory is None:
+            directory = configuration.get_config_option(
+                'demag', 'bem_cache_dir', DEFAULT_CACHE_DIR)
+        if max_size is None:
+            max_size = float(configuration.get_config_option(
+                'demag', 'bem_cache_size', DEFAULT_CACHE_SIZE))
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Return a dictionary with the (memory-mapped) arrays stored under
+        `key`, or None if there is no such entry.
+
+        """
+        entry = self._entry(key)
+        if not os.path.isdir(entry):
+            return None
+        try:
+            arrays = dict((filename[:-4], np.load(os.path.join(entry, filename), mmap_mode='r'))
+                          for filename in os.listdir(entry) if filename.endswith('.npy'))
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError) as e:
+            # e.g. removed by another process in the meantime
+            logger.debug("Could not read BEM cache entry {}: {}".format(entry, e))
+            return None
+        logger.debug("Loaded boundary element matrix from cache {}.".format(entry))
+        return arrays
+
+    def put(self, key, **arrays):
+        """
+        Store the given arrays under `key` and evict old entries if the
+        cache has become too large.
+
+        """
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # Write to a temporary directory first, so that other processes
+            # never see incomplete entries.
+            tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp_')
+            for name, array in arrays.iteritems():
+                np.save(os.path.join(tmp, name + '.npy'), array)
+            try:
+                os.rename(tmp, self._entry(key))
+            except OSError:
+                shutil.rmtree(tmp)  # stored by another process meanwhile
+        except (IOError, OSError) as e:
+            logger.warning("Could not write to BEM cache in {}: {}".format(self.directory, e))
+            return
+        logger.debug("Stored boundary element matrix in cache {}.".format(self._entry(key)))
+        self.evict()
+
+    def entries(self):
+        """
+        Return a list of (last use, size in bytes, key) of all entries,
+        least recently used first.
+
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for key in os.listdir(self.directory):
+            entry = self._entry(key)
+            if key.startswith('.') or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, key))
+            except OSError:
+                pass
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of the
+        cache is below its limit.
+
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self.max_size * 1024 ** 2:
+            _, size, key = entries.pop(0)
+            logger.debug("Removing BEM cache entry {} ({:.1f} MB).".format(key, size / 1024. ** 2))
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, key in self.entries():
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+
+
+def bem_cache_enabled():
+    return configuration.get_config_option('demag', 'bem_cache', 'False') == 'True'
@@ -0,0 +1,41 @@
+import os
+import time
+import numpy as np
+import dolfin as df
+from finmag.energies.demag.bem_cache import BEMCache, boundary_mesh_hash, CACHE_VERSION
+
+
+def test_bem_cache_stores_and_evicts_entries(tmpdir):
+    cache = BEMCache(directory=str(tmpdir), max_size=1.5)
+    a = np.random.random_sample((300, 300))  # 0.7 MB
+
+    assert cache.get('a') is None
+    cache.put('a', bem=a, b2g_map=np.arange(300))
+    cached = cache.get('a')
+    assert np.all(cached['bem'] == a)
+    assert np.all(cached['b2g_map'] == np.arange(300))
+
+    # Use 'a' after 'b' was stored, so that 'b' gets evicted when adding 'c'.
+    cache.put('b', bem=a)
+    os.utime(os.path.join(str(tmpdir), 'b'), (time.time() - 10, time.time() - 10))
+    cache.get('a')
+    cache.put('c', bem=a)
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
+    assert cache.get('c') is not None
+
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_boundary_mesh_hash():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(1, 1, 1), 2, 2, 2)
+    bmesh = df.BoundaryMesh(mesh, 'exterior', False)
+    other_bmesh = df.BoundaryMesh(df.BoxMesh(df.Point(0, 0, 0), df.Point(2, 1, 1), 2, 2, 2),
+                                  'exterior', False)
+
+    assert boundary_mesh_hash(bmesh, 'fk') == \
+        boundary_mesh_hash(df.BoundaryMesh(mesh, 'exterior', False), 'fk')
+    assert boundary_mesh_hash(bmesh, 'fk') != boundary_mesh_hash(other_bmesh, 'fk')
+    assert boundary_mesh_hash(bmesh, 'fk') != boundary_mesh_hash(bmesh, 'fk_pbc', [(0, 0, 0)])
+    assert boundary_mesh_hash(bmesh, 'fk') != boundary_mesh_hash(bmesh, 'fk', version=CACHE_VERSION + 1)
@@ -0,0 +1,83 @@
+"""
+Compare the dense boundary element matrix of the FK demag with its H-matrix
+approximation for thin films of increasing size: setup time, memory, time
+for one matrix-vector product and relative error of that product.
+
+"""
+import time
+import numpy as np
+import dolfin as df
+import matplotlib as mpl
+mpl.use("Agg")
+import matplotlib.pyplot as plt
+from finmag.energies.demag.fk_demag_pbc import BMatrixPBC
+
+now = time.time
+create_mesh = lambda n: df.BoxMesh(
+    df.Point(0, 0, 0), df.Point(4 * n, 2 * n, 2), 2 * n, n, 1)
+sizes = [10, 20, 30, 40, 60, 80]
+hmatrix_tols = [1e-3, 1e-4, 1e-5]
+repetitions = 10
+results_file = "results_hmatrix_benchmark.txt"
+
+
+def run(mesh, hmatrix_tol=None):
+    start = now()
+    bm = BMatrixPBC(mesh, hmatrix_tol=hmatrix_tol).bm
+    setup_time = now() - start
+    phi = np.random.random_sample(bm.shape[0])
+    start = now()
+    for j in xrange(repetitions):
+        y = bm.dot(phi)
+    matvec_time = (now() - start) / repetitions
+    return bm, y, phi, setup_time, matvec_time
+
+try:
+    results = np.loadtxt(results_file)
+except IOError:
+    results = []
+    for i, n in enumerate(sizes):
+        mesh = create_mesh(n)
+        print "Mesh {}/{} with {} vertices.".format(i + 1, len(sizes), mesh.num_vertices())
+        dense, _, _, setup_dense, _ = run(mesh)
+        for tol in hmatrix_tols:
+            hmatrix, y, phi, setup_hmatrix, matvec_hmatrix = run(mesh, tol)
+            start = now()
+            for j in xrange(repetitions):
+                y_dense = dense.dot(phi)
+            matvec_dense = (now() - start) / repetitions
+            error = np.linalg.norm(y - y_dense) / np.linalg.norm(y_dense)
+            print "tol={}: setup {:.2f}s vs {:.2f}s, memory {:.1%}, error {:.2g}".format(
+                tol, setup_hmatrix, setup_dense, hmatrix.compression_ratio, error)
+            results.append([dense.shape[0], tol, setup_dense, setup_hmatrix,
+                            dense.nbytes, hmatrix.nbytes, matvec_dense, matvec_hmatrix, error])
+        np.savetxt(results_file, results)  # Save results after every step.
+    results = np.array(results)
+
+fig = plt.figure(figsize=(8, 10))
+for k, (title, dense_col, hmatrix_col, ylabel) in enumerate([
+        ("Setup Time", 2, 3, "time (s)"),
+        ("Memory", 4, 5, "bytes"),
+        ("Matrix-Vector Product", 6, 7, "time (s)")]):
+    ax = fig.add_subplot(4, 1, k + 1)
+    ax.set_title(title)
+    dense = results[results[:, 1] == hmatrix_tols[0]]
+    ax.loglog(dense[:, 0], dense[:, dense_col], 'k-', label="dense")
+    for tol in hmatrix_tols:
+        r = results[results[:, 1] == tol]
+        ax.loglog(r[:, 0], r[:, hmatrix_col], label="H-matrix, tol={}".format(tol))
+    ax.legend(loc=2, fontsize=8)
+    ax.set_xlabel("boundary nodes")
+    ax.set_ylabel(ylabel)
+
+ax = fig.add_subplot(4, 1, 4)
+ax.set_title("Relative Error of the Matrix-Vector Product")
+for tol in hmatrix_tols:
+    r = results[results[:, 1] == tol]
+    ax.loglog(r[:, 0], r[:, 8], label="tol={}".format(tol))
+ax.legend(loc=2, fontsize=8)
+ax.set_xlabel("boundary nodes")
+ax.set_ylabel("relative error")
+
+fig.tight_layout()
+fig.savefig("results_hmatrix_benchmark.png")
@@ -0,0 +1,89 @@
+"""
+Strong scaling of the OpenMP-parallel treecode evaluation of the boundary
+potential (TreecodeBEM, type I and II) for thin films of increasing size,
+compared with the matrix-vector product with the dense boundary element
+matrix of the FK demag (which numpy/BLAS may run on several threads, too).
+
+"""
+import time
+import multiprocessing
+import numpy as np
+import dolfin as df
+import matplotlib as mpl
+mpl.use("Agg")
+import matplotlib.pyplot as plt
+from finmag.field import Field
+from finmag.energies.demag import TreecodeBEM
+from finmag.energies.demag.fk_demag_pbc import BMatrixPBC
+from finmag.native.treecode_bem import set_openmp_threads, get_openmp_threads
+
+now = time.time
+create_mesh = lambda n: df.BoxMesh(
+    df.Point(0, 0, 0), df.Point(4 * n, 2 * n, 2), 2 * n, n, 1)
+sizes = [20, 40, 60, 80]
+max_threads = multiprocessing.cpu_count()
+threads = [t for t in [1, 2, 4, 8, 16, 32, 64] if t <= max_threads]
+repetitions = 10
+results_file = "results_treecode_benchmark.txt"
+
+
+def setup_treecode(mesh, type_I):
+    S3 = df.VectorFunctionSpace(mesh, "Lagrange", 1)
+    m = Field(S3, value=(1, 0, 0))
+    Ms = Field(df.FunctionSpace(mesh, "DG", 0), value=1)
+    demag = TreecodeBEM(mac=0.3, p=3, num_limit=100, correct_factor=10, type_I=type_I)
+    demag.setup(m, Ms, unit_length=1e-9)
+    return demag
+
+
+def time_fastsum(demag, phi_1):
+    phi_2 = np.zeros(len(phi_1))
+    demag.fast_sum.fastsum(phi_2, phi_1)  # warm up, allocates the moments
+    start = now()
+    for j in xrange(repetitions):
+        demag.fast_sum.fastsum(phi_2, phi_1)
+    return (now() - start) / repetitions, phi_2
+
+try:
+    results = np.loadtxt(results_file)
+except IOError:
+    default_threads = get_openmp_threads()
+    results = []
+    for i, n in enumerate(sizes):
+        mesh = create_mesh(n)
+        dense = BMatrixPBC(mesh).bm
+        print "Mesh {}/{} with {} boundary nodes.".format(i + 1, len(sizes), dense.shape[0])
+        phi_1 = np.random.random_sample(dense.shape[0])
+        start = now()
+        for j in xrange(repetitions):
+            y_dense = dense.dot(phi_1)
+        matvec_dense = (now() - start) / repetitions
+
+        for type_I in [True, False]:
+            demag = setup_treecode(mesh, type_I)
+            for t in threads:
+                set_openmp_threads(t)
+                runtime, y = time_fastsum(demag, phi_1)
+                error = np.linalg.norm(y - y_dense) / np.linalg.norm(y_dense)
+                print "type {}, {} threads: {:.3g}s (dense {:.3g}s), error {:.2g}".format(
+                    "I" if type_I else "II", t, runtime, matvec_dense, error)
+                results.append([dense.shape[0], int(type_I), t, runtime, matvec_dense, error])
+            np.savetxt(results_file, results)  # Save results after every step.
+    set_openmp_threads(default_threads)
+    results = np.array(results)
+
+fig = plt.figure(figsize=(8, 8))
+for k, type_I in enumerate([1, 0]):
+    ax = fig.add_subplot(2, 1, k + 1)
+    ax.set_title("Treecode Type {}".format("I" if type_I else "II"))
+    r_type = results[results[:, 1] == type_I]
+    for n in np.unique(r_type[:, 0]):
+        r = r_type[r_type[:, 0] == n]
+        lines = ax.loglog(r[:, 2], r[:, 3], 'o-', label="{:d} nodes".format(int(n)))
+        ax.axhline(r[0, 4], color=lines[0].get_color(), linestyle='--')
+    ax.legend(loc=1, fontsize=8)
+    ax.set_xlabel("OpenMP threads")
+    ax.set_ylabel("time per evaluation (s)")
+
+fig.tight_layout()
+fig.savefig("results_treecode_benchmark.png")
@@ -18,6 +18,7 @@ from finmag.util.meshes import nodal_volume
 from finmag.util import helpers, configuration
 from finmag.field import Field
 from fk_demag_pbc import BMatrixPBC
+from bem_cache import BEMCache, boundary_mesh_hash, bem_cache_enabled
 
 
 logger = logging.getLogger('finmag')
@@ -40,7 +41,8 @@ class FKDemag(object):
     """
 
     def __init__(self, name='Demag', thin_film=False, macrogeometry=None,
-                 solver_type=None, parameters=None):
+                 solver_type=None, parameters=None, hmatrix_tol=None,
+                 warm_start=False):
         """
         Create a new FKDemag instance.
 
@@ -68,6 +70,22 @@ class FKDemag(object):
         latter uses the value set in the .finmagrc file, defaulting to 'Krylov'
         as no value is provided there).
 
+        Compressing the boundary element matrix:
+        The dense boundary element matrix needs memory and time proportional
+        to the square of the number of boundary nodes. If `hmatrix_tol` is
+        given, it is replaced by a hierarchical matrix approximation (see
+        `finmag.energies.demag.hmatrix`) with this relative accuracy, e.g.
+        1e-4, which makes simulations with many surface nodes feasible.
+
+        Reusing the previous solutions:
+        The magnetisation changes only a little between consecutive calls of
+        `compute_field` during a time integration. If `warm_start` is True,
+        the Krylov solvers start from the potentials phi_1 and phi_2 of the
+        previous call instead of zero (this sets 'nonzero_initial_guess' in
+        `phi_1` and `phi_2`). The number of iterations needed by the Krylov
+        solvers is accumulated in the attribute `krylov_iterations`; divide
+        by the number of calls reported by `fk_timer` to get the average.
+
         """
         self.name = name
         self.in_jacobian = False
@@ -105,7 +123,13 @@ class FKDemag(object):
             self.parameters["phi_1_preconditioner"] = "ilu"
             self.parameters["phi_2_preconditioner"] = "none"
 
+        if warm_start:
+            self.parameters['phi_1']['nonzero_initial_guess'] = True
+            self.parameters['phi_2']['nonzero_initial_guess'] = True
+
         self.macrogeometry = macrogeometry
+        self.hmatrix_tol = hmatrix_tol
+        self.krylov_iterations = {'phi_1': 0, 'phi_2': 0}
 
     @timer.method
     def setup(self, m, Ms, unit_length=1):
@@ -154,7 +178,7 @@ class FKDemag(object):
 
         # for computation of field and scalar magnetic potential
         self._poisson_matrix = self._poisson_matrix()
-        self._laplace_zeros = df.Function(self.S1).vector()
+        self._laplace_rhs = df.Function(self.S1).vector()
 
         # determine the solver type to be used (Krylov or LU); if the kwarg
         # 'solver_type' is not provided, try to read the setting from the
@@ -168,6 +192,7 @@ class FKDemag(object):
                                    # string so we need to catch this here.
             solver_type = 'Krylov'
         logger.debug("Using {} solver for demag.".format(solver_type))
+        self._count_iterations = solver_type == 'Krylov'
 
         if solver_type == 'Krylov':
             self._poisson_solver = df.KrylovSolver(self._poisson_matrix.copy(),
@@ -176,11 +201,6 @@ class FKDemag(object):
             self._laplace_solver = df.KrylovSolver(
                 self.parameters['phi_2_solver'], self.parameters['phi_2_preconditioner'])
             self._laplace_solver.parameters.update(self.parameters['phi_2'])
-            # We're setting 'same_nonzero_pattern=True' to enforce the
-            # same matrix sparsity pattern across different demag solves,
-            # which should speed up things.
-            #self._laplace_solver.parameters["preconditioner"][
-            #    "structure"] = "same_nonzero_pattern"
         elif solver_type == 'LU':
             self._poisson_solver = df.LUSolver(self._poisson_matrix.copy())
             self._laplace_solver = df.LUSolver()
@@ -192,14 +212,7 @@ class FKDemag(object):
 
         with fk_timer('compute BEM'):
             if not hasattr(self, "_bem"):
-                if self.macrogeometry is not None:
-                    Ts = self.macrogeometry.compute_Ts(self.m.mesh())
-                    pbc = BMatrixPBC(self.m.mesh(), Ts)
-                    self._b2g_map = np.array(pbc.b2g_map, dtype=np.int)
-                    self._bem = pbc.bm
-                else:
-                    self._bem, self._b2g_map = compute_bem_fk(
-                        df.BoundaryMesh(self.m.mesh(), 'exterior', False))
+                self._bem, self._b2g_map = self._compute_bem()
         logger.debug("Boundary element matrix uses {:.2f} MB of memory.".format(
             self._bem.nbytes / 1024. ** 2))
         # solution of inhomogeneous Neumann problem
@@ -219,15 +232,57 @@ class FKDemag(object):
         self.boundary_condition = df.DirichletBC(
             self.S1, self._phi_2, df.DomainBoundary())
         self.boundary_condition.apply(self._poisson_matrix)
+        # The rows of the boundary dofs are now those of the identity matrix,
+        # so the operator of the Laplace problem never changes and the solver
+        # can keep its preconditioner (or LU factorisation). Only the boundary
+        # values of the right hand side have to be updated for each solve.
+        self._laplace_solver.set_operator(self._poisson_matrix)
+        self._boundary_dofs = np.array(
+            sorted(self.boundary_condition.get_boundary_values().keys()), dtype=np.intc)
 
         self._setup_gradient_computation()
 
+    def _compute_bem(self):
+        """
+        Compute the boundary element matrix and the boundary to global
+        vertices map. Dense matrices are taken from (and added to) the
+        on-disk cache in `bem_cache` if it is enabled in the .finmagrc file.
+
+        """
+        mesh = self.m.mesh()
+        Ts = None
+        if self.macrogeometry is not None:
+            Ts = self.macrogeometry.compute_Ts(mesh)
+
+        if self.hmatrix_tol is not None:
+            pbc = BMatrixPBC(mesh, [(0., 0, 0)] if Ts is None else Ts, self.hmatrix_tol)
+            return pbc.bm, np.array(pbc.b2g_map, dtype=np.int)
+
+        cache = None
+        if bem_cache_enabled():
+            cache = BEMCache()
+            key = boundary_mesh_hash(df.BoundaryMesh(mesh, 'exterior', False),
+                                     'fk' if Ts is None else 'fk_pbc', Ts)
+            cached = cache.get(key)
+            if cached is not None and 'bem' in cached and 'b2g_map' in cached:
+                return cached['bem'], np.array(cached['b2g_map'])
+
+        if Ts is None:
+            bem, b2g_map = compute_bem_fk(df.BoundaryMesh(mesh, 'exterior', False))
+        else:
+            pbc = BMatrixPBC(mesh, Ts)
+            bem, b2g_map = pbc.bm, np.array(pbc.b2g_map, dtype=np.int)
+
+        if cache is not None:
+            cache.put(key, bem=bem, b2g_map=b2g_map)
+        return bem, b2g_map
+
     @timer.method
     def precomputed_bem(self, bem, b2g_map):
         """
         If the BEM and a boundary to global vertices map are known, they can be
         passed to the FKDemag object with this method so it will skip
-        re-computing them.
+        re-computing them. The BEM can be a dense numpy array or an HMatrix.
 
         """
         self._bem, self._b2g_map = bem, b2g_map
@@ -282,6 +337,96 @@ class FKDemag(object):
         self._H_func.vector()[:] = self.compute_field()
         return df.assemble(self._E) * self.unit_length ** self.m.mesh_dim()
 
+    @timer.method
+    def compute_field_batch(self, ms):
+        """
+        Compute the demagnetising fields of several magnetisations at once,
+        e.g. of all images of an energy band.
+
+        The products with the divergence, boundary element and gradient
+        matrices are computed for all magnetisations together, which for
+        the dense boundary element matrix means one matrix-matrix product
+        instead of many matrix-vector products. The two linear systems are
+        solved for one right hand side after the other by the same solvers,
+        which keep their preconditioners (or LU factorisations) because the
+        matrices don't change.
+
+        *Arguments*
+            ms: numpy.ndarray
+                Array of shape (k, n) with one magnetisation per row, in
+                the order of the degrees of freedom of m. The
+                magnetisation of this object is not used or changed, and
+                neither are the potentials of the last call of
+                compute_field, which the linear solvers start from.
+
+        *Returns*
+            numpy.ndarray
+                The k demagnetising fields, array of shape (k, n).
+
+        """
+        if not hasattr(self, "_divergence_csr"):
+            self._setup_batch_computation()
+
+        phi_1_saved = self._phi_1.vector().copy()
+        phi_2_saved = self._phi_2.vector().copy()
+
+        g_1 = self._divergence_csr.dot(ms.T)
+        phi = np.empty(g_1.shape)
+        b = self._phi_1.vector().copy()
+        for j in xrange(len(ms)):
+            b.set_local(g_1[:, j])
+            b.apply("insert")
+            with fk_timer("first linear solve"):
+                iterations = self._poisson_solver.solve(self._phi_1.vector(), b)
+            if self._count_iterations:
+                self.krylov_iterations['phi_1'] += iterations
+            phi[:, j] = self._phi_1.vector().array()
+
+        with fk_timer("using boundary conditions"):
+            phi_2_boundary = self._bem.dot(phi[self._b2g_map])
+
+        b = self._laplace_rhs
+        for j in xrange(len(ms)):
+            self._phi_2.vector()[self._b2g_map[:]] = phi_2_boundary[:, j]
+            b[self._boundary_dofs] = self._phi_2.vector()[self._boundary_dofs]
+            with fk_timer("second linear solve"):
+                iterations = self._laplace_solver.solve(self._phi_2.vector(), b)
+            if self._count_iterations:
+                self.krylov_iterations['phi_2'] += iterations
+            phi[:, j] += self._phi_2.vector().array()
+
+        self._phi_1.vector()[:] = phi_1_saved
+        self._phi_2.vector()[:] = phi_2_saved
+
+        H = self._gradient_csr.dot(phi) / self._nodal_volumes_S3_no_units[:, np.newaxis]
+        return H.T.copy()
+
+    def compute_energy_batch(self, ms, H):
+        """
+        Return the energies belonging to the magnetisations `ms` and their
+        demagnetising fields `H` (both arrays of shape (k, n), see
+        compute_field_batch) as an array of length k, without computing
+        the fields again.
+
+        """
+        if not hasattr(self, "_energy_matrix"):
+            self._setup_batch_computation()
+        WM = self._energy_matrix.dot(ms.T).T
+        return -0.5 * mu0 * np.sum(H * WM, axis=1) * self.unit_length ** self.m.mesh_dim()
+
+    def _setup_batch_computation(self):
+        """
+        Copy the matrices which are applied to the magnetisation and the
+        potential into scipy matrices, which can be multiplied with several
+        vectors at once, and assemble the mass matrix W weighted with Ms,
+        for which the energy is -0.5 mu0 H^T W m.
+
+        """
+        self._divergence_csr = helpers.petsc_matrix_to_csr(self._Ms_times_divergence)
+        self._gradient_csr = helpers.petsc_matrix_to_csr(self._gradient)
+        W = df.assemble(self.Ms.f * df.dot(self._trial3, self._test3) * df.dx)
+        self._energy_matrix = helpers.petsc_matrix_to_csr(W)
+
     @timer.method
     def energy_density(self):
         """
@@ -324,26 +469,23 @@ class FKDemag(object):
         # compute _phi_1 on the whole domain
         g_1 = self._Ms_times_divergence * self.m.f.vector()
         with fk_timer("first linear solve"):
-            self._poisson_solver.solve(self._phi_1.vector(), g_1)
+            iterations = self._poisson_solver.solve(self._phi_1.vector(), g_1)
+        if self._count_iterations:
+            self.krylov_iterations['phi_1'] += iterations
 
         # compute _phi_2 on the boundary using the Dirichlet boundary
         # conditions we get from BEM * _phi_1 on the boundary.
         with fk_timer("using boundary conditions"):
             phi_1 = self._phi_1.vector()[self._b2g_map]
-            self._phi_2.vector()[self._b2g_map[:]] = np.dot(
-                self._bem, phi_1)
-            #boundary_condition = df.DirichletBC(self.S1, self._phi_2, df.DomainBoundary())
-            #A = self._poisson_matrix.copy()
-            #b = self._laplace_zeros
-            #boundary_condition.apply(A, b)
-            A = self._poisson_matrix
-            b = self._laplace_zeros
-            self.boundary_condition.set_value(self._phi_2)
-            self.boundary_condition.apply(A, b)
+            self._phi_2.vector()[self._b2g_map[:]] = self._bem.dot(phi_1)
+            b = self._laplace_rhs
+            b[self._boundary_dofs] = self._phi_2.vector()[self._boundary_dofs]
 
         # compute _phi_2 on the whole domain
         with fk_timer("second linear solve"):
-            self._laplace_solver.solve(A, self._phi_2.vector(), b)
+            iterations = self._laplace_solver.solve(self._phi_2.vector(), b)
+        if self._count_iterations:
+            self.krylov_iterations['phi_2'] += iterations
 
         # add _phi_1 and _phi_2 to obtain magnetic potential
         self._phi.vector()[:] = self._phi_1.vector() + self._phi_2.vector()
@@ -17,6 +17,10 @@ class Demag2D(FKDemag):
     given 2d mesh.
     """
 
+    # The magnetisation has to be extruded to the 3d mesh first, which is
+    # only implemented for one magnetisation at a time.
+    compute_field_batch = None
+
     def __init__(self, name='Demag2D', thickness=1, thin_film=False):
 
         self.name = name
@@ -11,9 +11,11 @@ a template for other techniques like the GCR.
 import logging
 import numpy as np
 import dolfin as df
-from finmag.native.treecode_bem import compute_solid_angle_single
+from finmag.native.treecode_bem import compute_vertex_solid_angles
 from finmag.native.treecode_bem import compute_boundary_element
 from finmag.native.treecode_bem import build_boundary_matrix
+from finmag.native.treecode_bem import build_boundary_matrix_block
+from hmatrix import HMatrix
 
 logger = logging.getLogger('finmag')
 
@@ -74,7 +76,16 @@ class MacroGeometry(object):
 
 class BMatrixPBC(object):
 
-    def __init__(self, mesh, Ts=[(0., 0, 0)]):
+    def __init__(self, mesh, Ts=[(0., 0, 0)], hmatrix_tol=None):
+        """
+        Compute the boundary element matrix `bm` for the boundary of `mesh`
+        including the contributions of the copies of the geometry shifted
+        by the translation vectors `Ts`.
+
+        If `hmatrix_tol` is not None, `bm` is an `HMatrix` approximating
+        the dense matrix with the given relative accuracy instead.
+
+        """
         self.mesh = mesh
         self.bmesh = df.BoundaryMesh(self.mesh, 'exterior', False)
         self.b2g_map = self.bmesh.entity_map(0).array()
@@ -83,26 +94,14 @@ class BMatrixPBC(object):
         #self.g2b_map[val] = i
         self.__compute_bsa()
         self.Ts = np.array(Ts, dtype=np.float)
+        self.hmatrix_tol = hmatrix_tol
 
-        n = self.bmesh.num_vertices()
-        self.bm = np.zeros((n, n))
         self.compute_bmatrix()
 
     def __compute_bsa(self):
 
-        vert_bsa = np.zeros(self.mesh.num_vertices())
-
-        mc = self.mesh.cells()
-        xyz = self.mesh.coordinates()
-        for i in range(self.mesh.num_cells()):
-            for j in range(4):
-                tmp_omega = compute_solid_angle_single(
-                    xyz[mc[i][j]],
-                    xyz[mc[i][(j + 1) % 4]],
-                    xyz[mc[i][(j + 2) % 4]],
-                    xyz[mc[i][(j + 3) % 4]])
-
-                vert_bsa[mc[i][j]] += tmp_omega
+        vert_bsa = compute_vertex_solid_angles(
+            self.mesh.coordinates(), np.array(self.mesh.cells(), dtype=np.int32))
 
         vert_bsa = vert_bsa / (4 * np.pi) - 1.0
 
@@ -126,12 +125,47 @@ class BMatrixPBC(object):
                 self.bm[p][j] += be[1]
                 self.bm[p][k] += be[2]
 
+    def __compute_node_faces(self, n_nodes, face_nodes):
+        """
+        Store the faces around each node in compressed sparse row form: the
+        faces touching node i are _node_faces[_node_face_ptr[i]:_node_face_ptr[i + 1]].
+
+        """
+        nodes = face_nodes.ravel()
+        self._node_faces = np.array(
+            np.argsort(nodes, kind='mergesort') // 3, dtype=np.int32)
+        self._node_face_ptr = np.zeros(n_nodes + 1, dtype=np.int32)
+        self._node_face_ptr[1:] = np.cumsum(np.bincount(nodes, minlength=n_nodes))
+
+    def compute_bmatrix_block(self, rows, cols):
+        """
+        Compute the entries bm[rows, cols] of the boundary element matrix.
+
+        """
+        block = np.zeros((len(rows), len(cols)))
+        for T in self.Ts:
+            build_boundary_matrix_block(
+                self._coordinates, self._face_nodes, self._node_face_ptr,
+                self._node_faces, block, T, rows, cols)
+
+        diagonal = np.nonzero(rows[:, np.newaxis] == cols)
+        block[diagonal] += self.vert_bsa[rows[diagonal[0]]]
+        return block
+
     def compute_bmatrix(self):
 
         cds = self.bmesh.coordinates()
         face_nodes = np.array(self.bmesh.cells(), dtype=np.int32)
 
-        self.bm[:, :] = 0.0
+        if self.hmatrix_tol is not None:
+            self._coordinates, self._face_nodes = cds, face_nodes
+            self.__compute_node_faces(len(cds), face_nodes)
+            self.bm = HMatrix(cds, self.compute_bmatrix_block,
+                              tol=self.hmatrix_tol, translations=self.Ts)
+            return
+
+        n = self.bmesh.num_vertices()
+        self.bm = np.zeros((n, n))
 
         for T in self.Ts:
             build_boundary_matrix(
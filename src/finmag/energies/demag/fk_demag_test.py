@@ -146,3 +146,39 @@ def test_regression_Ms_numpy_type():
     demag = FKDemag()
     Ms_field = Field(df.FunctionSpace(mesh, 'DG', 0), Ms)
     demag.setup(m, Ms_field, unit_length)  # this used to fail
+
+
+def test_warm_start_reuses_previous_potential():
+    mesh = sphere(r=radius, maxh=maxh)
+    Ms = Field(df.FunctionSpace(mesh, 'DG', 0), 1)
+    S3 = df.VectorFunctionSpace(mesh, "Lagrange", 1)
+    m = Field(S3, value=df.Constant((1, 0, 0)))
+
+    demags = [FKDemag(solver_type='Krylov'), FKDemag(solver_type='Krylov', warm_start=True)]
+    for demag in demags:
+        demag.setup(m, Ms, unit_length)
+        demag.compute_field()
+
+    m.set(df.Constant((0.99, 0.1, 0.0)))
+    iterations = []
+    for demag in demags:
+        before = sum(demag.krylov_iterations.values())
+        demag.compute_field()
+        iterations.append(sum(demag.krylov_iterations.values()) - before)
+
+    assert np.allclose(demags[0].compute_field(), demags[1].compute_field(), atol=1e-4)
+    assert iterations[1] < iterations[0]
+
+
+def test_batch_computation_leaves_potentials_unchanged():
+    demag = setup_demag_sphere(1)
+    H = demag.compute_field()
+    phi_1 = demag._phi_1.vector().array().copy()
+    phi_2 = demag._phi_2.vector().array().copy()
+
+    ms = np.array([demag.m.get_numpy_array_debug(), -demag.m.get_numpy_array_debug()])
+    H_batch = demag.compute_field_batch(ms)
+    assert np.allclose(H_batch[0], H, atol=1e-8)
+    assert np.allclose(H_batch[1], -H, atol=1e-8)
+    assert np.allclose(demag._phi_1.vector().array(), phi_1)
+    assert np.allclose(demag._phi_2.vector().array(), phi_2)
@@ -0,0 +1,272 @@
+"""
+Hierarchical matrix (H-matrix) approximation of the boundary element matrix
+used by the Fredkin-Koehler demag.
+
+The dense boundary element matrix couples every pair of boundary nodes, so
+both its memory footprint and the cost of one matrix-vector product grow
+quadratically with the number of boundary nodes. However, the entries that
+couple two groups of nodes which are far apart from each other vary smoothly
+and such a block can be represented by a low rank product U V. Here the
+boundary nodes are sorted into a cluster tree (recursive bisection of their
+bounding box), blocks of well separated clusters are compressed with the
+adaptive cross approximation (ACA) and only the remaining near-field blocks
+are stored as dense matrices.
+
+Bebendorf, M., "Approximation of boundary element matrices", Numerische
+Mathematik 86, 565-589 (2000).
+
+"""
+import logging
+import numpy as np
+
+logger = logging.getLogger('finmag')
+
+
+class Cluster(object):
+
+    """
+    A node of the cluster tree. The nodes belonging to the cluster are
+    perm[start:stop], where perm is the permutation of the whole tree.
+
+    """
+
+    def __init__(self, start, stop, bbox_min, bbox_max):
+        self.start = start
+        self.stop = stop
+        self.bbox_min = bbox_min
+        self.bbox_max = bbox_max
+        self.diameter = np.linalg.norm(bbox_max - bbox_min)
+        self.children = []
+
+    @property
+    def size(self):
+        return self.stop - self.start
+
+    def is_leaf(self):
+        return len(self.children) == 0
+
+
+def build_cluster_tree(coords, leaf_size=32):
+    """
+    Recursively bisect the point set `coords` (array of shape (n, 3)) along
+    the longest edge of its bounding box until at most `leaf_size` points
+    are left in each cluster.
+
+    Returns the root cluster and the permutation `perm` of the points which
+    makes all clusters contiguous.
+
+    """
+    perm = np.arange(len(coords))
+
+    def bisect(start, stop):
+        pts = coords[perm[start:stop]]
+        cluster = Cluster(start, stop, pts.min(axis=0), pts.max(axis=0))
+        if cluster.size > leaf_size:
+            axis = np.argmax(cluster.bbox_max - cluster.bbox_min)
+            order = np.argsort(pts[:, axis], kind='mergesort')
+            perm[start:stop] = perm[start:stop][order]
+            middle = start + cluster.size // 2
+            cluster.children = [bisect(start, middle), bisect(middle, stop)]
+        return cluster
+
+    root = bisect(0, len(coords))
+    return root, perm
+
+
+def cluster_distance(t, s, translations):
+    """
+    Distance between the bounding boxes of the clusters `t` and `s`, where
+    the minimum is taken over all copies of `s` shifted by `translations`.
+
+    """
+    d = np.inf
+    for T in translations:
+        gap = np.maximum(0, np.maximum(t.bbox_min - (s.bbox_max + T),
+                                       (s.bbox_min + T) - t.bbox_max))
+        d = min(d, np.linalg.norm(gap))
+    return d
+
+
+def adaptive_cross_approximation(get_row, get_column, shape, tol, max_rank=None):
+    """
+    Approximate the matrix of the given `shape` by the product U.dot(V)
+    using the partially pivoted adaptive cross approximation. Only the rows
+    and columns requested through `get_row(i)` and `get_column(j)` are
+    evaluated.
+
+    The iteration stops when the norm of the last rank-one update drops
+    below `tol` times the estimated Frobenius norm of the approximation.
+
+    Returns (U, V), or None if `max_rank` was reached without meeting the
+    tolerance.
+
+    """
+    m, n = shape
+    if max_rank is None:
+        max_rank = min(m, n)
+    us, vs = [], []
+    norm_sq = 0.0
+    unused_rows = np.ones(m, dtype=bool)
+    i = 0
+    while len(us) < max_rank:
+        unused_rows[i] = False
+        row = get_row(i)
+        for u, v in zip(us, vs):
+            row -= u[i] * v
+        j = np.argmax(np.abs(row))
+        if row[j] == 0:
+            # this row is already approximated exactly, try another one
+            if not unused_rows.any():
+                break
+            i = np.argmax(unused_rows)
+            continue
+        v_new = row / row[j]
+        u_new = get_column(j)
+        for u, v in zip(us, vs):
+            u_new -= v[j] * u
+
+        u_norm_sq = np.dot(u_new, u_new)
+        v_norm_sq = np.dot(v_new, v_new)
+        for u, v in zip(us, vs):
+            norm_sq += 2 * np.dot(u, u_new) * np.dot(v, v_new)
+        norm_sq += u_norm_sq * v_norm_sq
+        us.append(u_new)
+        vs.append(v_new)
+
+        if u_norm_sq * v_norm_sq <= tol ** 2 * norm_sq or not unused_rows.any():
+            return np.array(us).T.copy(), np.array(vs)
+
+        candidates = np.where(unused_rows, np.abs(u_new), -1)
+        i = np.argmax(candidates)
+
+    if len(us) == 0:
+        return np.zeros((m, 0)), np.zeros((0, n))
+    return None
+
+
+class HMatrix(object):
+
+    """
+    H-matrix approximation of a square matrix whose entries are associated
+    with pairs of points in space.
+
+    *Arguments*
+
+    coords: numpy.ndarray
+
+        Coordinates of the points, array of shape (n, 3).
+
+    compute_block: callable
+
+        compute_block(rows, cols) must return the dense sub-matrix
+        A[rows, cols] for the integer arrays `rows` and `cols`.
+
+    tol: float
+
+        Relative accuracy of the low rank approximation of each
+        admissible block.
+
+    eta: float
+
+        Admissibility parameter. Two clusters are approximated by a low rank
+        block if min(diam_t, diam_s) <= eta * dist(t, s).
+
+    leaf_size: int
+
+        Maximum number of points in the leaves of the cluster tree.
+
+    translations: list
+
+        If the matrix describes a periodic arrangement of copies of the
+        geometry (see `MacroGeometry`), the translation vectors of these
+        copies are needed to decide which clusters are well separated.
+
+    """
+
+    def __init__(self, coords, compute_block, tol=1e-4, eta=2.0, leaf_size=32,
+                 translations=((0, 0, 0),)):
+        self.coords = np.asarray(coords, dtype=np.float)
+        self.compute_block = compute_block
+        self.tol = tol
+        self.eta = eta
+        self.leaf_size = leaf_size
+        self.translations = np.array(translations, dtype=np.float)
+        self.shape = (len(coords), len(coords))
+
+        self.root, self.perm = build_cluster_tree(self.coords, leaf_size)
+        self.dense_blocks = []
+        self.low_rank_blocks = []
+        self._build_blocks(self.root, self.root)
+
+        logger.debug("H-matrix with {} dense and {} low rank blocks (maximum "
+                     "rank {}) uses {:.1%} of the memory of the dense matrix.".format(
+                         len(self.dense_blocks), len(self.low_rank_blocks),
+                         self.max_rank, self.compression_ratio))
+
+    def _is_admissible(self, t, s):
+        distance = cluster_distance(t, s, self.translations)
+        return min(t.diameter, s.diameter) <= self.eta * distance
+
+    def _build_blocks(self, t, s):
+        rows = self.perm[t.start:t.stop].astype(np.int32)
+        cols = self.perm[s.start:s.stop].astype(np.int32)
+        if self._is_admissible(t, s):
+            UV = adaptive_cross_approximation(
+                lambda i: self.compute_block(rows[i:i + 1], cols)[0],
+                lambda j: self.compute_block(rows, cols[j:j + 1])[:, 0],
+                (t.size, s.size), self.tol,
+                max_rank=t.size * s.size // (t.size + s.size))
+            if UV is not None:
+                self.low_rank_blocks.append((t, s) + UV)
+                return
+        if not (t.is_leaf() or s.is_leaf()):
+            for t_child in t.children:
+                for s_child in s.children:
+                    self._build_blocks(t_child, s_child)
+            return
+        # near field, or a low rank approximation would not save memory
+        self.dense_blocks.append((t, s, self.compute_block(rows, cols)))
+
+    @property
+    def nbytes(self):
+        return sum(D.nbytes for _, _, D in self.dense_blocks) + \
+            sum(U.nbytes + V.nbytes for _, _, U, V in self.low_rank_blocks)
+
+    @property
+    def compression_ratio(self):
+        return self.nbytes / (8.0 * self.shape[0] * self.shape[1])
+
+    @property
+    def max_rank(self):
+        return max([U.shape[1] for _, _, U, _ in self.low_rank_blocks] or [0])
+
+    def dot(self, x):
+        """
+        Compute the matrix-vector product with the vector `x`, or the
+        product with the matrix `x` whose columns are several vectors.
+
+        """
+        x_perm = x[self.perm]
+        y_perm = np.zeros((self.shape[0],) + x.shape[1:])
+        for t, s, D in self.dense_blocks:
+            y_perm[t.start:t.stop] += D.dot(x_perm[s.start:s.stop])
+        for t, s, U, V in self.low_rank_blocks:
+            y_perm[t.start:t.stop] += U.dot(V.dot(x_perm[s.start:s.stop]))
+        y = np.empty_like(y_perm)
+        y[self.perm] = y_perm
+        return y
+
+    def to_dense(self):
+        """
+        Return the approximated matrix as a dense numpy array. Useful for
+        comparisons with the exact matrix on small problems only.
+
+        """
+        A_perm = np.zeros(self.shape)
+        for t, s, D in self.dense_blocks:
+            A_perm[t.start:t.stop, s.start:s.stop] = D
+        for t, s, U, V in self.low_rank_blocks:
+            A_perm[t.start:t.stop, s.start:s.stop] = U.dot(V)
+        A = np.empty_like(A_perm)
+        A[np.ix_(self.perm, self.perm)] = A_perm
+        return A
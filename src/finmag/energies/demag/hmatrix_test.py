@@ -0,0 +1,53 @@
+import numpy as np
+import dolfin as df
+from finmag.energies.demag.hmatrix import HMatrix, adaptive_cross_approximation
+from finmag.energies.demag.fk_demag import FKDemag
+from finmag.energies.demag.fk_demag_pbc import BMatrixPBC
+from finmag.field import Field
+
+
+def test_aca_of_smooth_kernel():
+    x = np.linspace(0, 1, 50)
+    y = np.linspace(5, 6, 40)
+    A = 1.0 / np.abs(x[:, np.newaxis] - y)
+    U, V = adaptive_cross_approximation(
+        lambda i: A[i].copy(), lambda j: A[:, j].copy(), A.shape, tol=1e-8)
+    assert U.shape[1] < 10
+    assert np.linalg.norm(U.dot(V) - A) < 1e-7 * np.linalg.norm(A)
+
+
+def test_hmatrix_agrees_with_dense_boundary_matrix():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(100, 60, 2), 50, 30, 1)
+    tol = 1e-4
+    dense = BMatrixPBC(mesh).bm
+    hmatrix = BMatrixPBC(mesh, hmatrix_tol=tol).bm
+
+    assert hmatrix.nbytes < 0.5 * dense.nbytes
+    assert np.linalg.norm(hmatrix.to_dense() - dense) < 10 * tol * np.linalg.norm(dense)
+
+    phi = np.random.random_sample(dense.shape[0])
+    assert np.allclose(hmatrix.dot(phi), dense.dot(phi), rtol=0, atol=10 * tol * np.abs(dense.dot(phi)).max())
+
+
+def test_fk_demag_with_hmatrix():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(100, 60, 2), 50, 30, 1)
+    S3 = df.VectorFunctionSpace(mesh, "Lagrange", 1)
+    m = Field(S3, value=df.Constant((0.6, 0.8, 0)))
+    Ms = Field(df.FunctionSpace(mesh, 'DG', 0), 8.6e5)
+
+    fields = []
+    for hmatrix_tol in [None, 1e-5]:
+        demag = FKDemag(hmatrix_tol=hmatrix_tol)
+        demag.setup(m, Ms, unit_length=1e-9)
+        fields.append(demag.compute_field())
+    H_dense, H_hmatrix = fields
+    assert np.max(np.abs(H_hmatrix - H_dense)) < 1e-3 * np.max(np.abs(H_dense))
+
+
+def test_hmatrix_product_with_several_vectors():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(40, 20, 2), 20, 10, 1)
+    hmatrix = BMatrixPBC(mesh, hmatrix_tol=1e-4).bm
+    X = np.random.random_sample((hmatrix.shape[0], 3))
+    Y = hmatrix.dot(X)
+    for j in range(3):
+        assert np.allclose(Y[:, j], hmatrix.dot(X[:, j]))
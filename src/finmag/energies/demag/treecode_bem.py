@@ -6,16 +6,21 @@ from finmag.field import Field
 from finmag.util.consts import mu0
 from finmag.util.meshes import nodal_volume
 from finmag.native.treecode_bem import FastSum
-from finmag.native.treecode_bem import compute_solid_angle_single
+from finmag.native.treecode_bem import compute_vertex_solid_angles
 from finmag.util import helpers
 
 from fk_demag import FKDemag
+from bem_cache import BEMCache, boundary_mesh_hash, bem_cache_enabled
 
 logger = logging.getLogger(name='finmag')
 
 
 class TreecodeBEM(FKDemag):
 
+    # The treecode evaluates the boundary potential for one magnetisation at
+    # a time and the Laplace problem is set up differently than in FKDemag.
+    compute_field_batch = None
+
     def __init__(self, mac=0.3, p=3, num_limit=100, correct_factor=10,
                  type_I=True, name='Demag', macrogeometry=None, thin_film=False):
         super(TreecodeBEM, self).__init__(
@@ -95,7 +100,19 @@ class TreecodeBEM(FKDemag):
 
         self.compute_triangle_normal()
 
-        self.__compute_bsa()
+        # The solid angles only depend on the boundary of the mesh, so they
+        # can be shared with other simulations through the BEM cache.
+        cache = BEMCache() if bem_cache_enabled() else None
+        cached = None
+        if cache is not None:
+            key = boundary_mesh_hash(self.bmesh, 'treecode_bsa')
+            cached = cache.get(key)
+        if cached is not None and 'vert_bsa' in cached:
+            self.vert_bsa = np.array(cached['vert_bsa'])
+        else:
+            self.__compute_bsa()
+            if cache is not None:
+                cache.put(key, vert_bsa=self.vert_bsa)
 
         fast_sum = FastSum(p=self.p, mac=self.mac, num_limit=self.num_limit,
                            correct_factor=self.correct_factor, type_I=self.type_I)
@@ -110,20 +127,8 @@ class TreecodeBEM(FKDemag):
 
     def __compute_bsa(self):
 
-        vert_bsa = np.zeros(self.mesh.num_vertices())
-
-        mc = self.mesh.cells()
-        xyz = self.mesh.coordinates()
-        for i in range(self.mesh.num_cells()):
-            for j in range(4):
-
-                tmp_omega = compute_solid_angle_single(
-                    xyz[mc[i][j]],
-                    xyz[mc[i][(j + 1) % 4]],
-                    xyz[mc[i][(j + 2) % 4]],
-                    xyz[mc[i][(j + 3) % 4]])
-
-                vert_bsa[mc[i][j]] += tmp_omega
+        vert_bsa = compute_vertex_solid_angles(
+            self.mesh.coordinates(), np.array(self.mesh.cells(), dtype=np.int32))
 
         vert_bsa = vert_bsa / (4 * np.pi) - 1
 
@@ -0,0 +1,39 @@
+import numpy as np
+import dolfin as df
+from finmag.energies.demag import TreecodeBEM
+from finmag.field import Field
+from finmag.native.treecode_bem import set_openmp_threads, get_openmp_threads
+from finmag.native.treecode_bem import compute_solid_angle_single, compute_vertex_solid_angles
+
+
+def test_treecode_result_does_not_depend_on_number_of_threads():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(40, 20, 2), 20, 10, 1)
+    m = Field(df.VectorFunctionSpace(mesh, "Lagrange", 1), value=(1, 0, 0))
+    Ms = Field(df.FunctionSpace(mesh, "DG", 0), value=1)
+    default_threads = get_openmp_threads()
+    try:
+        for type_I in [True, False]:
+            demag = TreecodeBEM(type_I=type_I)
+            demag.setup(m, Ms, unit_length=1e-9)
+            phi_1 = np.random.random_sample(demag.bmesh.num_vertices())
+            results = []
+            for threads in [1, 4]:
+                set_openmp_threads(threads)
+                phi_2 = np.zeros(len(phi_1))
+                demag.fast_sum.fastsum(phi_2, phi_1)
+                results.append(phi_2)
+            assert np.array_equal(results[0], results[1])
+    finally:
+        set_openmp_threads(default_threads)
+
+
+def test_vertex_solid_angles_match_single_solid_angles():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(3, 2, 1), 3, 2, 2)
+    xyz = mesh.coordinates()
+    cells = np.array(mesh.cells(), dtype=np.int32)
+    expected = np.zeros(len(xyz))
+    for c in cells:
+        for j in range(4):
+            expected[c[j]] += compute_solid_angle_single(
+                xyz[c[j]], xyz[c[(j + 1) % 4]], xyz[c[(j + 2) % 4]], xyz[c[(j + 3) % 4]])
+    assert np.allclose(compute_vertex_solid_angles(xyz, cells), expected, rtol=1e-14)
@@ -91,6 +91,13 @@ class DMI(EnergyBase):
         if self.method == 'direct':
             self.__setup_field_direct()
 
+    def reassemble(self):
+        if self.method == 'direct':
+            self.__setup_field_direct()
+            self.field_version += 1
+        else:
+            super(DMI, self).reassemble()
+
     def __setup_field_direct(self):
         dofmap = self.m.mesh_dofmap()
         S3 = df.VectorFunctionSpace(self.m.mesh(), "CG", 1, dim=3,
@@ -101,6 +108,7 @@ class DMI(EnergyBase):
         self.g_petsc = df.PETScMatrix()
         df.assemble(-2*self.dmi_factor*self.D.f*df.inner(v3, df.curl(u3))*df.dx, tensor=self.g_petsc)
         self.H_petsc = df.PETScVector()
+        self.matrix_version += 1
 
 def DMI_interfacial(m, D, dim):
     """
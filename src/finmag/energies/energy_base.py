@@ -69,6 +69,12 @@ class EnergyBase(object):
 
         self.in_jacobian = in_jacobian
         self.method = method
+        # Increased whenever the matrix of the field is (re)assembled, so
+        # that the combined matrices of EffectiveField know when to update.
+        self.matrix_version = 0
+        # Increased by reassemble(), so that EffectiveField knows when the
+        # fields it kept are outdated.
+        self.field_version = 0
 
     def setup(self, E_integrand, m, Ms, unit_length=1):
         """
@@ -202,6 +208,28 @@ class EnergyBase(object):
 
         return H
 
+    def reassemble(self):
+        """
+        Assemble the matrix of the field again after a material parameter
+        it depends on (e.g. A, K1, D or Ms) has been changed in place. The
+        methods 'box-assemble' and 'project' always use the current values.
+
+        """
+        if self.method == 'box-matrix-numpy':
+            self.__setup_field_numpy()
+        elif self.method == 'box-matrix-petsc':
+            self.__setup_field_petsc()
+        self.field_version += 1
+
+    def field_is_linear(self):
+        """
+        Return True if the field is computed as H = g * m / nodal_volume_S3
+        from the assembled matrix `g_petsc`, so that it can be combined with
+        the fields of other linear interactions (see EffectiveField).
+
+        """
+        return self.method in ['box-matrix-petsc', 'direct'] and hasattr(self, 'g_petsc')
+
     def average_field(self):
         """
         Compute the average field.
@@ -220,6 +248,7 @@ class EnergyBase(object):
         self.g_petsc = df.PETScMatrix()
         df.assemble(g_form, tensor=self.g_petsc)
         self.H_petsc = df.PETScVector()
+        self.matrix_version += 1
 
     def __compute_field_petsc(self):
         if not hasattr(self, "g_petsc"):
@@ -241,6 +270,7 @@ class EnergyBase(object):
         """
         g_form = df.derivative(self.dE_dm, self.m.f)
         self.g = df.assemble(g_form).array()
+        self.matrix_version += 1
 
     def __compute_field_numpy(self):
         Mvec = self.m.f.vector().array()
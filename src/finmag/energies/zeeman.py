@@ -12,6 +12,10 @@ log = logging.getLogger("finmag")
 
 class Zeeman(object):
 
+    # Increased by set_value(), so that EffectiveField knows when the
+    # fields it kept are outdated.
+    field_version = 0
+
     def __init__(self, H, name='Zeeman', **kwargs):
         """
         Specify an external field (in A/m).
@@ -67,6 +71,7 @@ class Zeeman(object):
         dg_vector_functionspace = df.VectorFunctionSpace(self.m.mesh(), 'CG', 1, 3, constrained_domain=dofmap.constrained_domain)
         self.H = Field(dg_vector_functionspace, value, name='H_ext')
         self.E = - mu0 * self.Ms.f * df.dot(self.m.f, self.H.f)  # Energy density.
+        self.field_version += 1
 
     def average_field(self):
         """
@@ -54,6 +54,7 @@ class Field(object):
         self.functionspace = functionspace
         self.f = df.Function(self.functionspace)
         self.name = name
+        self._average_weights_cache = None
 
         if value is not None:
             self.value = value
@@ -378,6 +379,14 @@ class Field(object):
           f_average (float for scalar and np.ndarray for vector field)
 
         """
+        if dx is df.dx:
+            # The integrals over the whole mesh are linear in the
+            # coefficients, so they are computed as inner products with
+            # vectors that are only assembled once.
+            weights, volume = self._average_weights()
+            f_average = np.array([w.inner(self.f.vector()) for w in weights]) / volume
+            return f_average[0] if self.is_scalar_field() else f_average
+
         # Compute the mesh "volume". For 1D mesh "volume" is the length and
         # for 2D mesh is the area of the mesh.
         volume = df.assemble(df.Constant(1) * dx(self.mesh()))
@@ -395,6 +404,23 @@ class Field(object):
 
             return np.array(f_average) / volume
 
+    def _average_weights(self):
+        """
+        Return a list with the vector w_i for each component i, such that
+        w_i . f is the integral of that component over the mesh, and the
+        volume of the mesh.
+
+        """
+        if self._average_weights_cache is None:
+            v = df.TestFunction(self.functionspace)
+            if self.is_scalar_field():
+                weights = [df.assemble(v * df.dx)]
+            else:
+                weights = [df.assemble(v[i] * df.dx) for i in xrange(self.value_dim())]
+            volume = df.assemble(df.Constant(1) * df.dx(self.mesh()))
+            self._average_weights_cache = (weights, volume)
+        return self._average_weights_cache
+
     def coords_and_values(self, t=None):
         """
         If the field is defined on a function space with degrees of freedom
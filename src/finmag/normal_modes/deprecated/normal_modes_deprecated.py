@@ -128,31 +128,21 @@ def differentiate_fd4(f, x, dx):
     return res
 
 
-def compute_eigenproblem_matrix(sim, frequency_unit=1e9, filename=None, differentiate_H_numerically=True, dtype=complex):
+def compute_eigenproblem_operator(sim, frequency_unit=1e9, differentiate_H_numerically=True, dtype=complex):
     """
-    Compute and return the square matrix `D` defining the eigenproblem which
-    has the normal mode frequencies and oscillation patterns as its solution.
+    Return a `scipy.sparse.linalg.LinearOperator` which applies the matrix
+    `D` defining the eigenproblem (see compute_eigenproblem_matrix) to a
+    vector in the tangent space, without assembling `D`.
+
+    Each product costs four evaluations of the effective field if
+    `differentiate_H_numerically` is True and one otherwise. Note that
+    the magnetisation of `sim` is changed by every product, so it should
+    be restored once the operator is no longer needed.
 
     Note that `sim` needs to be in a relaxed state, otherwise the results will
     be wrong.
 
     """
-    # Create the helper simulation which we use to compute
-    # the effective field for various values of m.
-    #Ms = sim.Ms
-    #A = sim.get_interaction('Exchange').A
-    #unit_length = sim.unit_length
-    # try:
-    #    sim.get_interaction('Demag')
-    #    demag_solver = 'FK'
-    # except ValueError:
-    #    demag_solver = None
-    #sim_aux = sim_with(sim.mesh, Ms=Ms, m_init=[1, 0, 0], A=A, unit_length=unit_length, demag_solver=demag_solver)
-    # In order to compute the derivative of the effective field, the magnetisation needs to be set
-    # to many different values. Thus we store a backup so that we can restore
-    # it later.
-    m_orig = sim.m
-
     def effective_field_for_m(m, normalise=True):
         if np.iscomplexobj(m):
             raise NotImplementedError(
@@ -183,6 +173,11 @@ def compute_eigenproblem_matrix(sim, frequency_unit=1e9, filename=None, differen
     # Returns the product of the linearised llg times vector
     def linearised_llg_times_vector(v):
         assert v.shape == (3, 1, n)
+        if np.iscomplexobj(v):
+            # The operator is real, but the eigensolvers (and the relative
+            # errors of their results) work with complex vectors
+            return (linearised_llg_times_vector(np.ascontiguousarray(v.real)) +
+                    1j * linearised_llg_times_vector(np.ascontiguousarray(v.imag)))
         # The linearised equation is
         # dv/dt = - gamma m0 x (H' v - h_0 v)
         v_array = v.view()
@@ -229,6 +224,33 @@ def compute_eigenproblem_matrix(sim, frequency_unit=1e9, filename=None, differen
         res.shape = (-1,)
         return res
 
+    return scipy.sparse.linalg.LinearOperator(
+        (2 * n, 2 * n), matvec=linearised_llg_times_tangential_vector, dtype=dtype)
+
+
+def compute_eigenproblem_matrix(sim, frequency_unit=1e9, filename=None, differentiate_H_numerically=True, dtype=complex):
+    """
+    Compute and return the square matrix `D` defining the eigenproblem which
+    has the normal mode frequencies and oscillation patterns as its solution.
+
+    The matrix is assembled column by column from the operator returned
+    by compute_eigenproblem_operator, which is only feasible for small
+    meshes. Use the operator directly for bigger problems.
+
+    Note that `sim` needs to be in a relaxed state, otherwise the results will
+    be wrong.
+
+    """
+    # In order to compute the derivative of the effective field, the magnetisation needs to be set
+    # to many different values. Thus we store a backup so that we can restore
+    # it later.
+    m_orig = sim.m
+
+    D_op = compute_eigenproblem_operator(
+        sim, frequency_unit=frequency_unit,
+        differentiate_H_numerically=differentiate_H_numerically, dtype=dtype)
+    n = D_op.shape[0] // 2
+
     df.tic()
     logger.info("Assembling eigenproblem matrix.")
     D = np.zeros((2 * n, 2 * n), dtype=dtype)
@@ -241,7 +263,7 @@ def compute_eigenproblem_matrix(sim, frequency_unit=1e9, filename=None, differen
                 helpers.format_time(t_cur * (2 * n / i - 1)))
             logger.debug("Processing row {}/{}  (time elapsed: {}{})".format(i,
                                                                              2 * n, helpers.format_time(t_cur), completion_info))
-        D[:, i] = linearised_llg_times_tangential_vector(w)
+        D[:, i] = D_op.matvec(w)
     logger.debug("Eigenproblem matrix D occupies {:.2f} MB of memory.".format(
         D.nbytes / 1024. ** 2))
     logger.info("Finished assembling eigenproblem matrix.")
@@ -447,6 +469,131 @@ def compute_generalised_eigenproblem_matrices(sim, alpha=0.0, frequency_unit=1e9
     return A, M, Q, Qt
 
 
+def tangential_space_projection_matrix(Q):
+    """
+    Return the sparse 3n x 2n matrix P with v = P w for the relationship
+    v = (R S) w between a 3d tangential vector v and the 2d vector w (see
+    compute_tangential_space_basis), so that the projection from the 3n
+    to the 2n space is P^T. `Q` is the array (R S) of shape (3, 2, n).
+
+    """
+    _, _, n = Q.shape
+    nodes = np.arange(n)
+    rows = np.arange(3).reshape(3, 1, 1) * n + np.zeros((1, 2, 1), dtype=int) + nodes
+    cols = np.arange(2).reshape(1, 2, 1) * n + np.zeros((3, 1, 1), dtype=int) + nodes
+    return scipy.sparse.csr_matrix((Q.ravel(), (rows.ravel(), cols.ravel())), shape=(3 * n, 2 * n))
+
+
+def compute_generalised_eigenproblem_operators(sim, alpha=0.0, frequency_unit=1e9,
+                                               differentiate_H_numerically=True):
+    """
+    Return `(A, M, Q, Qt)` defining the same generalised eigenproblem as
+    compute_generalised_eigenproblem_matrices, but without any dense
+    2N x 2N matrices.
+
+    The contribution of the local interactions to `A` is assembled as a
+    sparse matrix in the tangent space: the interactions whose field is
+    linear in m (exchange, DMI, ...) contribute their combined matrix (see
+    EffectiveField.linear_operator), and those which provide the derivative
+    of their field (the natively computed anisotropies) contribute its 3x3
+    blocks at the nodes. The remaining interactions (demag, Zeeman, ...)
+    are applied separately in each product, which costs four evaluations
+    of their fields if `differentiate_H_numerically` is True and one
+    otherwise (which assumes that their fields are affine in m). `A` is
+    returned as a `scipy.sparse.linalg.LinearOperator` and `M` as a
+    sparse matrix.
+
+    Note that the magnetisation of `sim` is changed by every product with
+    `A` which involves the remaining interactions, so it should be
+    restored once the operator is no longer needed.
+
+    """
+    effective_field = sim.llg.effective_field
+
+    def set_m(m, normalise=True):
+        # A_times_vector splits complex vectors into real and imaginary parts
+        assert not np.iscomplexobj(m)
+        sim.set_m(m, normalise=normalise, debug=False)
+
+    N = sim.llg.S3.dim()
+    n = N // 3
+    assert (N == 3 * n)
+
+    m0_array = sim.m.copy()
+    m0_3xn = m0_array.reshape(3, n)
+    m0_column_vector = m0_array.reshape(3, 1, n)
+    set_m(m0_array)
+    H0_3xn = sim.effective_field().reshape(3, n)
+    h0 = H0_3xn[0] * m0_3xn[0] + H0_3xn[1] * m0_3xn[1] + H0_3xn[2] * m0_3xn[2]
+
+    logger.debug(
+        "Computing basis of the tangent space and transition matrices.")
+    Q, R, S, Mcross = compute_tangential_space_basis(m0_column_vector)
+    Qt = mf_transpose(Q).copy()
+    P = tangential_space_projection_matrix(Q)
+
+    # Sparse matrix of H' - h0 in the 3n space for the local interactions.
+    K, linear = effective_field.linear_operator()
+    K = K - scipy.sparse.diags(np.tile(h0, 3), 0)
+    names = [name for name in effective_field.all() if name not in linear]
+    local = [name for name in names if hasattr(effective_field.get(name), 'compute_field_derivative')]
+    others = [name for name in names if name not in local]
+    nodes = np.arange(n)
+    for name in local:
+        # The derivative at each node only depends on m' at that node, so
+        # it is the 3x3 block whose column c is the derivative in the
+        # direction of the unit vector e_c at all nodes.
+        interaction = effective_field.get(name)
+        for c in xrange(3):
+            mp = np.zeros((3, n))
+            mp[c] = 1.0
+            block_column = interaction.compute_field_derivative(mp.ravel()).reshape(3, n)
+            for d in xrange(3):
+                K = K + scipy.sparse.csr_matrix(
+                    (block_column[d], (d * n + nodes, c * n + nodes)), shape=(N, N))
+    scale = -sim.gamma / (2 * pi * frequency_unit)
+    A_local = (scale * P.T.dot(K.dot(P))).tocsr()
+    logger.debug("Sparse part of the eigenproblem matrix A has {} nonzeros (from the "
+                 "interactions {}), the interactions {} are applied separately.".format(
+                     A_local.nnz, linear + local, others))
+
+    def fields_for_m(m, normalise=True):
+        set_m(m, normalise=normalise)
+        H = np.zeros(N)
+        for name in others:
+            H += effective_field.get(name).compute_field()
+        return H
+
+    if others and not differentiate_H_numerically:
+        H_others_0 = fields_for_m(np.zeros(N), normalise=False)
+
+    def A_times_vector(w):
+        if np.iscomplexobj(w):
+            # A is real, but the eigensolvers work with complex vectors
+            return A_times_vector(w.real) + 1j * A_times_vector(w.imag)
+        res = A_local.dot(w)
+        if others:
+            v = P.dot(w)
+            if differentiate_H_numerically:
+                Hp = differentiate_fd4(fields_for_m, m0_array, v)
+            else:
+                Hp = fields_for_m(v, normalise=False) - H_others_0
+            res += scale * P.T.dot(Hp)
+        return res
+
+    A = scipy.sparse.linalg.LinearOperator((2 * n, 2 * n), matvec=A_times_vector, dtype=complex)
+
+    # M is -i Mcross (+ the damping term) at each node, see M_times_w
+    M = scipy.sparse.csr_matrix(
+        (np.concatenate([1j * np.ones(n), -1j * np.ones(n), -1j * alpha * np.ones(2 * n)]),
+         (np.concatenate([nodes, n + nodes, nodes, n + nodes]),
+          np.concatenate([n + nodes, nodes, nodes, n + nodes]))),
+        shape=(2 * n, 2 * n))
+
+    set_m(m0_array)
+    return A, M, Q, Qt
+
+
 def compute_normal_modes(D, n_values=10, sigma=0., tol=1e-8, which='LM'):
     logger.debug("Solving eigenproblem. This may take a while...")
     df.tic()
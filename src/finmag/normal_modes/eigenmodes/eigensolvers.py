@@ -3,9 +3,11 @@ import numpy as np
 import dolfin as df
 import scipy.linalg
 import scipy.sparse.linalg
+from scipy.sparse.linalg import LinearOperator
 import logging
 from finmag.util.helpers import format_time
-from helpers import sort_eigensolutions, as_petsc_matrix, is_hermitian, compute_relative_error, as_dense_array
+from helpers import sort_eigensolutions, as_petsc_matrix, is_hermitian, compute_relative_error, as_dense_array, \
+    shift_invert_operator, as_petsc_shell_matrix
 from types import NoneType
 
 logger = logging.getLogger("finmag")
@@ -90,12 +92,13 @@ class AbstractEigensolver(object):
         #           matrices (but the conversion would happen in
         #           compute_relative_error() anyway, so by doing it
         #           here we avoid doing it multiple times.
-        if not isinstance(A, np.ndarray):
+        #           LinearOperators are only applied to the eigenvectors.
+        if not isinstance(A, (np.ndarray, LinearOperator)):
             logger.warning(
                 "Converting sparse matrix A to dense array to check whether it is "
                 "Hermitian. This might consume a lot of memory if A is big!.")
             A = as_dense_array(A)
-        if not isinstance(M, (np.ndarray, NoneType)):
+        if not isinstance(M, (np.ndarray, LinearOperator, NoneType)):
             logger.warning(
                 "Converting sparse matrix M to dense array to check whether it is "
                 "Hermitian. This might consume a lot of memory if M is big!.")
@@ -157,13 +160,16 @@ class ScipyLinalgEigh(ScipyDenseSolver):
 class ScipySparseSolver(AbstractEigensolver):
     _solver_func = None  # needs to be instantiated by derived classes
 
-    def __init__(self, sigma, which, num=6, swap_matrices=False, tol=None):
+    def __init__(self, sigma, which, num=6, swap_matrices=False, tol=None, inner_tol=1e-10):
         """
         *Arguments*
 
         sigma:
 
             If given, find eigenvalues near sigma using shift-invert mode.
+            If the matrix is a matrix-free LinearOperator (and there is no
+            matrix M), the shifted system is solved iteratively with GMRES
+            to the relative tolerance `inner_tol`.
 
         which:
 
@@ -198,6 +204,7 @@ class ScipySparseSolver(AbstractEigensolver):
         self.num = num
         self.swap_matrices = swap_matrices
         self.tol = tol or 0.  # Scipy's default is 0.0
+        self.inner_tol = inner_tol
 
     def _extra_info(self):
         return ": sigma={}, which='{}', num={}".format(
@@ -214,10 +221,14 @@ class ScipySparseSolver(AbstractEigensolver):
                 M = id_op(A)
             A, M = M, A
 
+        OPinv = None
+        if self.sigma is not None and M is None and isinstance(A, LinearOperator):
+            OPinv = shift_invert_operator(A, self.sigma, tol=self.inner_tol)
+
         # Compute eigensolutions
         omega, w = self._solver_func(A, k=num, M=M,
                                      sigma=self.sigma, which=self.which,
-                                     tol=tol)
+                                     tol=tol, OPinv=OPinv)
         w = w.T  # make sure that eigenvectors are stored in rows, not columns
 
         return sort_eigensolutions(omega, w)
@@ -248,7 +259,8 @@ class ScipySparseLinalgEigsh(ScipySparseSolver):
 class SLEPcEigensolver(AbstractEigensolver):
 
     def __init__(self, problem_type=None, method_type=None, which=None, num=6,
-                 tol=1e-12, maxit=100, shift_invert=False, swap_matrices=False, verbose=True):
+                 tol=1e-12, maxit=100, shift_invert=False, swap_matrices=False, verbose=True,
+                 inner_tol=1e-10):
         """
         *Arguments*
 
@@ -316,6 +328,14 @@ class SLEPcEigensolver(AbstractEigensolver):
 
             The maximum number of iterations.
 
+
+        inner_tol:  float
+
+            Matrices given as a scipy LinearOperator are passed to SLEPc
+            as matrix-free shell matrices. In shift-invert mode the
+            shifted system is then solved with GMRES (without
+            preconditioner) to this relative tolerance.
+
         """
         self.problem_type = problem_type  # string describing the problem type
         self.method_type = method_type  # string describing the solution method
@@ -326,6 +346,7 @@ class SLEPcEigensolver(AbstractEigensolver):
         self.swap_matrices = swap_matrices
         self.maxit = maxit
         self.verbose = verbose
+        self.inner_tol = inner_tol
 
     def _extra_info(self):
         return ": {}, {}, {}, num={}, tol={:g}, maxit={}".format(
@@ -358,6 +379,13 @@ class SLEPcEigensolver(AbstractEigensolver):
             st = E.getST()
             st.setType(SLEPc.ST.Type.SINVERT)
             st.setShift(0.0)
+            if A.getType() == 'python':
+                # A shell matrix can't be factorised, so the shifted
+                # system is solved iteratively.
+                ksp = st.getKSP()
+                ksp.setType('gmres')
+                ksp.getPC().setType('none')
+                ksp.setTolerances(rtol=self.inner_tol)
         return E
 
     def _solve_eigenproblem(self, A, M=None, num=None, problem_type=None, method_type=None, which=None, tol=1e-12, maxit=100, swap_matrices=None, shift_invert=None):
@@ -379,8 +407,13 @@ class SLEPcEigensolver(AbstractEigensolver):
         if shift_invert == None:
             shift_invert = self.shift_invert
 
-        A_petsc = as_petsc_matrix(A)
-        M_petsc = None if (M == None) else as_petsc_matrix(M)
+        def to_petsc(A):
+            if isinstance(A, LinearOperator):
+                return as_petsc_shell_matrix(A)
+            return as_petsc_matrix(A)
+
+        A_petsc = to_petsc(A)
+        M_petsc = None if (M is None) else to_petsc(M)
         if swap_matrices:
             A_petsc, M_petsc = M_petsc, A_petsc
         size, _ = A_petsc.size
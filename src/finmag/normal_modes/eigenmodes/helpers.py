@@ -54,15 +54,23 @@ def print_eigenproblem_memory_usage(mesh, generalised=False):
                      N, make_human_readable(memory_usage)))
 
 
+def _is_supported_for_products(A):
+    return isinstance(A, (np.ndarray, LinearOperator, NoneType))
+
+
 def compute_relative_error(A, M, omega, w):
-    if not isinstance(A, np.ndarray) or not isinstance(M, (np.ndarray, NoneType)):
+    if not _is_supported_for_products(A) or not _is_supported_for_products(M):
         logger.warning(
             "Converting sparse matrix to numpy.array as this is the only "
             "supported matrix type at the moment for computing relative errors.")
         A = as_dense_array(A)
         M = as_dense_array(M)
-    lhs = np.dot(A, w)
-    rhs = omega * w if (M == None) else omega * np.dot(M, w)
+    # LinearOperators (e.g. a matrix-free eigenproblem) are only applied to w
+    lhs = A.matvec(w) if isinstance(A, LinearOperator) else np.dot(A, w)
+    if M is None:
+        rhs = omega * w
+    else:
+        rhs = omega * (M.matvec(w) if isinstance(M, LinearOperator) else np.dot(M, w))
     rel_err = np.linalg.norm(lhs - rhs) / np.linalg.norm(omega * w)
     return rel_err
 
@@ -347,6 +355,82 @@ def as_petsc_matrix(A):
     return A_petsc
 
 
+def shift_invert_operator(A, sigma, tol=1e-10, maxiter=None):
+    """
+    Return a LinearOperator which applies (A - sigma*I)^-1, where the
+    inverse is computed by solving a linear system with GMRES for each
+    product. This allows the shift-invert mode of the eigensolvers to be
+    used with a matrix-free operator `A` (e.g. a LinearOperator whose
+    products require evaluations of the effective field), at the cost of
+    one product with A per GMRES iteration.
+
+    *Arguments*
+
+    tol:  float
+
+        The relative tolerance of the inner GMRES solves. It has to be
+        considerably smaller than the tolerance of the eigensolver.
+
+    maxiter:  int
+
+        The maximum number of (outer) GMRES iterations per solve.
+
+    """
+    from scipy.sparse.linalg import aslinearoperator, gmres
+
+    A = aslinearoperator(A)
+    dtype = np.result_type(A.dtype, type(sigma))
+    num_products = [0]
+
+    def shifted_matvec(v):
+        num_products[0] += 1
+        return A.matvec(v) - sigma * v
+
+    shifted = LinearOperator(A.shape, matvec=shifted_matvec, dtype=dtype)
+
+    def solve(b):
+        num_products[0] = 0
+        x, info = gmres(shifted, b, tol=tol, maxiter=maxiter)
+        if info != 0:
+            logger.warning("Inner GMRES solve of the shift-invert operator did not "
+                           "converge to tol={} (info={}).".format(tol, info))
+        logger.debug("Shift-invert solve took {} products with the operator.".format(
+            num_products[0]))
+        return x
+
+    return LinearOperator(A.shape, matvec=solve, dtype=dtype)
+
+
+def as_petsc_shell_matrix(A):
+    """
+    Return a matrix of type `petsc4py.PETSc.Mat` which applies the
+    LinearOperator `A` in its products without storing any entries (a
+    'shell' matrix), so that SLEPc can solve matrix-free eigenproblems.
+    Only real operators are supported.
+
+    """
+    # XXX TODO: Move this import to the top once we have found an easy
+    #           and reliable (semi-)automatic way for users to install
+    #           petsc4py.  -- Max, 20.3.2014
+    from petsc4py import PETSc
+
+    class LinearOperatorContext(object):
+
+        def mult(self, mat, x, y):
+            v = A.matvec(x.getArray(readonly=True))
+            if np.iscomplexobj(v):
+                if not np.allclose(v.imag, 0.0):
+                    raise TypeError("Array with complex entries cannot be "
+                                    "converted to a PETSc vector.")
+                v = v.real
+            y.setArray(v)
+
+    m, n = A.shape
+    A_petsc = PETSc.Mat().createPython([m, n], context=LinearOperatorContext())
+    A_petsc.setUp()
+    return A_petsc
+
+
 def irregular_interval_mesh(xmin, xmax, n):
     """
     Create a mesh on the interval [xmin, xmax] with n vertices.
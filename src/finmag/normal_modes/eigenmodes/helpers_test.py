@@ -277,6 +277,22 @@ def test_as_dense_array():
     #assert(np.allclose(A, as_dense_array(A_petsc_dolfin)))
 
 
+def test_shift_invert_operator():
+    A = np.diag(np.arange(1.0, 21.0)) + 0.1 * np.eye(20, k=1)
+    A_op = LinearOperator(A.shape, matvec=lambda v: np.dot(A, v), dtype=float)
+    b = np.arange(20.0)
+    OPinv = shift_invert_operator(A_op, 0.5, tol=1e-12)
+    assert np.allclose(OPinv.matvec(b), np.linalg.solve(A - 0.5 * np.eye(20), b))
+
+
+def test_compute_relative_error_applies_linear_operator():
+    A = np.diag([1.0, 2.0, 3.0])
+    A_op = LinearOperator(A.shape, matvec=lambda v: np.dot(A, v), dtype=float)
+    w = np.array([0.0, 1.0, 0.0])
+    assert compute_relative_error(A_op, None, 2.0, w) == 0.0
+    assert np.isclose(compute_relative_error(A_op, None, 1.0, w), 1.0)
+
+
 def test_as_petsc_matrix():
     N = 20
 
@@ -0,0 +1,116 @@
+"""
+Strong scaling of the OpenMP-parallel right hand side of the JIT-compiled
+Equation (used by the Physics class) for meshes of increasing size,
+compared with native_llg.calc_llg_dmdt, which LLG uses.
+
+Equation.solve copies m, H and dm/dt from and to the dolfin vectors, the
+timings of calc_llg_dmdt don't include any copies.
+
+"""
+import time
+import multiprocessing
+import numpy as np
+import dolfin as df
+import matplotlib as mpl
+mpl.use("Agg")
+import matplotlib.pyplot as plt
+from finmag.physics.equation import Equation, get_equation_module
+from finmag.native import llg as native_llg
+
+now = time.time
+create_mesh = lambda n: df.BoxMesh(
+    df.Point(0, 0, 0), df.Point(n, n, n), n, n, n)
+sizes = [10, 20, 40, 60]
+max_threads = multiprocessing.cpu_count()
+threads = [t for t in [1, 2, 4, 8, 16, 32, 64] if t <= max_threads]
+repetitions = 20
+gamma = 2.210173e5
+results_file = "results_equation_benchmark.txt"
+
+
+def setup_equation(mesh):
+    V = df.FunctionSpace(mesh, "CG", 1)
+    W = df.VectorFunctionSpace(mesh, "CG", 1, dim=3)
+    n = V.dim()
+    alpha = df.Function(V)
+    alpha.assign(df.Constant(0.5))
+    m = df.Function(W)
+    m_values = np.random.uniform(-1, 1, (3, n))
+    m_values /= np.sqrt(np.sum(m_values ** 2, axis=0))
+    m.vector().set_local(m_values.ravel())
+    H = df.Function(W)
+    H.vector().set_local(np.random.uniform(-1e5, 1e5, 3 * n))
+    dmdt = df.Function(W)
+    equation = Equation(m.vector(), H.vector(), dmdt.vector())
+    equation.set_alpha(alpha.vector())
+    equation.set_gamma(gamma)
+    return equation, alpha, m, H, dmdt
+
+
+def time_solve(equation):
+    equation.solve()  # warm up
+    start = now()
+    for j in xrange(repetitions):
+        equation.solve()
+    return (now() - start) / repetitions
+
+
+def time_jtimes(equation, n):
+    mp = np.random.uniform(-1, 1, 3 * n)
+    Hp = np.random.uniform(-1e5, 1e5, 3 * n)
+    jtimes = np.zeros(3 * n)
+    start = now()
+    for j in xrange(repetitions):
+        equation.sundials_jtimes_serial(mp, Hp, jtimes)
+    return (now() - start) / repetitions
+
+
+def time_native_llg(alpha, m, H):
+    m = m.vector().array().reshape(3, -1)
+    H = H.vector().array().reshape(3, -1)
+    alpha = alpha.vector().array()
+    pins = np.array([], dtype="int")
+    dmdt = np.zeros(m.shape)
+    start = now()
+    for j in xrange(repetitions):
+        native_llg.calc_llg_dmdt(m, H, 0.0, dmdt, pins, gamma, alpha, 1e-12, True)
+    return (now() - start) / repetitions
+
+try:
+    results = np.loadtxt(results_file)
+except IOError:
+    module = get_equation_module()
+    default_threads = module.get_openmp_threads()
+    results = []
+    for i, n in enumerate(sizes):
+        mesh = create_mesh(n)
+        equation, alpha, m, H, dmdt = setup_equation(mesh)
+        nodes = mesh.num_vertices()
+        print "Mesh {}/{} with {} nodes.".format(i + 1, len(sizes), nodes)
+        for t in threads:
+            module.set_openmp_threads(t)
+            solve = time_solve(equation)
+            jtimes = time_jtimes(equation, nodes)
+            native = time_native_llg(alpha, m, H)
+            print "{} threads: solve {:.3g}s, jtimes {:.3g}s, calc_llg_dmdt {:.3g}s".format(
+                t, solve, jtimes, native)
+            results.append([nodes, t, solve, jtimes, native])
+        np.savetxt(results_file, results)  # Save results after every step.
+    module.set_openmp_threads(default_threads)
+    results = np.array(results)
+
+fig = plt.figure(figsize=(8, 12))
+for k, (column, title) in enumerate([(2, "Equation.solve"),
+                                     (3, "Equation.sundials_jtimes_serial"),
+                                     (4, "native_llg.calc_llg_dmdt")]):
+    ax = fig.add_subplot(3, 1, k + 1)
+    ax.set_title(title)
+    for n in np.unique(results[:, 0]):
+        r = results[results[:, 0] == n]
+        ax.loglog(r[:, 1], r[:, column], 'o-', label="{:d} nodes".format(int(n)))
+    ax.legend(loc=1, fontsize=8)
+    ax.set_xlabel("OpenMP threads")
+    ax.set_ylabel("time per evaluation (s)")
+
+fig.tight_layout()
+fig.savefig("results_equation_benchmark.png")
@@ -1,8 +1,11 @@
 import logging
 import numpy as np
+import scipy.sparse as sp
+import dolfin as df
 from finmag.field import Field
-from finmag.util.helpers import vector_valued_function
-from finmag.energies import TimeZeeman
+from finmag.util.consts import mu0
+from finmag.util.helpers import vector_valued_function, petsc_matrix_to_csr
+from finmag.energies import Zeeman, TimeZeeman
 from finmag.physics.errors import UnknownInteraction
 
 logger = logging.getLogger(name="finmag")
@@ -10,7 +13,7 @@ logger = logging.getLogger(name="finmag")
 
 class EffectiveField(object):
 
-    def __init__(self, m, Ms, unit_length):
+    def __init__(self, m, Ms, unit_length, fuse_linear=False):
         """
         *Arguments*
 
@@ -19,6 +22,19 @@ class EffectiveField(object):
         Ms:  number (?)
 
         unit_length:  float
+
+        fuse_linear:  bool
+
+            If True, the matrices of all interactions whose field is linear
+            in m (see EnergyBase.field_is_linear, e.g. exchange, DMI and
+            uniaxial anisotropy without K2) are summed into one combined
+            matrix, so that update() computes their total field with a
+            single matrix-vector product. This can also be switched on or
+            off later by setting the attribute `fuse_linear`. The combined
+            matrix is updated when interactions are added or removed and
+            when their matrices are reassembled (see EnergyBase.reassemble,
+            e.g. after a material parameter has been changed).
+
         """
         assert isinstance(m, Field)
         assert isinstance(Ms, Field)
@@ -38,6 +54,27 @@ class EffectiveField(object):
         # explicitly to compute_field/compute_energy.
         self.need_time_update = []
 
+        self.fuse_linear = fuse_linear
+        self._linear_operator = None
+        self._linear_matrices = None
+        self._jacobian_operator = None
+        self._jacobian_matrices = None
+
+        # The fields of the individual interactions computed by the last call
+        # of update(keep_fields=True), together with the time and
+        # magnetisation they belong to. They are used to estimate the energy
+        # and for the ndt file without recomputing them. Any other
+        # evaluation of the fields invalidates them (_fields_m = None), and
+        # so does a change of Ms or of the field_version of an interaction.
+        self._fields = {}
+        self._fields_t = None
+        self._fields_m = None
+        self._fields_Ms = None
+        self._fields_versions = None
+        self._fused = set()
+        self._energy_weights = None
+        self._energy_weights_Ms = None
+
     def add(self, interaction, with_time_update=None):
         """
         Add an interaction (such as Exchange, Anisotropy, Demag).
@@ -71,7 +108,7 @@ class EffectiveField(object):
         if with_time_update:
             self.need_time_update.append(with_time_update)
 
-    def update(self, t=None):
+    def update(self, t=None, keep_fields=False):
         """
         Update the effective field internally so that its value
         reflects the value at time `t`.
@@ -79,6 +116,12 @@ class EffectiveField(object):
         The argument `t` can be omitted if no interaction requires a
         time update.
 
+        If `keep_fields` is True, the fields of the individual interactions
+        are kept (by reference) together with t and m for current_field()
+        and estimate_energies(). This isn't done by default because the
+        time integrator calls update() for states other than the one it
+        finally writes back to m.
+
         """
         if t is None and self.need_time_update:
             raise ValueError("Some interactions require a time update, "
@@ -87,9 +130,31 @@ class EffectiveField(object):
         for update in self.need_time_update:
             update(t)
 
-        self.H_eff[:] = 0
-        for interaction in self.interactions.itervalues():
-            self.H_eff += interaction.compute_field()
+        # the interactions may overwrite the arrays of kept fields
+        self._fields_m = None
+        fused = self._update_linear_operator() if self.fuse_linear else []
+        if fused:
+            self.H_eff[:] = self._linear_operator.dot(
+                self.m_field.get_numpy_array_debug())
+        else:
+            self.H_eff[:] = 0
+        for name, interaction in self.interactions.iteritems():
+            if name in fused:
+                continue
+            H = interaction.compute_field()
+            self.H_eff += H
+            if keep_fields:
+                self._fields[name] = H
+        self._fused = set(fused)
+        if keep_fields:
+            # the individual fields of fused interactions aren't available
+            # (see estimate_energies)
+            for name in fused:
+                self._fields.pop(name, None)
+            self._fields_t = t
+            self._fields_m = self.m_field.get_numpy_array_debug()
+            self._fields_Ms = self.Ms.get_numpy_array_debug()
+            self._fields_versions = self._field_versions()
 
     def compute(self, t=None):
         """
@@ -111,12 +176,91 @@ class EffectiveField(object):
         for update in self.need_time_update:
             update(t)
 
+        self._fields_m = None
         H_eff = np.zeros(self.output_size)
         for interaction in self.interactions.itervalues():
             if interaction.in_jacobian:
                 H_eff += interaction.compute_field()
         return H_eff
 
+    def compute_batch(self, ms, t=None, compute_energies=True):
+        """
+        Compute the effective fields and the total energies of several
+        magnetisations at once, e.g. of all images of an energy band.
+
+        The fields of all interactions which are linear in m (see
+        _linear_interactions) are computed with a single product of their
+        combined matrix with the block of all magnetisations. Interactions
+        which provide a method `compute_field_batch(ms)` (the FK demag)
+        compute their fields for all magnetisations together as well and
+        their energies from these fields through `compute_energy_batch(ms,
+        H)`. The fields of the remaining interactions and the energies of
+        all other interactions are computed one magnetisation after the
+        other, for which each of them is written into m temporarily.
+
+        H_eff isn't changed, but the fields kept for estimate_energies()
+        are invalidated.
+
+        *Arguments*
+
+        ms:  numpy.ndarray
+
+            Array of shape (k, n) with one magnetisation per row, in the
+            order of the degrees of freedom of m.
+
+        t:  float
+
+            Only required if one or more interactions require a time update.
+
+        compute_energies:  bool
+
+            If False, only the fields are computed and E is None.
+
+        *Returns*
+
+        A tuple (H, E) of the fields, an array of shape (k, n), and the
+        total energies, an array of length k.
+
+        """
+        if t is None and self.need_time_update:
+            raise ValueError("Some interactions require a time update, "
+                             "but no time step was given.")
+
+        for update in self.need_time_update:
+            update(t)
+
+        self._fields_m = None
+        ms = np.asarray(ms)
+        H = np.zeros(ms.shape)
+        E = np.zeros(len(ms))
+
+        linear = self._update_linear_operator()
+        if linear:
+            H += self._linear_operator.dot(ms.T).T
+        batched = [name for name, interaction in self.interactions.iteritems()
+                   if name not in linear and
+                   getattr(interaction, 'compute_field_batch', None) is not None]
+        for name in batched:
+            interaction = self.interactions[name]
+            H_i = interaction.compute_field_batch(ms)
+            H += H_i
+            if compute_energies:
+                E += interaction.compute_energy_batch(ms, H_i)
+
+        others = [name for name in self.interactions if name not in linear and name not in batched]
+        if not others and not compute_energies:
+            return H, None
+        m = self.m_field.get_numpy_array_debug().copy()
+        for j in xrange(len(ms)):
+            self.m_field.f.vector().set_local(ms[j])
+            for name, interaction in self.interactions.iteritems():
+                if name in others:
+                    H[j] += interaction.compute_field()
+                if compute_energies and name not in batched:
+                    E[j] += interaction.compute_energy()
+        self.m_field.f.vector().set_local(m)
+        return H, (E if compute_energies else None)
+
     def total_energy(self):
         """
         Compute and return the total energy contribution of all
@@ -128,6 +272,206 @@ class EffectiveField(object):
             energy += interaction.compute_energy()
         return energy
 
+    def _linear_interactions(self):
+        return [name for name, interaction in self.interactions.iteritems()
+                if hasattr(interaction, 'field_is_linear') and interaction.field_is_linear()]
+
+    def _combine_matrices(self, names):
+        """
+        Return the sum of the matrices of the interactions `names`, each
+        divided by the nodal volume so that the combined matrix maps m
+        directly onto the total field of these interactions, and the list
+        of (name, matrix) it was computed from.
+
+        """
+        matrices = self._matrices(names)
+        K = None
+        for name, g, _ in matrices:
+            # H = g * m / nodal_volume_S3, so we scale the rows of g
+            scaled = sp.diags(1.0 / self.interactions[name].nodal_volume_S3, 0).dot(
+                petsc_matrix_to_csr(g))
+            K = scaled.tocsr() if K is None else (K + scaled).tocsr()
+        if K is None:
+            K = sp.csr_matrix((self.output_size, self.output_size))
+        return K, matrices
+
+    def _matrices(self, names):
+        return [(name, self.interactions[name].g_petsc,
+                 getattr(self.interactions[name], 'matrix_version', 0))
+                for name in sorted(names)]
+
+    @staticmethod
+    def _same_matrices(a, b):
+        return b is not None and \
+            [(n, id(g), v) for n, g, v in a] == [(n, id(g), v) for n, g, v in b]
+
+    def _update_linear_operator(self):
+        """
+        Make sure that the combined matrix of the linear interactions is up
+        to date and return their names.
+
+        """
+        names = self._linear_interactions()
+        matrices = self._matrices(names)
+        if not self._same_matrices(matrices, self._linear_matrices):
+            self._linear_operator, self._linear_matrices = self._combine_matrices(names)
+            logger.debug("Combined the matrices of the linear interactions "
+                         "{}.".format(sorted(names)))
+        return names
+
+    def linear_operator(self):
+        """
+        Return `(K, names)`, where K is the combined matrix (in dof order)
+        of all interactions whose field is linear in m, so that their total
+        field is K m, and `names` are the names of these interactions.
+
+        """
+        names = self._update_linear_operator()
+        return self._linear_operator, sorted(names)
+
+    def jacobian_operator(self):
+        """
+        Return `(K, nonlinear)`, where K is the combined matrix (in dof
+        order) of those interactions included in the Jacobian whose field
+        is linear in m, so that their contribution to the directional
+        derivative dH(m + a m')/da is just K m', and `nonlinear` are the
+        names of the remaining interactions included in the Jacobian.
+
+        The matrix is only re-summed when the set of interactions or one of
+        their matrices changes, so K is the same object as long as it is
+        valid.
+
+        """
+        linear = self._linear_interactions()
+        names = [name for name, interaction in self.interactions.iteritems()
+                 if interaction.in_jacobian and name in linear]
+        nonlinear = sorted(name for name, interaction in self.interactions.iteritems()
+                           if interaction.in_jacobian and name not in linear)
+        matrices = self._matrices(names)
+        if not self._same_matrices(matrices, self._jacobian_matrices):
+            self._jacobian_operator, self._jacobian_matrices = self._combine_matrices(names)
+            logger.debug("Combined the matrices of the interactions {} for the "
+                         "Jacobian.".format(sorted(names)))
+        return self._jacobian_operator, nonlinear
+
+    def reset_linear_operator(self):
+        """
+        Re-sum the combined matrices of the linear interactions at the next
+        update. This is only needed if one of their matrices was modified
+        in place without EnergyBase.reassemble().
+
+        """
+        self._linear_operator = None
+        self._linear_matrices = None
+        self._jacobian_operator = None
+        self._jacobian_matrices = None
+
+    def _field_versions(self):
+        return dict((name, getattr(interaction, 'field_version', 0))
+                    for name, interaction in self.interactions.iteritems())
+
+    def _fields_are_current(self, t):
+        return (self._fields_m is not None and t == self._fields_t and
+                set(self._fields) | self._fused == set(self.interactions) and
+                self._fields_versions == self._field_versions() and
+                np.array_equal(self._fields_m, self.m_field.get_numpy_array_debug()) and
+                np.array_equal(self._fields_Ms, self.Ms.get_numpy_array_debug()))
+
+    def _update_kept_fields(self, t):
+        if not self._fields_are_current(t):
+            self.update(t, keep_fields=True)
+
+    def current_field(self, t=None):
+        """
+        Return the effective field at the current magnetisation and time
+        `t`. If the fields were kept by the most recent call of update()
+        (see its argument `keep_fields`) and belong to the same m, t and
+        Ms, and no interaction has changed since then (see the
+        `field_version` of Zeeman and EnergyBase), its result is returned
+        without computing the fields again. A material parameter that is
+        changed in place must be followed by the reassemble() method of
+        the interaction.
+
+        The returned array is H_eff itself and must not be modified.
+
+        """
+        self._update_kept_fields(t)
+        return self.H_eff
+
+    def current_interaction_field(self, interaction_name, t=None):
+        """
+        Same as current_field(), but return the field of the interaction
+        with the given name.
+
+        """
+        self._update_kept_fields(t)
+        if interaction_name in self._fields:
+            return self._fields[interaction_name]
+        # fused into the combined linear operator (see estimate_energies)
+        return self.get(interaction_name).compute_field()
+
+    def _assemble_energy_weights(self):
+        """
+        Return the vector w with w_i = int Ms phi_i dx for each (vector
+        component of a) node, so that sum(w * m * H) approximates the
+        integral of M.H over the mesh.
+
+        """
+        Ms = self.Ms.get_numpy_array_debug()
+        if self._energy_weights is None or not np.array_equal(Ms, self._energy_weights_Ms):
+            v = df.TestFunction(self.m_field.functionspace)
+            w = df.assemble(self.Ms.f * df.dot(v, df.Constant((1, 1, 1))) * df.dx)
+            self._energy_weights = w.array() * self.unit_length ** self.m_field.mesh_dim()
+            self._energy_weights_Ms = Ms
+        return self._energy_weights
+
+    def estimate_energies(self, t=None):
+        """
+        Return a dictionary with a cheap estimate of the energy of each
+        interaction, computed from the fields kept by the most recent call
+        of update(keep_fields=True) as
+
+        .. math::
+
+            E \\approx -\\frac{\\mu_0}{p} \\int_\\Omega \\vec H \\cdot \\vec M \\mathrm{d}x,
+
+        with p = 1 for Zeeman-like interactions whose field doesn't depend
+        on m and p = 2 for all others. The fields are only recomputed if
+        they aren't current any more (see current_field()).
+
+        The estimate is exact (up to the lumping of the integral) for
+        energies that are quadratic in m, such as exchange, DMI and demag.
+        For uniaxial anisotropy it differs by a constant, for higher order
+        anisotropies it is only an approximation. It is meant for monitoring
+        the energy, e.g. while relaxing the system. Use total_energy() for
+        exact values.
+
+        """
+        self._update_kept_fields(t)
+
+        m = self._fields_m
+        w = self._assemble_energy_weights()
+        energies = {}
+        for name, interaction in self.interactions.iteritems():
+            p = 1.0 if isinstance(interaction, Zeeman) else 2.0
+            if name in self._fields:
+                H = self._fields[name]
+            else:
+                # fused into the combined linear operator; these fields
+                # are cheap to compute individually
+                H = interaction.compute_field()
+            # sum over the nodes of all processes
+            energies[name] = df.MPI.sum(df.mpi_comm_world(), -mu0 / p * np.sum(w * m * H))
+        return energies
+
+    def estimate_total_energy(self, t=None):
+        """
+        Return the sum of the energy estimates of all interactions, see
+        estimate_energies().
+
+        """
+        return sum(self.estimate_energies(t).values())
+
     def exists(self, interaction_name):
         """
         Returns true if an interaction by that name is known to the system.
@@ -162,6 +506,7 @@ class EffectiveField(object):
         if not self.exists(interaction_name):
             raise UnknownInteraction(interaction_name, self.all())
         del self.interactions[interaction_name]
+        self._fields.pop(interaction_name, None)
 
     def get_dolfin_function(self, interaction_name, region=None):
         interaction = self.get(interaction_name)
@@ -9,7 +9,7 @@ whatever, just straight up solving of the equation of motion.
 
 """
 import logging
-import instant
+import hashlib
 import dolfin as df
 import os
 import fnmatch
@@ -19,8 +19,22 @@ from os import path
 
 log = logging.getLogger(name="finmag")
 
+SOURCES = ["equation.cpp", "terms.cpp", "derivatives.cpp"]
+HEADERS = ["equation.h", "terms.h", "derivatives.h"]
+# the loops over the nodes are parallelised with OpenMP
+CPPARGS = ["-O2", "-fopenmp"]
+LDDARGS = ["-fopenmp"]
+
+# the extension module, once it has been loaded by get_equation_module
+_equation_module = None
+# file in the cache directory which records the name of the module built by
+# build_equation_module, for use without the sources
+MANIFEST = "equation_module"
+
+
 def find_slepc():
     slepc = None
+    matches = []
     if 'SLEPC_DIR' in os.environ:
         slepc = os.environ['SLEPC_DIR']
     else:
@@ -28,7 +42,6 @@ def find_slepc():
         # /usr/lib/slepcdir/3.7.2/x86_64-linux-gnu-real/include/
         # However, tried to be a bit more robust to find it.
         slepcpath = '/usr/lib/slepcdir'
-        matches = []
         if os.path.isdir(slepcpath):
             for root, dirnames, filenames in os.walk(slepcpath):
                 for filename in fnmatch.filter(filenames, 'slepceps.h'):
@@ -50,14 +63,14 @@ def find_slepc():
         
 def find_petsc():
     petsc = None
-    if 'SLEPC_DIR' in os.environ:
+    matches = []
+    if 'PETSC_DIR' in os.environ:
         petsc = os.environ['PETSC_DIR']
     else:
     # At least on Ubuntu 16.04, the header files are in
     # /usr/lib/slepcdir/3.7.2/x86_64-linux-gnu-real/include/
     # However, tried to be a bit more robust to find it.
         petscpath = '/usr/lib/petscdir'
-        matches = []
         if os.path.isdir(petscpath):
             for root, dirnames, filenames in os.walk(petscpath):
                 for filename in fnmatch.filter(filenames, 'petscsys.h'):
@@ -75,10 +88,6 @@ def find_petsc():
         print("Found PETSc include files at {}".format(petsc))
         return petsc
 
-# find_slepc()
-# find_petsc()
-
-
 
 # TODO: use field class objects instead of dolfin vectors
 def Equation(m, H, dmdt):
@@ -86,27 +95,11 @@ def Equation(m, H, dmdt):
     Returns equation object initialised with dolfin vectors m, H and dmdt.
 
     """
-    equation_module = get_equation_module(True)
+    equation_module = get_equation_module()
     return equation_module.Equation(m, H, dmdt)
 
 
-def get_equation_module(for_distribution=False):
-    """
-    Returns extension module that deals with the equation of motion.
-    Will try to return from cache before recompiling.
-
-    By default, dolfin will chose a cache directory using a digest of our code
-    and some version numbers. This procedure enables dolfin to detect changes
-    to our code and recompile on the fly. However, when we distribute FinMag we
-    don't need or want on the fly recompilation and we'd rather have the
-    resulting files placed in a directory known ahead of time. For this, call
-    this function once with `for_distribution` set to True and ship FinMag
-    including the directory build/equation.
-
-    During normal use, our known cache directory is always checked before
-    dolfin's temporary ones. Its existence bypasses on the fly recompilation.
-
-    """
+def _directories():
     # __file__ will not be available during module init if this module is
     # compiled with cython. So the following line shouldn't be moved to the
     # module level. It is perfectly safe inside this function though.
@@ -115,29 +108,103 @@ def get_equation_module(for_distribution=False):
     # Define our own cache base directory instead of the default one. This
     # helps in distributing only the compiled code without sources.
     CACHE_DIR = path.join(MODULE_DIR, "build")
+    return SOURCE_DIR, CACHE_DIR
 
-    signature = "equation" if for_distribution else ""  # dolfin will chose
 
-    # Try to get the module from the known distribution location before
-    # asking instant about its cache. This way a distributed copy of FinMag
-    # should never attempt recompilation (which would fail without sources).
-    equation_module = instant.import_module("equation", CACHE_DIR)
+def equation_module_name():
+    """
+    Returns the name of the compiled extension module, which is "equation_"
+    followed by a hash of its sources, the compiler flags and the dolfin
+    version. A build for other sources or another dolfin is thus never
+    picked up from the cache.
+
+    Without the sources (i.e. in a binary distribution of FinMag), the name
+    of the module that was shipped is returned instead, which
+    build_equation_module records in the file build/equation_module. If
+    there is no such file, the name is "equation", as in distributions
+    that were built before the modules were named after their hash.
+
+    """
+    SOURCE_DIR, CACHE_DIR = _directories()
+    if not path.isdir(SOURCE_DIR):
+        manifest = path.join(CACHE_DIR, MANIFEST)
+        if path.isfile(manifest):
+            with open(manifest, "r") as f:
+                return f.read().strip()
+        return "equation"
+    digest = hashlib.sha1(df.__version__)
+    digest.update(" ".join(CPPARGS + LDDARGS))
+    for filename in HEADERS + SOURCES:
+        with open(path.join(SOURCE_DIR, filename), "r") as f:
+            digest.update(f.read())
+    return "equation_" + digest.hexdigest()[:16]
+
+
+def get_equation_module():
+    """
+    Returns extension module that deals with the equation of motion.
+
+    The module is imported from our own cache directory build/ (next to this
+    file) under the name given by `equation_module_name`, without asking
+    dolfin or instant to search their caches. Only if it isn't there it is
+    compiled with dolfin, which also needs to find the PETSc and SLEPc header
+    files (see `find_petsc` and `find_slepc`). To avoid this at runtime,
+    call `build_equation_module` at build time (`make -C native equation`)
+    and ship FinMag including the directory build/.
+
+    The module is only loaded once per session.
+
+    """
+    global _equation_module
+    if _equation_module is not None:
+        return _equation_module
+
+    import instant  # only needed by Physics, keep it out of `import finmag`
+    SOURCE_DIR, CACHE_DIR = _directories()
+    name = equation_module_name()
+
+    equation_module = instant.import_module(name, CACHE_DIR)
     if equation_module is not None:
-        log.debug("Got equation extension module from distribution location.")
+        log.debug("Got equation extension module {} from {}.".format(name, CACHE_DIR))
     else:
+        log.info("Compiling equation extension module {}. Build it ahead of time with "
+                 "`make -C native equation` to avoid this.".format(name))
         with open(path.join(SOURCE_DIR, "equation.h"), "r") as header:
             code = header.read()
 
         equation_module = df.compile_extension_module(
             code=code,
-            sources=["equation.cpp", "terms.cpp", "derivatives.cpp"],
+            sources=SOURCES,
             source_directory=SOURCE_DIR,  # where the sources given above are
             include_dirs=[SOURCE_DIR, find_petsc(), find_slepc()],  # where to look for header files
+            cppargs=CPPARGS,
+            lddargs=LDDARGS,
             # dolfin's compile_extension_module will pass on `module_name` to
             # instant's build_module as `signature`. That's the name of the
             # directory it will be cached in. So don't worry if instant's doc
             # says that passing a module name will disable caching.
-            module_name=signature,
+            module_name=name,
             cache_dir=CACHE_DIR,)
 
+    _equation_module = equation_module
     return equation_module
+
+
+def build_equation_module():
+    """
+    Compiles the extension module into the cache directory unless it is
+    there already, records its name in the cache directory so that it is
+    found without the sources, and returns the name. Meant to be run when
+    FinMag is built, see `get_equation_module`.
+
+    """
+    get_equation_module()
+    name = equation_module_name()
+    SOURCE_DIR, CACHE_DIR = _directories()
+    with open(path.join(CACHE_DIR, MANIFEST), "w") as f:
+        f.write(name + "\n")
+    return name
+
+
+if __name__ == "__main__":
+    print("Equation extension module {} is ready.".format(build_equation_module()))
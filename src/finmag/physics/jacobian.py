@@ -0,0 +1,105 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(name='finmag')
+
+
+class JacobianOperator(object):
+    """
+    Computes the directional derivative
+
+    .. math::
+
+        H' = \\frac{d H(m + a m')}{da}|_{a=0}
+
+    of the effective field that enters the Jacobian-times-vector product of
+    the LLG equation (see LLG.sundials_jtimes).
+
+    The matrices of all interactions in the Jacobian whose field is linear
+    in m are summed up once (see EffectiveField.jacobian_operator) and
+    permuted into the order of the integrator's state vector, so that their
+    contribution is a single sparse matrix-vector product applied to m'
+    directly. Interactions in the Jacobian without an assembled matrix which
+    provide the derivative of their field through a method
+    `compute_field_derivative(mp)` (the natively computed uniaxial and cubic
+    anisotropies) contribute that derivative at the current magnetisation,
+    which is expected to hold the state m. Any other interaction is
+    evaluated through its compute_field method, for which m' has to be
+    written into the magnetisation temporarily.
+
+    Apart from the result of the sparse matrix-vector product, all arrays
+    used in `apply` are allocated once.
+
+    """
+
+    def __init__(self, llg):
+        self.llg = llg
+        self.K = None
+        self.nonlinear = []
+        self._K_dofs = None
+        size = llg._m_field.f.vector().local_size()
+        self._H_nonlinear = np.zeros(size)
+        self._H_nonlinear_state = np.zeros(size)
+        self._mp_dofs = np.zeros(size)
+
+    def update(self):
+        """
+        Make sure that the combined matrix is up to date with the
+        interactions of the effective field.
+
+        """
+        K_dofs, self.nonlinear = self.llg.effective_field.jacobian_operator()
+        if K_dofs is not self._K_dofs:
+            if self.llg.dof_order:
+                self.K = K_dofs
+            else:
+                v2d = self.llg.v2d_xxx
+                self.K = K_dofs[v2d][:, v2d].tocsr()
+            self.K.sort_indices()
+            self._K_dofs = K_dofs
+            logger.debug("Jacobian operator uses a matrix with {} nonzeros{}.".format(
+                self.K.nnz, "" if not self.nonlinear else
+                " and the fields of {}".format(self.nonlinear)))
+
+    def apply(self, t, m, mp, Hp):
+        """
+        Store H' for the state `m` and the direction `mp` (both in the
+        order of the integrator's state vector) in the array `Hp`.
+
+        """
+        self.update()
+        Hp[:] = self.K.dot(mp)
+        if self.nonlinear:
+            self._add_nonlinear(t, m, mp, Hp)
+
+    def _add_nonlinear(self, t, m, mp, Hp):
+        llg = self.llg
+        H = self._H_nonlinear
+        H[:] = 0
+        interactions = [llg.effective_field.get(name) for name in self.nonlinear]
+        analytic = [i for i in interactions if hasattr(i, 'compute_field_derivative')]
+        others = [i for i in interactions if not hasattr(i, 'compute_field_derivative')]
+
+        if analytic:
+            if llg.dof_order:
+                mp_dofs = mp
+            else:
+                mp_dofs = self._mp_dofs
+                mp_dofs[llg.v2d_xxx] = mp
+            for interaction in analytic:
+                H += interaction.compute_field_derivative(mp_dofs)
+
+        if others:
+            # For these the field of m' is used, which is only correct if
+            # their field is linear in m.
+            llg._write_m(mp)
+            for interaction in others:
+                H += interaction.compute_field()
+            # restore the magnetisation, which still belongs to H_eff
+            llg._write_m(m)
+
+        if llg.dof_order:
+            Hp += H
+        else:
+            np.take(H, llg.v2d_xxx, out=self._H_nonlinear_state)
+            Hp += self._H_nonlinear_state
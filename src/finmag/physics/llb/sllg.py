@@ -34,7 +34,6 @@ class SLLG(object):
         self._T = np.zeros(self.nxyz)
         self._alpha = np.zeros(self.nxyz)
         self.m = np.zeros(3 * self.nxyz)
-        self.field = np.zeros(3 * self.nxyz)
         self.grad_m = np.zeros(3 * self.nxyz)
         self.dm_dt = np.zeros(3 * self.nxyz)
         # Note: nxyz for Ms length is more suitable?
@@ -48,6 +47,9 @@ class SLLG(object):
         self._Ms_dg = Field(self.DG)
         self.effective_field = EffectiveField(
             self._m_field, self.Ms, self.unit_length)
+        # The effective field is computed in place into H_eff, which the
+        # native integrators use directly.
+        self.field = self.effective_field.H_eff
 
         self.zhangli_stt = False
 
@@ -123,6 +125,40 @@ class SLLG(object):
         log.info("gamma=%g." % self.gamma)
         #log.info("checking_length: "+str(self.checking_length))
 
+    @property
+    def adaptive(self):
+        return self.method == 'Heun_adaptive' and not self.zhangli_stt
+
+    def set_adaptive_parameters(self, tol=1e-4, dt_min=1e-17, dt_max=1e-11):
+        """
+        Set the parameters of the adaptive method 'Heun_adaptive'. A step is
+        accepted if the difference between the Heun and the Euler-Maruyama
+        update of each component of m is below `tol`, and the step size
+        (in seconds) is kept between `dt_min` and `dt_max`. The first step
+        has the size `dt`.
+
+        """
+        if not self.adaptive:
+            raise ValueError("Adaptive time stepping requires method='Heun_adaptive'.")
+        self.integrator.set_adaptive_parameters(tol, dt_min, dt_max)
+        log.info("Adaptive time stepping: tol=%g, dt_min=%g, dt_max=%g." % (tol, dt_min, dt_max))
+
+    def stats(self):
+        """
+        Statistics of the time integration with the same keys as
+        SundialsIntegrator.stats(): the number of accepted steps, of field
+        evaluations and of rejected steps (netfails), the size of the last
+        step, the size of the next step and the current time (in seconds).
+
+        """
+        nsteps, nfevals, netfails, hlast, hcur = self.integrator.get_stats()
+        return {'nsteps': nsteps,
+                'nfevals': nfevals,
+                'netfails': netfails,
+                'hlast': hlast,
+                'hcur': hcur,
+                'tcur': self.cur_t}
+
     def set_m(self, value, normalise=True):
         m_tmp = helpers.vector_valued_function(
             value, self.S3, normalise=normalise).vector().array()
@@ -135,15 +171,31 @@ class SLLG(object):
         if tp <= self._t:
             return
         try:
-            while tp - self._t > 1e-12:
-                if self.zhangli_stt:
-                    self.integrator.run_step(self.field, self.grad_m)
-                else:
-                    self.integrator.run_step(self.field)
-
-                self._m_field.set_with_numpy_array_debug(self.m)
-
-                self._t += self._dt
+            if self.adaptive:
+                # The native integrator chooses the step sizes and updates
+                # the field with the time of each step.
+                self.integrator.advance_adaptive(self.field, self.cur_t, tp * self.time_scale)
+                self._t = tp
+            elif self.zhangli_stt or self.effective_field.need_time_update:
+                # The field has to be updated with the time of each step.
+                while tp - self._t > 1e-12:
+                    if self.zhangli_stt:
+                        self.integrator.run_step(self.field, self.grad_m)
+                    else:
+                        self.integrator.run_step(self.field)
+
+                    self._t += self._dt
+            else:
+                # Same number of steps as in the loop above, but all of
+                # them are done in native code.
+                steps = max(int(np.ceil((tp - self._t - 1e-12) / self._dt)), 0)
+                self.integrator.run_steps(self.field, steps)
+                self._t += steps * self._dt
+
+            # The magnetisation is only written into the Field when the
+            # field is updated, which is the predicted one after the last
+            # step.
+            self._m_field.set_with_numpy_array_debug(self.m)
 
         except Exception, error:
             log.info(error)
@@ -156,7 +208,10 @@ class SLLG(object):
 
         self._m_field.set_with_numpy_array_debug(y)
 
-        self.field[:] = self.effective_field.compute(self.cur_t)[:]
+        if self.adaptive:
+            self.effective_field.update(self.integrator.get_time())
+        else:
+            self.effective_field.update(self.cur_t)
 
         if self.zhangli_stt:
             self.grad_m[:] = self.compute_gradient_field()[:]
@@ -0,0 +1,163 @@
+import numpy as np
+import dolfin as df
+
+import finmag.native.llb as native_llb
+
+import logging
+log = logging.getLogger(name="finmag")
+
+
+class SLLGEnsemble(object):
+    """
+    Advances `n_replicas` independent thermal realisations of the stochastic
+    LLG defined by `sllg` (an instance of SLLG, e.g. `sim.llg` of a simulation
+    with kernel 'sllg') together, starting from its current magnetisation.
+
+    The mesh, the function spaces, the material parameters (Ms, alpha, T,
+    gamma, dt, method) and the interactions of `sllg` are shared by all
+    replicas, so they are only set up once. The magnetisations are stored
+    in the rows of the array `m` of shape (n_replicas, 3N), each replica
+    uses its own Mersenne-Twister stream for the thermal field, and the
+    effective field of all replicas is computed at once in each stage of
+    the integration (see EffectiveField.compute_batch).
+
+    The replicas only use the material parameters of `sllg` at the time
+    the ensemble is created.
+
+    """
+
+    def __init__(self, sllg, n_replicas, seeds=None):
+        """
+        *Arguments*
+
+        sllg:  SLLG
+
+            The stochastic LLG whose magnetisation, parameters and
+            interactions are used.
+
+        n_replicas:  int
+
+            The number of thermal realisations.
+
+        seeds:  list of int
+
+            One seed for the random number generator of each replica. By
+            default, the seeds are drawn with numpy.random.
+
+        """
+        self.sllg = sllg
+        self.n_replicas = n_replicas
+        self.effective_field = sllg.effective_field
+        self.time_scale = sllg.time_scale
+        self._t = sllg._t
+
+        self.m = np.tile(sllg.m, (n_replicas, 1))
+        self.m_pred = np.zeros(self.m.shape)
+        self.field = np.zeros(self.m.shape)
+
+        self.integrator = native_llb.StochasticSLLGEnsembleIntegrator(
+            self.m,
+            self.m_pred,
+            sllg._Ms,
+            sllg._T,
+            sllg.real_volumes,
+            sllg._alpha,
+            self.stochastic_update_field,
+            sllg.method)
+
+        if seeds is None:
+            seeds = np.random.random_integers(4294967295, size=n_replicas)
+        self.seeds = seeds
+
+        # weights of the nodes for the spatially averaged magnetisation
+        volumes = df.assemble(df.TestFunction(sllg.S1) * df.dx).array()
+        self._weights = volumes / volumes.sum()
+
+        self.switching_times = np.empty(n_replicas)
+        self.switching_times[:] = np.nan
+        self._switching_direction = None
+        self._switching_threshold = None
+        log.debug("Created an ensemble of {} replicas with {} degrees of "
+                  "freedom each.".format(n_replicas, self.m.shape[1]))
+
+    @property
+    def cur_t(self):
+        return self._t * self.time_scale
+
+    @property
+    def seeds(self):
+        return self._seeds
+
+    @seeds.setter
+    def seeds(self, value):
+        self._seeds = np.array(value, dtype=np.int64)
+        if self._seeds.shape != (self.n_replicas,):
+            raise ValueError("Expected {} seeds, got {}.".format(
+                self.n_replicas, len(self._seeds)))
+        self.integrator.set_parameters(
+            self.sllg.dt, self.sllg.gamma, self._seeds, self.sllg.checking_length)
+
+    def stochastic_update_field(self, y):
+        H, _ = self.effective_field.compute_batch(y, self.cur_t, compute_energies=False)
+        self.field[:] = H
+
+    def advance_time(self, t):
+        tp = t / self.time_scale
+
+        if tp <= self._t:
+            return
+
+        while tp - self._t > 1e-12:
+            self.integrator.run_step(self.field)
+            self._t += self.sllg._dt
+            if self._switching_direction is not None:
+                self._update_switching_times()
+
+        if abs(tp - self._t) < 1e-12:
+            self._t = tp
+
+    run_until = advance_time
+
+    @property
+    def m_average(self):
+        """
+        The spatially averaged magnetisation of each replica, an array of
+        shape (n_replicas, 3).
+
+        """
+        return self.m.reshape(self.n_replicas, 3, -1).dot(self._weights)
+
+    @property
+    def ensemble_m_average(self):
+        """
+        The spatially averaged magnetisation averaged over all replicas.
+
+        """
+        return self.m_average.mean(axis=0)
+
+    def track_switching(self, direction=(0, 0, -1), threshold=0.0):
+        """
+        Record the time at which the averaged magnetisation of each replica
+        first satisfies m_average . direction > threshold in the array
+        `switching_times` (which is NaN for the replicas which haven't
+        switched yet). The condition is checked after every time step.
+
+        """
+        direction = np.array(direction, dtype=float)
+        self._switching_direction = direction / np.linalg.norm(direction)
+        self._switching_threshold = threshold
+        self.switching_times[:] = np.nan
+        self._update_switching_times()
+
+    def _update_switching_times(self):
+        switched = self.m_average.dot(self._switching_direction) > self._switching_threshold
+        self.switching_times[switched & np.isnan(self.switching_times)] = self.cur_t
+
+    @property
+    def switching_probability(self):
+        """
+        The fraction of the replicas which have switched (see
+        track_switching).
+
+        """
+        return np.count_nonzero(~np.isnan(self.switching_times)) / float(self.n_replicas)
@@ -0,0 +1,51 @@
+import numpy as np
+import dolfin as df
+from finmag import Simulation
+from finmag.energies import Zeeman, Exchange
+from finmag.physics.llb.sllg_ensemble import SLLGEnsemble
+
+
+def create_sim(T):
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(10, 2, 2), 5, 1, 1)
+    sim = Simulation(mesh, 8.6e5, unit_length=1e-9, kernel='sllg')
+    sim.alpha = 0.1
+    sim.set_m((1, 0, 0))
+    sim.T = T
+    sim.add(Zeeman((0, 0, 1e5)))
+    sim.add(Exchange(13e-12))
+    return sim
+
+
+def test_replicas_reproduce_single_runs_with_same_seeds():
+    seeds = [422353390, 12345, 422353390]
+    ms = []
+    for seed in seeds[:2]:
+        sim = create_sim(T=300)
+        sim.llg.seed = seed
+        sim.run_until(2e-11)
+        ms.append(sim.m.copy())
+
+    sim = create_sim(T=300)
+    ensemble = SLLGEnsemble(sim.llg, 3, seeds=seeds)
+    ensemble.run_until(2e-11)
+
+    assert np.allclose(ensemble.m[0], ms[0], atol=1e-8)
+    assert np.allclose(ensemble.m[1], ms[1], atol=1e-8)
+    assert np.array_equal(ensemble.m[0], ensemble.m[2])
+    assert not np.allclose(ensemble.m[0], ensemble.m[1])
+
+
+def test_switching_statistics():
+    sim = create_sim(T=0)
+    ensemble = SLLGEnsemble(sim.llg, 4)
+    ensemble.track_switching(direction=(0, 0, 1), threshold=0.5)
+    assert ensemble.switching_probability == 0
+
+    ensemble.run_until(5e-10)
+
+    # without thermal fluctuations, all replicas relax towards the field
+    assert ensemble.switching_probability == 1
+    assert np.allclose(ensemble.switching_times, ensemble.switching_times[0])
+    assert 0 < ensemble.switching_times[0] < 5e-10
+    assert np.allclose(ensemble.m_average, ensemble.ensemble_m_average)
+    assert ensemble.ensemble_m_average[2] > 0.5
@@ -41,6 +41,52 @@ def plot_random_number_np():
         plt.savefig(os.path.join(MODULE_DIR, "test_np_%d.png" % i))
 
 
+def test_adaptive_heun_macrospin():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(2, 2, 2), 1, 1, 1)
+    S1 = df.FunctionSpace(mesh, "Lagrange", 1)
+    S3 = df.VectorFunctionSpace(mesh, "Lagrange", 1, dim=3)
+    sllg = SLLG(S1, S3, method='Heun_adaptive', unit_length=1e-9)
+    sllg.alpha = 0.1
+    sllg.set_m((1, 0, 0))
+    sllg.T = 0
+    sllg.set_adaptive_parameters(tol=1e-5, dt_min=1e-16, dt_max=1e-11)
+
+    H0 = 1e5
+    sllg.effective_field.add(Zeeman((0, 0, H0)))
+
+    precession_coeff = sllg.gamma / (1 + sllg.alpha ** 2)
+    for t in np.linspace(0, 5e-10, 11)[1:]:
+        sllg.advance_time(t)
+        assert abs(sllg.cur_t - t) < 1e-24
+        mz_ref = np.tanh(precession_coeff * sllg.alpha * H0 * t)
+        assert abs(sllg.m[-1] - mz_ref) < 1e-3
+
+    stats = sllg.stats()
+    # steps larger than the initial dt of 0.1 ps are taken
+    assert 0 < stats['nsteps'] < 5000
+    assert stats['nfevals'] >= 2 * stats['nsteps']
+    assert stats['tcur'] == sllg.cur_t
+
+
+def test_adaptive_heun_rejects_steps_at_high_temperature():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(2, 2, 2), 1, 1, 1)
+    S1 = df.FunctionSpace(mesh, "Lagrange", 1)
+    S3 = df.VectorFunctionSpace(mesh, "Lagrange", 1, dim=3)
+    sllg = SLLG(S1, S3, method='Heun_adaptive', unit_length=1e-9)
+    sllg.alpha = 0.1
+    sllg.set_m((1, 0, 0))
+    sllg.T = 1000
+    sllg.dt = 1e-12
+    sllg.set_adaptive_parameters(tol=1e-3)
+
+    sllg.advance_time(1e-11)
+
+    stats = sllg.stats()
+    assert stats['netfails'] > 0
+    assert abs(sllg.cur_t - 1e-11) < 1e-24
+    assert np.allclose(np.sqrt(np.sum(sllg.m.reshape(3, -1) ** 2, axis=0)), 1)
+
+
 if __name__ == "__main__":
 
     plot_random_number()
@@ -5,6 +5,9 @@ import finmag.util.consts as consts
 from aeon import timer
 from finmag.field import Field
 from finmag.physics.effective_field import EffectiveField
+from finmag.energies import Zeeman
+from finmag.energies.energy_base import EnergyBase
+from finmag.physics.jacobian import JacobianOperator
 from finmag.native import llg as native_llg
 from finmag.util import helpers
 from finmag.util.meshes import nodal_volume
@@ -14,8 +17,22 @@ from finmag.util.meshes import nodal_volume
 # getting access to logger here
 logger = logging.getLogger(name='finmag')
 
-# used for parallel testing
-#from finmag.native import cvode_petsc, llg_petsc
+# methods of EnergyBase which compute the field from distributed vectors only
+DISTRIBUTED_FIELD_METHODS = ('box-assemble', 'box-matrix-petsc', 'project', 'direct')
+
+
+def supports_distributed_vectors(interaction):
+    """
+    Return True if the field of `interaction` can be computed when the
+    magnetisation is distributed over several processes, i.e. if it only
+    uses assembled forms and PETSc matrices and vectors.
+
+    """
+    if isinstance(interaction, Zeeman):
+        return True
+    return (isinstance(interaction, EnergyBase) and
+            getattr(interaction, 'assemble', True) and
+            interaction.method in DISTRIBUTED_FIELD_METHODS)
 
 
 class LLG(object):
@@ -35,12 +52,18 @@ class LLG(object):
 
     """
     @timer.method
-    def __init__(self, S1, S3, do_precession=True, average=False, unit_length=1):
+    def __init__(self, S1, S3, do_precession=True, average=False, unit_length=1, dof_order=False):
         """
         S1 and S3 are df.FunctionSpace and df.VectorFunctionSpace objects,
         and the boolean do_precession controls whether the precession of the
         magnetisation around the effective field is computed or not.
 
+        If `dof_order` is True, the state vector handed to the sundials
+        integrator (see `sundials_m`, `sundials_rhs` and `sundials_jtimes`)
+        is kept in dolfin's dof order instead of the "xxx" vertex order. The
+        right hand side is then evaluated without re-ordering m, H_eff or
+        dm/dt and without allocating temporary arrays.
+
         """
         logger.debug("Creating LLG object.")
         self.S1 = S1
@@ -51,15 +74,30 @@ class LLG(object):
         self.set_default_values()
         self.do_precession = do_precession
         self.unit_length = unit_length
+        self.dof_order = dof_order
         self.do_slonczewski = False
         self.do_zhangli = False
         self.effective_field = EffectiveField(self._m_field,
                                               self.Ms, self.unit_length)
+        self.jacobian_operator = JacobianOperator(self)
+        # Incremented whenever a new state is written into the magnetisation.
+        # H_eff belongs to the state with the version _H_eff_version, which
+        # is how sundials_jtimes knows whether H_eff has to be recomputed.
+        self._m_version = 0
+        self._H_eff_version = -1
+        self._H_eff_state = np.zeros(self._m_field.f.vector().local_size())
+        # used by the distributed right hand side (see sundials_rhs_petsc)
+        self._local_nodes = None
+        self._alpha_local = None
         # will be computed on demand, and carries volume of the mesh
         self.Volume = None
 
         self.v2d_xyz, self.v2d_xxx, self.d2v_xyz, self.d2v_xxx = helpers.build_maps(S3)
         self.v2d_scale, self.d2v_scale = helpers.build_maps(S1, dim=1, scalar=True)
+        # index of component j at vertex i in the dof-ordered arrays is
+        # _v2d_nodes[j, i], used by the native *_dofs kernels
+        self._v2d_nodes = np.ascontiguousarray(self.v2d_xxx.reshape((3, -1)), dtype="int")
+        self._update_alpha_cache()
 
     def set_default_values(self):
         self.alpha = df.Function(self.S1)
@@ -76,9 +114,12 @@ class LLG(object):
 
         self._dmdt = df.Function(self.S3)
 
+        # used by sundials_psetup/sundials_psolve; the identity
+        # is used if this is None (see finmag.physics.preconditioner)
+        self.preconditioner = None
+
         # used for parallel stuff.
         #self.field = df.Function(self.S3)
-        #self.h_petsc = df.as_backend_type(self.field.vector()).vec()
 
     def set_pins(self, nodes):
         """
@@ -115,6 +156,27 @@ class LLG(object):
         """
         self.alpha = helpers.scalar_valued_function(value, self.S1)
         self.alpha.rename('alpha', 'Gilbert damping constant')
+        self._update_alpha_cache()
+
+    def _update_alpha_cache(self):
+        """
+        Cache the values of alpha in vertex order.
+
+        """
+        self._alpha_dofs = self.alpha.vector().array()
+        self._alpha = np.ascontiguousarray(self._alpha_dofs[self.v2d_scale])
+
+    def refresh_alpha_cache(self):
+        """
+        Update the cached values of alpha if those of `self.alpha` were
+        changed by other means than `set_alpha`, e.g. in place with
+        `sim.alpha.vector()[:] = ...`. This is done by `solve` and by the
+        sundials integrator before each time integration, so that the
+        right hand side doesn't need to compare alpha in every evaluation.
+
+        """
+        if not np.array_equal(self.alpha.vector().array(), self._alpha_dofs):
+            self._update_alpha_cache()
 
     @property
     def Ms(self):
@@ -185,12 +247,30 @@ class LLG(object):
     @property
     def sundials_m(self):
         """The unit magnetisation."""
+        if self.dof_order:
+            return self._m_field.get_numpy_array_debug()
         return self._m_field.get_ordered_numpy_array_xxx()
 
     @sundials_m.setter
     def sundials_m(self, value):
         # used to copy back from sundials cvode
-        self._m_field.set_with_ordered_numpy_array_xxx(value)
+        self._write_m(value)
+        self._m_version += 1
+
+    def _write_m(self, value):
+        """
+        Copy the state vector `value` into the magnetisation without
+        marking it as a new state (see sundials_jtimes).
+
+        """
+        if self.dof_order:
+            self._m_field.set_with_numpy_array_debug(value)
+        else:
+            self._m_field.set_with_ordered_numpy_array_xxx(value)
+
+    def _update_effective_field(self, t):
+        self.effective_field.update(t)
+        self._H_eff_version = self._m_version
 
     def m_average_fun(self, dx=df.dx):
         """
@@ -231,15 +311,17 @@ class LLG(object):
         if normalise:
             m0 = helpers.fnormalise(m0)
         self._m_field.set_with_ordered_numpy_array_xxx(m0)
+        self._m_version += 1
 
     def solve_for(self, m, t):
         self._m_field.set_with_ordered_numpy_array_xxx(m)
+        self._m_version += 1
         value = self.solve(t)
         return value
 
     def solve(self, t):
         # we don't use self.effective_field.compute(t) for performance reasons
-        self.effective_field.update(t)
+        self._update_effective_field(t)
         H_eff = self.effective_field.H_eff[self.v2d_xxx]  # alias (for readability)
         H_eff.shape = (3, -1)
 
@@ -251,7 +333,8 @@ class LLG(object):
         m.shape = (3, -1)
 
         dmdt = np.zeros(m.shape)
-        alpha__ = self.alpha.vector().array()[self.v2d_scale]
+        self.refresh_alpha_cache()
+        alpha__ = self._alpha
         # Calculate dm/dt
         if self.do_slonczewski:
             if self.fun_slonczewski_time_update != None:
@@ -293,16 +376,39 @@ class LLG(object):
 
     # Computes the dm/dt right hand side ODE term, as used by SUNDIALS CVODE
     def sundials_rhs(self, t, y, ydot):
+        if self.dof_order:
+            return self._sundials_rhs_dofs(t, y, ydot)
         ydot[:] = self.solve_for(y, t)
         return 0
 
+    def _sundials_rhs_dofs(self, t, y, ydot):
+        """
+        Same as `sundials_rhs`, but y and ydot are in dolfin dof order, so
+        m, H_eff and dm/dt are used in place (the only copies are y into
+        the magnetisation vector and ydot into `self._dmdt`).
+
+        """
+        self._m_field.set_with_numpy_array_debug(y)
+        self._m_version += 1
+        self._update_effective_field(t)
+
+        timer.start("solve", self.__class__.__name__)
+        char_time = 0.1 / self.c
+        native_llg.calc_llg_dmdt_dofs(y, self.effective_field.H_eff, t, ydot, self.pins,
+                                      self.gamma, self._alpha, char_time,
+                                      self.do_precession, self._v2d_nodes)
+        timer.stop("solve", self.__class__.__name__)
+
+        self._dmdt.vector().set_local(ydot)
+        return 0
+
     def sundials_psetup(self, t, m, fy, jok, gamma, tmp1, tmp2, tmp3):
         # Note that some of the arguments are deliberately ignored, but they
         # need to be present because the function must have the correct signature
         # when it is passed to set_spils_preconditioner() in the cvode class.
-        if not jok:
-            self._m_field.set_with_ordered_numpy_array_xxx(m)
-            self._reuse_jacobean = True
+        if self.preconditioner is not None:
+            jcur = self.preconditioner.setup(t, m, jok, gamma)
+            return 0, jcur
 
         return 0, not jok
 
@@ -310,29 +416,144 @@ class LLG(object):
         # Note that some of the arguments are deliberately ignored, but they
         # need to be present because the function must have the correct signature
         # when it is passed to set_spils_preconditioner() in the cvode class.
-        z[:] = r
+        if self.preconditioner is not None:
+            self.preconditioner.solve(r, z)
+        else:
+            z[:] = r
         return 0
 
-    """
+    @property
+    def local_nodes(self):
+        """
+        Array of shape (3, n), where n is the number of nodes owned by this
+        process, whose entry [j, i] is the index of component j of the i-th
+        of these nodes in the local part of the magnetisation vector.
+
+        """
+        if self._local_nodes is None:
+            offset = self.S3.dofmap().ownership_range()[0]
+            self._local_nodes = np.ascontiguousarray(
+                [np.asarray(self.S3.sub(j).dofmap().dofs()) - offset for j in xrange(3)],
+                dtype="int")
+        return self._local_nodes
+
+    def setup_distributed(self):
+        """
+        Prepare the right hand side and the Jacobian-times-vector product
+        for the MPI-distributed time integration (see sundials_rhs_petsc).
+        Call this again after changing alpha.
+
+        Raises NotImplementedError for the features which still require
+        the whole magnetisation on each process.
+
+        """
+        if len(self.pins) > 0:
+            raise NotImplementedError("Pinning is not supported by the distributed LLG yet.")
+        if self.do_slonczewski or self.do_zhangli:
+            raise NotImplementedError("Spin transfer torques are not supported by the distributed LLG yet.")
+        if self.effective_field.fuse_linear:
+            raise NotImplementedError("fuse_linear is not supported by the distributed LLG.")
+        unsupported = sorted(name for name, interaction in self.effective_field.interactions.iteritems()
+                             if not supports_distributed_vectors(interaction))
+        if unsupported:
+            raise NotImplementedError(
+                "The fields of {} can't be computed from distributed vectors yet (only "
+                "Zeeman fields and energies using one of the methods {} can).".format(
+                    unsupported, DISTRIBUTED_FIELD_METHODS))
+        nonlinear = sorted(name for name, interaction in self.effective_field.interactions.iteritems()
+                           if interaction.in_jacobian and not interaction.field_is_linear())
+        if nonlinear:
+            raise NotImplementedError(
+                "The distributed Jacobian only supports fields which are linear in m, but {} "
+                "are in the Jacobian. Create them with in_jacobian=False.".format(nonlinear))
+
+        alpha = df.Function(self.S3)
+        for j in xrange(3):
+            df.assign(alpha.sub(j), self.alpha)
+        self._alpha_local = np.ascontiguousarray(alpha.vector().array()[self.local_nodes[0]])
+
+    def _write_m_distributed(self, value):
+        """
+        Copy the local part `value` of the magnetisation into the
+        magnetisation vector and update its ghost values.
+
+        """
+        vector = self._m_field.f.vector()
+        vector.set_local(value)
+        vector.apply("insert")
+
+    @property
+    def sundials_m_petsc(self):
+        return self._m_field.f.vector().array()
+
+    @sundials_m_petsc.setter
+    def sundials_m_petsc(self, value):
+        # used to copy back from cvode_petsc
+        self._write_m_distributed(value)
+        self._m_version += 1
+
     def sundials_rhs_petsc(self, t, y, ydot):
-        #only for the testing of parallel stuff, will delete later.
+        """
+        Right hand side for cvode_petsc.CvodeSolver. `y` and `ydot` are
+        PETSc vectors with the layout of the magnetisation vector, and each
+        process computes the part of dm/dt which belongs to its nodes, in
+        dolfin's dof order (see `_sundials_rhs_dofs`).
 
-        self.effective_field.update(t)
-        self.field.vector().set_local(self.effective_field.H_eff)
+        """
+        m = y.getArray()
+        dmdt = ydot.getArray()
+        self._write_m_distributed(m)
+        self._m_version += 1
+        self._update_effective_field(t)
 
-        #this is not ideal, will change it after we make use of Field class for damping.
-        alpha_petsc = df.as_backend_type(self.alpha.vector()).vec()
+        timer.start("solve", self.__class__.__name__)
+        char_time = 0.1 / self.c
+        native_llg.calc_llg_dmdt_dofs(m, self.effective_field.H_eff, t, dmdt, np.array([], dtype="int"),
+                                      self.gamma, self._alpha_local, char_time,
+                                      self.do_precession, self.local_nodes)
+        timer.stop("solve", self.__class__.__name__)
+        return 0
 
-        llg_petsc.compute_dm_dt(y,
-                                self.h_petsc,
-                                ydot,
-                                alpha_petsc,
-                                self.gamma,
-                                self.do_precession,
-                                self.c)
+    def sundials_jtimes_petsc(self, v, Jv, t, y, fy, tmp):
+        """
+        Jacobian-times-vector product for cvode_petsc.CvodeSolver, see
+        `sundials_jtimes` and `sundials_rhs_petsc`.
 
+        """
+        m = y.getArray()
+        mp = v.getArray()
+        if self._H_eff_version != self._m_version:
+            self._write_m_distributed(m)
+            self._update_effective_field(t)
+
+        Hp = tmp.getArray()
+        self._field_derivative_distributed(m, mp, Hp)
+
+        char_time = 0.1 / self.c
+        native_llg.calc_llg_jtimes_dofs(m, self.effective_field.H_eff, mp, Hp, t, Jv.getArray(),
+                                        self.gamma, self._alpha_local, char_time,
+                                        self.do_precession, np.array([], dtype="int"),
+                                        self.local_nodes)
         return 0
-    """
+
+    def _field_derivative_distributed(self, m, mp, Hp):
+        """
+        Store H' = dH_eff(m + a m')/da in `Hp`. The interactions in the
+        Jacobian are evaluated at m', which is exact for the fields that
+        are linear in m (the only ones allowed in the Jacobian in parallel,
+        see `setup_distributed`) and doesn't need the gathered matrices
+        used by the JacobianOperator.
+
+        """
+        Hp[:] = 0
+        interactions = [interaction for interaction in self.effective_field.interactions.itervalues()
+                        if interaction.in_jacobian]
+        if interactions:
+            self._write_m_distributed(mp)
+            for interaction in interactions:
+                Hp += interaction.compute_field()
+            # restore the magnetisation, which still belongs to H_eff
+            self._write_m_distributed(m)
 
     # Computes the Jacobian-times-vector product, as used by SUNDIALS CVODE
     @timer.method
@@ -406,42 +627,51 @@ class LLG(object):
         The actual implementation of the jacobian-times-vector product is in src/llg/llg.cc,
         function calc_llg_jtimes(...), which in turn makes use of CVSpilsJacTimesVecFn in CVODE.
         """
-        assert m.shape == self._m_field.get_ordered_numpy_array_xxx().shape
-        assert mp.shape == m.shape
-        assert tmp.shape == m.shape
+        if self.dof_order:
+            return self._sundials_jtimes_dofs(mp, J_mp, t, m, fy, tmp)
 
-        # First, compute the derivative H' = dH_eff/dt
-        self._m_field.set_with_ordered_numpy_array_xxx(mp)
-        Hp = tmp.view()
-        Hp[:] = self.effective_field.compute_jacobian_only(t)[self.v2d_xxx]
+        # CVODE hands us the state of its last right hand side evaluation,
+        # so H_eff only needs to be recomputed if another state has been
+        # written into the magnetisation since then.
+        if self._H_eff_version != self._m_version:
+            self._write_m(m)
+            self._update_effective_field(t)
 
-        if not hasattr(self, '_reuse_jacobean') or not self._reuse_jacobean:
-            # If the field m has changed, recompute H_eff as well
-            if not np.array_equal(self.m_numpy, m):
-                self.m_field.set_with_ordered_numpy_array_xxx(m)
-                self.effective_field.update(t)
-            else:
-                pass
-                # print "This actually happened."
-                #import sys; sys.exit()
+        # Now compute the derivative H' = dH_eff(m + a m')/da (without
+        # touching the magnetisation, see JacobianOperator).
+        Hp = tmp
+        self.jacobian_operator.apply(t, m, mp, Hp)
 
-        m.shape = (3, -1)
-        mp.shape = (3, -1)
-        Hp.shape = (3, -1)
-        J_mp.shape = (3, -1)
         # Use the same characteristic time as defined by c
         char_time = 0.1 / self.c
-        Heff2 = self.effective_field.H_eff[self.v2d_xxx]
-        native_llg.calc_llg_jtimes(m, Heff2.reshape((3, -1)), mp, Hp, t, J_mp, self.gamma,
-                                   self.alpha.vector().array()[self.v2d_scale], char_time, self.do_precession, self.pins)
-        J_mp.shape = (-1, )
-        m.shape = (-1,)
-        mp.shape = (-1,)
-        tmp.shape = (-1,)
+        H_eff = self._H_eff_state
+        np.take(self.effective_field.H_eff, self.v2d_xxx, out=H_eff)
+        native_llg.calc_llg_jtimes(m.reshape((3, -1)), H_eff.reshape((3, -1)),
+                                   mp.reshape((3, -1)), Hp.reshape((3, -1)), t,
+                                   J_mp.reshape((3, -1)), self.gamma, self._alpha,
+                                   char_time, self.do_precession, self.pins)
 
         # Nonnegative exit code indicates success
         return 0
 
+    def _sundials_jtimes_dofs(self, mp, J_mp, t, m, fy, tmp):
+        """
+        Same as `sundials_jtimes`, but all vectors are in dolfin dof order.
+
+        """
+        if self._H_eff_version != self._m_version:
+            self._write_m(m)
+            self._update_effective_field(t)
+
+        Hp = tmp
+        self.jacobian_operator.apply(t, m, mp, Hp)
+
+        char_time = 0.1 / self.c
+        native_llg.calc_llg_jtimes_dofs(m, self.effective_field.H_eff, mp, Hp, t, J_mp,
+                                        self.gamma, self._alpha, char_time,
+                                        self.do_precession, self.pins, self._v2d_nodes)
+        return 0
+
     def use_slonczewski(self, J, P, d, p, Lambda=2, epsilonprime=0.0, with_time_update=None):
         """
         Activates the computation of the Slonczewski spin-torque term in the LLG.
@@ -479,6 +709,9 @@ class LLG(object):
                    constant (and only varying with time).
 
         """
+        if self.dof_order:
+            raise NotImplementedError(
+                "The Slonczewski term is not supported with dof_order=True.")
         self.do_slonczewski = True
         self.fun_slonczewski_time_update = with_time_update
 
@@ -542,7 +775,9 @@ class LLG(object):
 
         We do not use a position dependent function for performance reasons.
         """
-
+        if self.dof_order:
+            raise NotImplementedError(
+                "The Zhang-Li term is not supported with dof_order=True.")
         self.do_zhangli = True
         self.fun_zhangli_time_update = with_time_update
         self._J = helpers.vector_valued_function(J_profile, self.S3)
@@ -3,6 +3,9 @@
 #include <stdexcept>
 #include <dolfin.h>
 #include <dolfin/function/Function.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 #include "equation.h"
 #include "derivatives.h"
 
@@ -14,6 +17,20 @@ namespace dolfin { namespace finmag {
         }
     }
 
+    void set_openmp_threads(int n) {
+#ifdef _OPENMP
+        omp_set_num_threads(n);
+#endif
+    }
+
+    int get_openmp_threads() {
+#ifdef _OPENMP
+        return omp_get_max_threads();
+#else
+        return 1;
+#endif
+    }
+
     Equation::Equation(GenericVector const& m,
                        GenericVector const& H,
                        GenericVector& dmdt) :
@@ -38,6 +55,39 @@ namespace dolfin { namespace finmag {
         /* temporary workaround to deal with the reordering of nodes that may
          * or may not be disabled. paramaters is defined in dolfin.h. */
         reorder_dofs_serial = parameters["reorder_dofs_serial"];
+        init_node_dofs();
+    }
+
+    /* Fill the tables with the local index of each component of each node. */
+    void Equation::init_node_dofs() {
+        std::size_t const nodes = magnetisation.local_size() / 3;
+        dofs_x.resize(nodes); dofs_y.resize(nodes); dofs_z.resize(nodes);
+        for (std::size_t node=0; node < nodes; ++node) {
+            if (!reorder_dofs_serial) {
+                /* temporary measure until our code doesn't rely 
+                 * on the reordering of dofs being disabled */
+                dofs_x[node] = node; dofs_y[node] = node + nodes; dofs_z[node] = node + 2 * nodes;
+            }
+            else {
+                /* Scalar fields have one degree of freedom per node. When we iterate
+                 * over the nodes, we can thus use the iteration counter to access the
+                 * corresponding degree of freedom.
+                 * Vector fields have 3 degrees of freedom per node. To get the index
+                 * of the first degree of freedom for a node, we thus have to multiply
+                 * the iteration counter by 3. That yields 'x'. Adding 1 and 2 gives us
+                 * 'y' and 'z' respectively. */
+                dofs_x[node] = 3 * node; dofs_y[node] = 3 * node + 1; dofs_z[node] = 3 * node + 2;
+            }
+        }
+    }
+
+    /* Return the number of nodes, after checking that it matches the size of alpha. */
+    long Equation::check_nodes(std::vector<double> const& a) const {
+        if (a.size() != dofs_x.size()) {
+            throw std::length_error("alpha and m: " + std::to_string(a.size()) + " vs. "
+                                    + std::to_string(dofs_x.size()) + " nodes");
+        }
+        return a.size();
     }
 
     std::shared_ptr<GenericVector> Equation::get_pinned_nodes() const { return pinned_nodes; } 
@@ -82,26 +132,14 @@ namespace dolfin { namespace finmag {
         if (saturation_magnetisation) saturation_magnetisation->get_local(Ms);
         if (current_density) current_density->get_local(J);
 
-        std::vector<double>::size_type x=0, y=0, z=0;
-        std::vector<double>::size_type const offset = a.size();
-        /* this can be reintroduced as soon as our code doesn't rely on
-         * disabled reordering anymore: #pragma omp parallel for schedule(guided) */
-        for (std::vector<double>::size_type node=0; node < a.size(); ++node) {
-            if (!reorder_dofs_serial) {
-                /* temporary measure until our code doesn't rely 
-                 * on the reordering of dofs being disabled */
-                x = node; y = x + offset; z = y + offset;
-            }
-            else {
-                /* Scalar fields have one degree of freedom per node. When we iterate
-                 * over the nodes, we can thus use the iteration counter to access the
-                 * corresponding degree of freedom.
-                 * Vector fields have 3 degrees of freedom per node. To get the index
-                 * of the first degree of freedom for a node, we thus have to multiply
-                 * the iteration counter by 3. That yields 'x'. Adding 1 and 2 gives us
-                 * 'y' and 'z' respectively. */
-                x = 3 * node; y = x + 1; z = x + 2;
-            }
+        bool const stt_slonczewski_on = slonczewski_status();
+        bool const stt_zhangli_on = zhangli_status();
+        long const nodes = check_nodes(a);
+        /* The nodes are independent of each other, each iteration only writes
+         * to the degrees of freedom of its own node. */
+        #pragma omp parallel for schedule(guided)
+        for (long node=0; node < nodes; ++node) {
+            std::size_t const x = dofs_x[node], y = dofs_y[node], z = dofs_z[node];
             dmdt[x] = 0; dmdt[y] = 0; dmdt[z] = 0;
 
             if (pinned_nodes && pinned[node]) {
@@ -111,8 +149,8 @@ namespace dolfin { namespace finmag {
             damping(a[node], gamma, m[x], m[y], m[z], H[x], H[y], H[z], dmdt[x], dmdt[y], dmdt[z]);
             if (do_precession) precession(a[node], gamma, m[x], m[y], m[z], H[x], H[y], H[z], dmdt[x], dmdt[y], dmdt[z]);
             relaxation(parallel_relaxation_rate, m[x], m[y], m[z], dmdt[x], dmdt[y], dmdt[z]);
-            if (slonczewski_status()) stt_slonczewski->compute(a[node], gamma, J[node], Ms[node], m[x], m[y], m[z], dmdt[x], dmdt[y], dmdt[z]);
-            if (zhangli_status()) stt_zhangli->compute(a[node], Ms[node], m[x], m[y], m[z], J[x], J[y], J[z], dmdt[x], dmdt[y], dmdt[z]);
+            if (stt_slonczewski_on) stt_slonczewski->compute(a[node], gamma, J[node], Ms[node], m[x], m[y], m[z], dmdt[x], dmdt[y], dmdt[z]);
+            if (stt_zhangli_on) stt_zhangli->compute(a[node], Ms[node], m[x], m[y], m[z], J[x], J[y], J[z], dmdt[x], dmdt[y], dmdt[z]);
         }
 
         derivative.set_local(dmdt);
@@ -132,26 +170,12 @@ namespace dolfin { namespace finmag {
         if (saturation_magnetisation) saturation_magnetisation->get_local(Ms);
         if (current_density) current_density->get_local(J);
 
-        std::vector<double>::size_type x=0, y=0, z=0;
-        std::vector<double>::size_type const offset = a.size();
-        /* this can be reintroduced as soon as our code doesn't rely on
-         * disabled reordering anymore: #pragma omp parallel for schedule(guided) */
-        for (std::vector<double>::size_type node=0; node < a.size(); ++node) {
-            if (!reorder_dofs_serial) {
-                /* temporary measure until our code doesn't rely 
-                 * on the reordering of dofs being disabled */
-                x = node; y = x + offset; z = y + offset;
-            }
-            else {
-                /* Scalar fields have one degree of freedom per node. When we iterate
-                 * over the nodes, we can thus use the iteration counter to access the
-                 * corresponding degree of freedom.
-                 * Vector fields have 3 degrees of freedom per node. To get the index
-                 * of the first degree of freedom for a node, we thus have to multiply
-                 * the iteration counter by 3. That yields 'x'. Adding 1 and 2 gives us
-                 * 'y' and 'z' respectively. */
-                x = 3 * node; y = x + 1; z = x + 2;
-            }
+        long const nodes = check_nodes(a);
+        /* The nodes are independent of each other, each iteration only writes
+         * to the degrees of freedom of its own node. */
+        #pragma omp parallel for schedule(guided)
+        for (long node=0; node < nodes; ++node) {
+            std::size_t const x = dofs_x[node], y = dofs_y[node], z = dofs_z[node];
             jtimes[x] = 0; jtimes[y] = 0; jtimes[z] = 0;
 
             if (pinned_nodes && pinned[node]) {
@@ -180,26 +204,14 @@ namespace dolfin { namespace finmag {
         if (saturation_magnetisation) saturation_magnetisation->get_local(Ms);
         if (current_density) current_density->get_local(J);
 
-        std::vector<double>::size_type x=0, y=0, z=0;
-        std::vector<double>::size_type const offset = a.size();
-        /* this can be reintroduced as soon as our code doesn't rely on
-         * disabled reordering anymore: #pragma omp parallel for schedule(guided) */
-        for (std::vector<double>::size_type node=0; node < a.size(); ++node) {
-            if (!reorder_dofs_serial) {
-                /* temporary measure until our code doesn't rely 
-                 * on the reordering of dofs being disabled */
-                x = node; y = x + offset; z = y + offset;
-            }
-            else {
-                /* Scalar fields have one degree of freedom per node. When we iterate
-                 * over the nodes, we can thus use the iteration counter to access the
-                 * corresponding degree of freedom.
-                 * Vector fields have 3 degrees of freedom per node. To get the index
-                 * of the first degree of freedom for a node, we thus have to multiply
-                 * the iteration counter by 3. That yields 'x'. Adding 1 and 2 gives us
-                 * 'y' and 'z' respectively. */
-                x = 3 * node; y = x + 1; z = x + 2;
-            }
+        bool const stt_slonczewski_on = slonczewski_status();
+        bool const stt_zhangli_on = zhangli_status();
+        long const nodes = check_nodes(a);
+        /* The nodes are independent of each other, each iteration only writes
+         * to the degrees of freedom of its own node. */
+        #pragma omp parallel for schedule(guided)
+        for (long node=0; node < nodes; ++node) {
+            std::size_t const x = dofs_x[node], y = dofs_y[node], z = dofs_z[node];
             dmdt[x] = 0; dmdt[y] = 0; dmdt[z] = 0;
 
             if (pinned_nodes && pinned[node]) {
@@ -209,8 +221,8 @@ namespace dolfin { namespace finmag {
             damping(a[node], gamma, m[x], m[y], m[z], H[x], H[y], H[z], dmdt[x], dmdt[y], dmdt[z]);
             if (do_precession) precession(a[node], gamma, m[x], m[y], m[z], H[x], H[y], H[z], dmdt[x], dmdt[y], dmdt[z]);
             relaxation(parallel_relaxation_rate, m[x], m[y], m[z], dmdt[x], dmdt[y], dmdt[z]);
-            if (slonczewski_status()) stt_slonczewski->compute(a[node], gamma, J[node], Ms[node], m[x], m[y], m[z], dmdt[x], dmdt[y], dmdt[z]);
-            if (zhangli_status()) stt_zhangli->compute(a[node], Ms[node], m[x], m[y], m[z], J[x], J[y], J[z], dmdt[x], dmdt[y], dmdt[z]);
+            if (stt_slonczewski_on) stt_slonczewski->compute(a[node], gamma, J[node], Ms[node], m[x], m[y], m[z], dmdt[x], dmdt[y], dmdt[z]);
+            if (stt_zhangli_on) stt_zhangli->compute(a[node], Ms[node], m[x], m[y], m[z], J[x], J[y], J[z], dmdt[x], dmdt[y], dmdt[z]);
         }
 
         vec_dmdt.set_local(dmdt);
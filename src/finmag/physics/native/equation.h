@@ -6,6 +6,11 @@
 
 /* compile_extension_module needs code to be wrapped in the dolfin namespace */
 namespace dolfin { namespace finmag {
+    /* Number of OpenMP threads used by Equation (and all other OpenMP code
+     * in the process). */
+    void set_openmp_threads(int n);
+    int get_openmp_threads();
+
     class Equation {
         public:
             Equation(GenericVector const& m,
@@ -59,5 +64,12 @@ namespace dolfin { namespace finmag {
             /* temporary measure to see if we have disabled dolfin's
              * reordering of degrees of freedom. */
             bool reorder_dofs_serial;
+
+            /* Local indices of the x, y and z components of each node in the
+             * vector fields, so that the nodes can be processed independently
+             * of each other. */
+            std::vector<std::size_t> dofs_x, dofs_y, dofs_z;
+            void init_node_dofs();
+            long check_nodes(std::vector<double> const& a) const;
     };
 }}
@@ -62,7 +62,7 @@ namespace dolfin { namespace finmag {
     void Slonczewski::compute(double const& alpha, double const& gamma,
                             double const& J, double const& Ms,
                             double const& m_x, double const& m_y, double const& m_z,
-                            double& dm_x, double& dm_y, double& dm_z) {
+                            double& dm_x, double& dm_y, double& dm_z) const {
         double const mm = m_x * m_x + m_y * m_y + m_z * m_z; /* for the vector triple product expansion */
         double const mp = m_x * p_x + m_y * p_y + m_z * p_z; /* also known as Lagrange's formula */
 
@@ -82,7 +82,7 @@ namespace dolfin { namespace finmag {
     }
 
     /* Compute the Zhang-Li spin-torque term for one node. */
-    ZhangLi::ZhangLi(double const u__0, double const beta) :
+    ZhangLi::ZhangLi(double const u_0, double const beta) :
             u_0(u_0),
             beta(beta) {
     }
@@ -90,7 +90,7 @@ namespace dolfin { namespace finmag {
     void ZhangLi::compute(double const& alpha, double const& Ms,
                           double const& m_x, double const& m_y, double const& m_z,
                           double const& tau_x, double const& tau_y, double const& tau_z,
-                          double& dm_x, double& dm_y, double& dm_z) {
+                          double& dm_x, double& dm_y, double& dm_z) const {
         double const coeff_stt = (Ms == 0) ? 0 : u_0 / (1 + alpha * alpha) / Ms;
         double const mtau = m_x * tau_x + m_y * tau_y + m_z * tau_z;
         double const tau_perp_x = tau_x - mtau * m_x;
@@ -23,7 +23,7 @@ namespace dolfin { namespace finmag {
             void compute(double const& alpha, double const& gamma,
                          double const& J, double const& Ms,
                          double const& m_x, double const& m_y, double const& m_z,
-                         double& dm_x, double& dm_y, double& dm_z);
+                         double& dm_x, double& dm_y, double& dm_z) const;
         private:
             double lambda;
             double P; /* degree of polarisation */
@@ -38,7 +38,7 @@ namespace dolfin { namespace finmag {
             void compute(double const& alpha, double const& Ms,
                          double const& m_x, double const& m_y, double const& m_z,
                          double const& g_x, double const& g_y, double const& g_z,
-                         double& dm_x, double& dm_y, double& dm_z);
+                         double& dm_x, double& dm_y, double& dm_z) const;
         private:
             double u_0;
             double beta;
@@ -1,4 +1,5 @@
 import os
+import multiprocessing
 import dolfin as df
 import numpy as np
 import inspect
@@ -15,6 +16,7 @@ from finmag.native import sundials
 import finmag.native.neb as native_neb
 
 from finmag.util.fileio import Tablewriter, Tablereader
+from finmag.util.worker_pool import WorkerPool
 
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.colors import colorConverter
@@ -248,13 +250,35 @@ def compute_dm(m0, m1):
     return dm
 
 
+# State of the worker processes of NEB_Sundials, set by _init_neb_worker():
+# the effective field of the worker's simulation and numpy views of the
+# shared buffers for the magnetisations, fields and energies of the images.
+_worker = {}
+
+
+def _init_neb_worker(demag_bem, recipe, buffers, shape):
+    _worker['effective_field'] = recipe(demag_bem).llg.effective_field
+    ms_buffer, H_buffer, E_buffer = buffers
+    _worker['ms'] = np.frombuffer(ms_buffer).reshape(shape)
+    _worker['H'] = np.frombuffer(H_buffer).reshape(shape)
+    _worker['E'] = np.frombuffer(E_buffer)
+
+
+def _compute_neb_images(args):
+    start, stop = args
+    H, E = _worker['effective_field'].compute_batch(_worker['ms'][start:stop])
+    _worker['H'][start:stop] = H
+    _worker['E'][start:stop] = E
+
+
 class NEB_Sundials(object):
 
     """
     Nudged elastic band method by solving the differential equation using Sundials.
     """
 
-    def __init__(self, sim, initial_images, interpolations=None, spring=5e5, name='unnamed'):
+    def __init__(self, sim, initial_images, interpolations=None, spring=5e5, name='unnamed',
+                 recipe=None, processes=None):
         """
           *Arguments*
 
@@ -287,6 +311,20 @@ class NEB_Sundials(object):
               disable_tangent: this is an experimental option, by disabling the
               tangent, we can get a rough feeling about the local energy minima quickly.
 
+              recipe: a picklable callable (see finmag.sim.hysteresis.
+              hysteresis_parallel) which is called as `recipe(demag_bem)`
+              and returns a new Simulation with the same mesh and
+              interactions as `sim`, passing `demag_bem` on to
+              `demag.precomputed_bem(*demag_bem)` if it is not None. If
+              given, the fields and energies of the images are computed by
+              a pool of `processes` worker processes (default: the number
+              of CPUs), each of which creates its own simulation once. The
+              boundary element matrix of the demag is shared with them
+              through a memory-mapped file and the magnetisations, fields
+              and energies are exchanged through shared memory. Call
+              close_workers() or use the object as a context manager to
+              stop the processes; otherwise they are stopped at exit.
+
         """
 
         self.sim = sim
@@ -346,6 +384,10 @@ class NEB_Sundials(object):
         self.ode_count = 1
         self.integrator = None
 
+        self.recipe = recipe
+        self.processes = processes or multiprocessing.cpu_count()
+        self._pool = None
+
         self.initial_image_coordinates()
         self.create_tablewriter()
 
@@ -477,21 +519,14 @@ class NEB_Sundials(object):
         m2 = self.sim.m_field.get_ordered_numpy_array_xxx()
         self.coords[image_id][:] = cartesian2spherical(m2)
 
-        # Save the energies
-        for i in range(self.total_image_num):
-            # To assign the values from the full array using set_local
-            # (with boundaries when using PBCs) to a reduced 
-            # sim.m_field.vector() ,
-            # we use the ordered dof to vertex map (d2v_xxx),
-            # which has a reduced number of indexes
-            # (we take the value from the field class)
-            self._m.vector().set_local(spherical2cartesian(self.coords[i])[self.sim.m_field.d2v_xxx])
-            
-            # This is for checking that the interpolations worked
-            # df.plot(self._m, interactive=True)
-
-            self.effective_field.update()
-            self.energy[i] = self.effective_field.total_energy()
+        # Save the energies, which are computed for all images at once.
+        # To get the reduced dolfin vectors from the full arrays
+        # (with boundaries when using PBCs), we use the ordered dof to
+        # vertex map (d2v_xxx), which has a reduced number of indexes
+        # (we take the value from the field class)
+        ms = np.array([spherical2cartesian(self.coords[i])[self.sim.m_field.d2v_xxx]
+                       for i in range(self.total_image_num)])
+        _, self.energy[:] = self.compute_batch(ms)
 
         # Flatten the array
         self.coords.shape = (-1,)
@@ -563,6 +598,55 @@ class NEB_Sundials(object):
 
         self.integrator = integrator
 
+    def compute_batch(self, ms):
+        """
+        Return the effective fields and the total energies of the
+        magnetisations `ms` (one per row, in the order of the degrees of
+        freedom), see EffectiveField.compute_batch. If a recipe was given,
+        the images are distributed over the worker processes.
+
+        """
+        if self.recipe is None:
+            return self.effective_field.compute_batch(ms)
+        if self._pool is None:
+            self._start_workers()
+
+        k = len(ms)
+        self._ms[:k] = ms
+        chunks = [(c[0], c[-1] + 1) for c in np.array_split(np.arange(k), self.processes)
+                  if len(c) > 0]
+        self._pool.map(_compute_neb_images, chunks)
+        return self._H[:k].copy(), self._E[:k].copy()
+
+    def _start_workers(self):
+        shape = (self.total_image_num, self._m.vector().local_size())
+        buffers = (multiprocessing.RawArray('d', shape[0] * shape[1]),
+                   multiprocessing.RawArray('d', shape[0] * shape[1]),
+                   multiprocessing.RawArray('d', shape[0]))
+        self._ms = np.frombuffer(buffers[0]).reshape(shape)
+        self._H = np.frombuffer(buffers[1]).reshape(shape)
+        self._E = np.frombuffer(buffers[2])
+
+        log.info("Computing the images with {} worker processes.".format(self.processes))
+        self._pool = WorkerPool(self.sim, self.processes, _init_neb_worker,
+                                (self.recipe, buffers, shape))
+
+    def close_workers(self):
+        """
+        Stop the worker processes (if any). They are started again when
+        needed.
+
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_workers()
+
     def compute_effective_field(self, y):
         """
         Compute the effective field and the tangents using the
@@ -573,34 +657,30 @@ class NEB_Sundials(object):
         finmag/native/src/neb/helper.cc
         """
         y.shape = (self.total_image_num, -1)
- 
+
+        # Redefine the angles if phi is larger than pi
+        # (see the corresponding function)
         for i in range(self.image_num):
-            # Redefine the angles if phi is larger than pi
-            # (see the corresponding function)
             check_boundary(y[i + 1])
-            # Transform the input 'y'  to cartesian to compute the fields
-            #
-            # spherical2cartesian updates the full system vector (y), but to update
-            # the magnetisation we only need the reduced vector, thus
-            # we use the d2v map
-            self._m.vector().set_local(spherical2cartesian(y[i + 1])[self.sim.m_field.d2v_xxx])
-            #
-            self.effective_field.update()
-            # Compute effective field, which is the gradient of
-            # the energy in the NEB method (derivative with respect to
-            # the generalised coordinates)
-            #
+
+        # Transform the input 'y' to cartesian to compute the fields.
+        #
+        # spherical2cartesian gives the full system vector (y), but to set
+        # the magnetisation we only need the reduced vector, thus
+        # we use the d2v map
+        ms = np.array([spherical2cartesian(y[i + 1])[self.sim.m_field.d2v_xxx]
+                       for i in range(self.image_num)])
+
+        # Compute the effective fields and the total energies of all images
+        # together. The effective field is the gradient of the energy in the
+        # NEB method (derivative with respect to the generalised coordinates)
+        H, self.energy[1:-1] = self.compute_batch(ms)
+
+        for i in range(self.image_num):
             # To get the effective field for the whole system we use the v2d map
-            h = self.effective_field.H_eff[self.sim.m_field.v2d_xxx]
+            h = H[i][self.sim.m_field.v2d_xxx]
             # Transform to spherical coordinates
-            
-            # DEBUG 
-            # print len(h)
-            # print len(y[i + 1])
-            
             self.Heff[i, :] = cartesian2spherical_field(h, y[i + 1])
-            # Compute the total energy
-            self.energy[i + 1] = self.effective_field.total_energy()
 
             # Compute the 'distance' or difference between neighbouring states
             # around y[i+1]. This is used to compute the spring force
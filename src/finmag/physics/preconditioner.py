@@ -0,0 +1,228 @@
+import logging
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import spilu
+from aeon import timer
+from finmag.util.helpers import petsc_matrix_to_csr
+
+logger = logging.getLogger(name='finmag')
+
+
+def cross_product_matrices(v):
+    """
+    Given an array `v` of shape (3, n), return an array of shape (n, 3, 3)
+    containing the matrices [v_i]_x such that [v_i]_x w = v_i x w.
+
+    """
+    n = v.shape[1]
+    C = np.zeros((n, 3, 3))
+    C[:, 0, 1] = -v[2]
+    C[:, 0, 2] = v[1]
+    C[:, 1, 0] = v[2]
+    C[:, 1, 2] = -v[0]
+    C[:, 2, 0] = -v[1]
+    C[:, 2, 1] = v[0]
+    return C
+
+
+def block_diagonal_matrix(blocks, positions, size):
+    """
+    Assemble a sparse (size x size) matrix from the (n, 3, 3) array of
+    node blocks `blocks`. The three rows/columns of block i are the entries
+    positions[:, i] of the (3, n) integer array `positions`.
+
+    """
+    rows = np.repeat(positions.T, 3, axis=1)  # (n, 9): r0 r0 r0 r1 r1 r1 ...
+    cols = np.tile(positions.T, (1, 3))       # (n, 9): c0 c1 c2 c0 c1 c2 ...
+    return sp.csr_matrix((blocks.reshape(-1), (rows.reshape(-1), cols.reshape(-1))),
+                         shape=(size, size))
+
+
+class ExchangePreconditioner(object):
+    """
+    Preconditioner for the linear systems
+
+    .. math::
+
+        (I - \\gamma J) z = r
+
+    that CVODE solves with GMRES in every Newton iteration when the
+    integrator method is 'bdf_gmres_prec_exchange'.
+
+    The Jacobian J of the LLG equation is approximated by linearising it
+    around the current magnetisation m and effective field H, keeping only
+    those field contributions that are given by an assembled stiffness
+    matrix (exchange and, if present, assembled anisotropy or DMI). With
+    H = K m for these interactions, the approximation reads
+
+    .. math::
+
+        J \\approx L(m, H) + C(m) K,
+
+    where L and C are 3x3 blocks per node (the derivatives of the LLG
+    right hand side with respect to m and H). The matrix I - gamma J is
+    sparse and is factorised with an incomplete LU decomposition.
+
+    The linearisation is only recomputed when CVODE asks for it (jok is
+    False); if only gamma has changed the stored Jacobian is reused and
+    just the factorisation is redone.
+
+    *Arguments*
+
+        llg
+            The LLG object whose right hand side is being integrated.
+
+        interactions
+            Names of the interactions whose matrices should be used. By
+            default all interactions that are in the Jacobian and have an
+            assembled PETSc matrix ('box-matrix-petsc') are used.
+
+        drop_tol, fill_factor
+            Passed on to scipy.sparse.linalg.spilu.
+
+    """
+
+    def __init__(self, llg, interactions=None, drop_tol=1e-4, fill_factor=10):
+        self.llg = llg
+        self.interaction_names = interactions
+        self.drop_tol = drop_tol
+        self.fill_factor = fill_factor
+        self.K = None
+        self.J = None
+        self.ilu = None
+        self.n_setups = 0
+        self.n_jacobian_updates = 0
+
+    def _state_positions(self):
+        """
+        Return `(positions, dofs)`, where positions[:, i] are the indices
+        of the three components of vertex i in the integrator's state
+        vector and dofs[j] is the dolfin dof stored at state index j.
+
+        """
+        v2d_nodes = self.llg._v2d_nodes
+        if getattr(self.llg, 'dof_order', False):
+            return v2d_nodes, np.arange(self.llg._m_field.f.vector().local_size())
+        n = v2d_nodes.shape[1]
+        return np.arange(3 * n).reshape((3, n)), self.llg.v2d_xxx
+
+    def _assemble_stiffness_matrix(self):
+        """
+        Sum up the (volume scaled) matrices of the linear interactions and
+        permute them into the order of the integrator's state vector.
+
+        """
+        effective_field = self.llg.effective_field
+        if self.interaction_names is None:
+            names = [name for name, interaction in effective_field.interactions.iteritems()
+                     if interaction.in_jacobian and hasattr(interaction, 'g_petsc')]
+        else:
+            names = self.interaction_names
+
+        _, dofs = self._state_positions()
+        K = None
+        for name in names:
+            interaction = effective_field.get(name)
+            if not hasattr(interaction, 'g_petsc'):
+                raise ValueError(
+                    "Interaction '{}' has no assembled matrix and can't be "
+                    "used for preconditioning.".format(name))
+            g = petsc_matrix_to_csr(interaction.g_petsc)
+            g = sp.diags(1.0 / interaction.nodal_volume_S3, 0).dot(g)
+            K = g if K is None else K + g
+        if K is None:
+            logger.warning("No interaction with an assembled matrix found; "
+                           "the preconditioner only uses the local terms.")
+            K = sp.csr_matrix((len(dofs), len(dofs)))
+        logger.debug("Preconditioner uses the matrices of {}.".format(names))
+        return K.tocsr()[dofs][:, dofs].tocsr()
+
+    @timer.method
+    def compute_jacobian(self, t, y):
+        """
+        Linearise the LLG equation around the state `y` at time `t`.
+
+        """
+        llg = self.llg
+        if self.K is None:
+            self.K = self._assemble_stiffness_matrix()
+
+        llg.sundials_m = y
+        llg._update_effective_field(t)
+
+        positions, _ = self._state_positions()
+        m = y[positions]
+        H = llg.effective_field.H_eff[llg._v2d_nodes]
+        n = m.shape[1]
+
+        alpha = llg._alpha
+        gamma_LL = llg.gamma / (1 + alpha ** 2)
+        damping_coeff = -alpha * gamma_LL
+
+        I = np.zeros((n, 3, 3))
+        I[:, 0, 0] = I[:, 1, 1] = I[:, 2, 2] = 1
+        mm = np.einsum('in,in->n', m, m)
+        mH = np.einsum('in,in->n', m, H)
+        m_mT = np.einsum('in,jn->nij', m, m)
+        m_HT = np.einsum('in,jn->nij', m, H)
+        H_mT = np.einsum('in,jn->nij', H, m)
+
+        # derivative with respect to m for fixed H:
+        # damping:    -alpha gamma_LL (m (m.H) - H (m.m))
+        # relaxation: c (1 - m.m) m
+        L = damping_coeff[:, np.newaxis, np.newaxis] * \
+            (mH[:, np.newaxis, np.newaxis] * I + m_HT - 2 * H_mT)
+        L += llg.c * ((1 - mm)[:, np.newaxis, np.newaxis] * I - 2 * m_mT)
+
+        # derivative with respect to H for fixed m
+        C = damping_coeff[:, np.newaxis, np.newaxis] * \
+            (m_mT - mm[:, np.newaxis, np.newaxis] * I)
+
+        if llg.do_precession:
+            # precession: -gamma_LL m x H
+            L += gamma_LL[:, np.newaxis, np.newaxis] * cross_product_matrices(H)
+            C -= gamma_LL[:, np.newaxis, np.newaxis] * cross_product_matrices(m)
+
+        # pinned nodes have dm/dt = 0
+        pins = llg.pins
+        if len(pins) > 0:
+            L[pins] = 0
+            C[pins] = 0
+
+        size = len(y)
+        self.J = block_diagonal_matrix(L, positions, size) + \
+            block_diagonal_matrix(C, positions, size).dot(self.K)
+        self.n_jacobian_updates += 1
+
+    def setup(self, t, y, jok, gamma):
+        """
+        Prepare the preconditioner for the value of `gamma` given by CVODE.
+        Returns True if the Jacobian data was recomputed.
+
+        """
+        jcur = False
+        if not jok or self.J is None:
+            self.compute_jacobian(t, y)
+            jcur = True
+
+        P = sp.identity(len(y), format='csr') - gamma * self.J
+        self.ilu = spilu(P.tocsc(), drop_tol=self.drop_tol, fill_factor=self.fill_factor)
+        self.n_setups += 1
+        return jcur
+
+    def solve(self, r, z):
+        """
+        Compute z = P^{-1} r.
+
+        """
+        z[:] = self.ilu.solve(r)
+
+    def reset(self):
+        """
+        Forget the assembled stiffness matrix, e.g. after a material
+        parameter of one of the interactions has changed.
+
+        """
+        self.K = None
+        self.J = None
+        self.ilu = None
@@ -50,6 +50,40 @@ def test_cartesian2spherical_field():
     assert abs(res[0] - pE_theta) < 1e-15
     assert abs(res[1] - pE_phi) < 1e-12
 
+def small_film_recipe(demag_bem):
+    from finmag.energies import Demag
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(20, 10, 2), 10, 5, 1)
+    sim = Sim(mesh, Ms=8.6e5, unit_length=1e-9)
+    sim.add(Exchange(1.3e-11))
+    sim.add(UniaxialAnisotropy(1e5, (0, 0, 1)))
+    demag = Demag()
+    if demag_bem is not None:
+        demag.precomputed_bem(*demag_bem)
+    sim.add(demag)
+    return sim
+
+
+def test_neb_worker_processes_agree_with_serial_computation(tmpdir):
+    from finmag.physics.neb import NEB_Sundials
+    os.chdir(str(tmpdir))
+
+    init_images = [(0, 0, 1), (1, 0, 0), (0, 0, -1)]
+    interpolations = [3, 3]
+    neb = NEB_Sundials(small_film_recipe(None), init_images, interpolations, name='serial')
+    with NEB_Sundials(small_film_recipe(None), init_images, interpolations,
+                      name='parallel', recipe=small_film_recipe, processes=2) as neb_par:
+        assert np.allclose(neb_par.energy, neb.energy, rtol=1e-5)
+
+        neb.compute_effective_field(neb.coords)
+        neb_par.compute_effective_field(neb_par.coords)
+        assert np.allclose(neb_par.Heff, neb.Heff, rtol=1e-5, atol=1e-5 * abs(neb.Heff).max())
+        pool = neb_par._pool
+        assert pool._tmpdir is not None and os.path.isdir(pool._tmpdir)
+        tmpdir = pool._tmpdir
+    assert neb_par._pool is None
+    assert not os.path.exists(tmpdir)
+
+
 if __name__ == "__main__":
 
     test_compute_dm()
@@ -3,6 +3,7 @@ import dolfin as df
 import pytest
 import os
 from finmag.example import barmini
+from finmag.util.helpers import average_field
 
 
 def test_effective_field_compute_returns_copy(tmpdir):
@@ -23,3 +24,178 @@ def test_effective_field_compute_returns_copy(tmpdir):
 
     assert np.allclose(h0, h0_copy, atol=0, rtol=1e-8)
     assert not np.allclose(h0, h1, atol=0, rtol=1e-8)
+
+
+def test_energy_estimate_from_cached_fields(tmpdir):
+    """
+    The energy estimate uses the fields of the last update and only
+    recomputes them if m has changed. For the quadratic energies of
+    the bar (exchange and demag) it agrees with the exact energy.
+
+    """
+    os.chdir(str(tmpdir))
+    sim = barmini()
+    sim.set_m(df.Expression(("1", "x[2] / 10", "0"), degree=1))
+    effective_field = sim.llg.effective_field
+
+    energies = effective_field.estimate_energies(sim.t)
+    for name in effective_field.all():
+        E = effective_field.get(name).compute_energy()
+        assert abs(energies[name] - E) < 5e-2 * abs(E)
+
+    effective_field._fields['Demag'][:] = 0
+    assert effective_field.estimate_energies(sim.t)['Demag'] == 0
+
+    sim.set_m((1, 0, 1))
+    assert effective_field.estimate_energies(sim.t)['Demag'] != 0
+    assert abs(sim.total_energy(estimate=True) - sim.total_energy()) < 5e-2 * abs(sim.total_energy())
+
+
+def test_fields_are_only_kept_on_request(tmpdir):
+    """
+    The evaluations of the time integrator don't keep the fields, but the
+    state that run_until writes back is kept, so that the energy estimate
+    doesn't compute the fields again.
+
+    """
+    os.chdir(str(tmpdir))
+    sim = barmini()
+    effective_field = sim.llg.effective_field
+    effective_field.update(sim.t)
+    assert not effective_field._fields_are_current(sim.t)
+
+    sim.run_until(1e-13)
+    assert effective_field._fields_are_current(sim.t)
+
+    demag = effective_field.get('Demag')
+    calls = []
+    compute_field = demag.compute_field
+
+    def counting_compute_field():
+        calls.append(1)
+        return compute_field()
+    demag.compute_field = counting_compute_field
+    sim.total_energy(estimate=True)
+    assert len(calls) == 0
+    effective_field.update(sim.t)
+    sim.total_energy(estimate=True)
+    assert len(calls) == 2
+    del demag.compute_field
+
+
+def test_kept_fields_follow_changes_of_the_interactions(tmpdir):
+    os.chdir(str(tmpdir))
+    sim = barmini()
+    sim.set_H_ext((1e5, 0, 0))
+    effective_field = sim.llg.effective_field
+
+    def keep_fields():
+        effective_field.update(sim.t, keep_fields=True)
+        assert effective_field._fields_are_current(sim.t)
+
+    keep_fields()
+    sim.set_H_ext((0, 1e5, 0))
+    assert not effective_field._fields_are_current(sim.t)
+    H = effective_field.current_interaction_field('Zeeman', sim.t)
+    assert np.allclose(average_field(H), [0, 1e5, 0])
+
+    keep_fields()
+    effective_field.get('Exchange').reassemble()
+    assert not effective_field._fields_are_current(sim.t)
+
+    keep_fields()
+    sim.Ms = 1e6
+    assert not effective_field._fields_are_current(sim.t)
+
+
+def test_fused_linear_interactions_give_same_field():
+    from finmag import Simulation
+    from finmag.energies import Exchange, DMI, UniaxialAnisotropy, Zeeman
+
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(20, 10, 4), 10, 5, 2)
+    sim = Simulation(mesh, Ms=8e5, unit_length=1e-9)
+    sim.set_m(df.Expression(("cos(x[0] / 5)", "sin(x[0] / 5)", "0.1"), degree=1))
+    sim.add(Exchange(13e-12))
+    sim.add(DMI(3e-3))
+    sim.add(UniaxialAnisotropy(5e4, (0, 0, 1)))
+    sim.add(Zeeman((0, 0, 1e5)))
+    effective_field = sim.llg.effective_field
+
+    H = effective_field.compute()
+    effective_field.fuse_linear = True
+    H_fused = effective_field.compute()
+    assert effective_field._fused == set(['Exchange', 'DMI', 'Anisotropy'])
+    assert np.allclose(H_fused, H, rtol=1e-10, atol=1e-10 * abs(H).max())
+
+    # the combined matrix follows the removal of an interaction
+    sim.remove_interaction('DMI')
+    effective_field.fuse_linear = False
+    H = effective_field.compute()
+    effective_field.fuse_linear = True
+    assert np.allclose(effective_field.compute(), H, rtol=1e-10, atol=1e-10 * abs(H).max())
+
+
+def test_fused_linear_operator_follows_parameter_changes():
+    from finmag import Simulation
+    from finmag.energies import Exchange, DMI
+
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(20, 10, 4), 10, 5, 2)
+    sim = Simulation(mesh, Ms=8e5, unit_length=1e-9)
+    sim.set_m(df.Expression(("cos(x[0] / 5)", "sin(x[0] / 5)", "0.1"), degree=1))
+    sim.add(Exchange(13e-12))
+    effective_field = sim.llg.effective_field
+    effective_field.fuse_linear = True
+    H_exchange = effective_field.compute()
+
+    def assert_same_as_unfused():
+        H_fused = effective_field.compute()
+        effective_field.fuse_linear = False
+        H = effective_field.compute()
+        effective_field.fuse_linear = True
+        assert np.allclose(H_fused, H, rtol=1e-10, atol=1e-10 * abs(H).max())
+
+    # adding an interaction
+    sim.add(DMI(3e-3))
+    assert_same_as_unfused()
+    assert 'DMI' in effective_field._fused
+
+    # changing a material parameter of a fused interaction in place
+    exchange = sim.get_interaction('Exchange')
+    exchange.A.f.vector()[:] = 2 * 13e-12
+    exchange.reassemble()
+    assert_same_as_unfused()
+
+    # changing Ms
+    sim.remove_interaction('DMI')
+    sim.Ms = 4e5
+    H = effective_field.compute()
+    assert np.allclose(H, 4 * H_exchange, rtol=1e-8, atol=1e-8 * abs(H).max())
+
+
+def test_batch_agrees_with_fields_and_energies_of_single_images():
+    from finmag import Simulation
+    from finmag.energies import Exchange, UniaxialAnisotropy, Zeeman, Demag
+
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(20, 10, 4), 10, 5, 2)
+    sim = Simulation(mesh, Ms=8e5, unit_length=1e-9)
+    sim.add(Exchange(13e-12))
+    sim.add(UniaxialAnisotropy(5e4, (0, 0, 1)))
+    sim.add(Zeeman((0, 0, 1e5)))
+    sim.add(Demag())
+    effective_field = sim.llg.effective_field
+
+    ms = []
+    Hs = []
+    Es = []
+    for k in range(3):
+        sim.set_m(df.Expression(("cos(k * x[0] / 5)", "sin(k * x[0] / 5)", "0.1"), k=k, degree=1))
+        ms.append(sim.m_field.get_numpy_array_debug())
+        Hs.append(effective_field.compute())
+        Es.append(effective_field.total_energy())
+    m_last = ms[-1].copy()
+
+    H, E = effective_field.compute_batch(np.array(ms))
+    for k in range(3):
+        assert np.allclose(H[k], Hs[k], rtol=1e-4, atol=1e-4 * abs(Hs[k]).max())
+    assert np.allclose(E, Es, rtol=1e-4)
+    assert np.array_equal(sim.m_field.get_numpy_array_debug(), m_last)
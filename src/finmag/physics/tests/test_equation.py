@@ -1,7 +1,8 @@
 import pytest
 import numpy as np
 import dolfin as df
-from finmag.physics.equation import Equation
+from finmag.physics.equation import Equation, get_equation_module, equation_module_name
+from finmag.native import llg as native_llg
 
 
 @pytest.fixture
@@ -51,6 +52,23 @@ def test_new_equation(setup):
     equation = Equation(m.vector(), H.vector(), dmdt.vector())
 
 
+def test_equation_module_is_cached():
+    name = equation_module_name()
+    assert name.startswith("equation_")
+    assert name == equation_module_name()
+    assert get_equation_module() is get_equation_module()
+
+
+def test_equation_module_name_without_sources(tmpdir, monkeypatch):
+    import finmag.physics.equation as equation
+    source_dir = tmpdir.join("native")  # doesn't exist
+    cache_dir = tmpdir.mkdir("build")
+    monkeypatch.setattr(equation, "_directories", lambda: (str(source_dir), str(cache_dir)))
+    assert equation.equation_module_name() == "equation"
+    cache_dir.join(equation.MANIFEST).write("equation_0123456789abcdef\n")
+    assert equation.equation_module_name() == "equation_0123456789abcdef"
+
+
 def test_new_equation_wrong_size(setup):
     mesh, V, alpha, W, m, H, dmdt = setup
     W = df.VectorFunctionSpace(mesh, "CG", 2, dim=3)  # W like Wrong
@@ -103,6 +121,39 @@ def test_solve(setup):
     assert same(dmdt.vector(), dmdt_expected.vector())
 
 
+def test_solve_on_threads_matches_native_llg():
+    mesh = df.UnitCubeMesh(8, 8, 8)
+    V = df.FunctionSpace(mesh, "CG", 1)
+    W = df.VectorFunctionSpace(mesh, "CG", 1, dim=3)
+    n = V.dim()
+    alpha = df.Function(V)
+    alpha.vector().set_local(np.random.uniform(0.01, 1, n))
+    m = df.Function(W)
+    m_values = np.random.uniform(-1, 1, (3, n))
+    m_values /= np.sqrt(np.sum(m_values ** 2, axis=0))
+    m.vector().set_local(m_values.ravel())
+    H = df.Function(W)
+    H.vector().set_local(np.random.uniform(-1e5, 1e5, 3 * n))
+    dmdt = df.Function(W)
+
+    dmdt_expected = np.zeros((3, n))
+    native_llg.calc_llg_dmdt(m_values, H.vector().array().reshape(3, -1), 0.0, dmdt_expected,
+                             np.array([], dtype="int"), 2.21e5, alpha.vector().array(), 1e-12, True)
+
+    equation = Equation(m.vector(), H.vector(), dmdt.vector())
+    equation.set_alpha(alpha.vector())
+    equation.set_gamma(2.21e5)
+    module = get_equation_module()
+    default_threads = module.get_openmp_threads()
+    try:
+        for threads in [1, 4]:
+            module.set_openmp_threads(threads)
+            equation.solve()
+            assert np.allclose(dmdt.vector().array(), dmdt_expected.ravel(), rtol=1e-10, atol=1e-10 * 2.21e10)
+    finally:
+        module.set_openmp_threads(default_threads)
+
+
 def test_pinning(setup):
     mesh, V, alpha, W, m, H, dmdt = setup
     equation = Equation(m.vector(), H.vector(), dmdt.vector())
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from finmag.physics.preconditioner import ExchangePreconditioner
+from finmag.tests.jacobean.domain_wall_cobalt import setup_domain_wall_cobalt
+
+
+@pytest.mark.parametrize("do_precession", [True, False])
+def test_preconditioner_jacobian_agrees_with_jtimes(do_precession):
+    """
+    With exchange and assembled anisotropy only, all field contributions
+    are linear in m, so the linearisation used by the preconditioner must
+    reproduce the Jacobian-times-vector product of the LLG object.
+
+    """
+    llg = setup_domain_wall_cobalt(node_count=20)
+    llg.do_precession = do_precession
+    prec = ExchangePreconditioner(llg)
+
+    m = llg.sundials_m
+    prec.compute_jacobian(0, m)
+
+    mp = np.random.random_sample(m.shape) - 0.5
+    J_mp = np.zeros(m.shape)
+    llg.sundials_jtimes(mp, J_mp, 0, m, None, np.zeros(m.shape))
+
+    assert np.allclose(prec.J.dot(mp), J_mp, rtol=1e-8, atol=1e-8 * abs(J_mp).max())
+
+
+def test_preconditioner_solves_shifted_system():
+    llg = setup_domain_wall_cobalt(node_count=20)
+    prec = ExchangePreconditioner(llg, drop_tol=0)
+    m = llg.sundials_m
+    gamma = 1e-13
+
+    assert prec.setup(0, m, False, gamma)
+    assert not prec.setup(0, m, True, 2 * gamma)
+    assert prec.n_jacobian_updates == 1
+
+    r = np.random.random_sample(m.shape)
+    z = np.zeros(m.shape)
+    prec.solve(r, z)
+    P_z = z - 2 * gamma * prec.J.dot(z)
+    assert np.allclose(P_z, r, rtol=1e-8)
@@ -1,3 +1,4 @@
+import math
 import logging
 from finmag.scheduler.timeevent import TimeEvent, same_time, EPSILON
 
@@ -58,6 +59,24 @@ class SingleTimeEvent(TimeEvent):
             self.next_time = None
             self.state = EV_DONE
 
+    def _due_before(self, time):
+        return (self.next_time is not None and self.next_time < time and
+                not same_time(self.next_time, time))
+
+    def skip_to(self, time):
+        """
+        Skip the trigger of this event if it is due before the specified
+        time, which the integration has reached without the scheduler. An
+        event due at `time` itself still triggers.
+
+        """
+        if self._due_before(time):
+            self.next_time = None
+            # Events which also trigger at the end of the integration
+            # remain active for that.
+            if not self.trigger_on_stop:
+                self.state = EV_DONE
+
 
 class RepeatingTimeEvent(SingleTimeEvent):
 
@@ -108,3 +127,24 @@ class RepeatingTimeEvent(SingleTimeEvent):
             msg = "Resetting in time is not well defined for repeated " +\
                   "events with non-constant interval."
             raise NotImplementedError(msg)
+
+    def skip_to(self, time):
+        """
+        Skip the triggers of this event which are due before the specified
+        time, keeping the times at which it triggers afterwards, i.e.
+        next_time is advanced by a multiple of the interval. A non-constant
+        interval is evaluated once for each skipped trigger.
+
+        """
+        if not self._due_before(time):
+            return
+        if hasattr(self.interval, "__call__"):
+            while self._due_before(time):
+                self.next_time += self.interval()
+        elif self.interval == 0:
+            self.next_time = time
+        else:
+            self.next_time += math.ceil(float(time - self.next_time) / self.interval) * self.interval
+            # (time - next_time) / interval may be rounded up past an integer
+            if same_time(self.next_time - self.interval, time):
+                self.next_time -= self.interval
@@ -0,0 +1,93 @@
+import logging
+from finmag.scheduler.event import Event, EV_DONE, EV_REQUESTS_STOP_INTEGRATION
+
+log = logging.getLogger(name="finmag")
+
+
+class RootEvent(Event):
+
+    """
+    An event that triggers whenever the event function g(t, y) of the time
+    and the state vector of the integrator changes sign, for example when
+    the average magnetisation crosses zero.
+
+    The time integration doesn't have to stop regularly to check for these
+    events. Instead, the integrator locates the roots of g between its
+    internal steps and stops exactly at them (see Scheduler.run).
+
+    Like repeating events, a root event keeps triggering at every root of g
+    until its callback returns True (done) or False (stop the integration).
+
+    """
+
+    def __init__(self, g, direction=0, callback=None):
+        """
+        Only roots where g is increasing are detected if `direction` is
+        positive, only those where g is decreasing if it is negative, and
+        both by default.
+
+        """
+        if not hasattr(g, "__call__"):
+            raise ValueError("{}.init: The event function should be callable."
+                             .format(self.__class__.__name__))
+        if direction not in (-1, 0, 1):
+            raise ValueError("{}.init: The direction should be -1, 0 or 1, "
+                             "got {}.".format(self.__class__.__name__, direction))
+        self.g = g
+        self.direction = direction
+        # Root events don't happen at known times.
+        self.next_time = None
+        super(RootEvent, self).__init__(False, callback)
+
+    def __str__(self):
+        callback_msg = ""
+        if self.callback is not None:
+            callback_name = "unknown"
+            if hasattr(self.callback, "__name__"):
+                callback_name = self.callback.__name__
+            if hasattr(self.callback, "func"):
+                callback_name = self.callback.func.__name__
+            callback_msg = " | callback: {}".format(callback_name)
+
+        return "<{} | last = {} | direction = {}{}>".format(
+            self.__class__.__name__, self.last, self.direction, callback_msg)
+
+    def check_and_trigger(self, time, is_stop=False):
+        """
+        Root events only trigger when the integrator tells the scheduler that
+        their event function has a root at `time`, so there is nothing to
+        check here.
+
+        """
+        if not is_stop:
+            self.trigger(time)
+
+    def trigger(self, time, is_stop=False):
+        self.last = time
+
+        if self.callback is None:
+            log.warning("Event triggered with no callback function.")
+        else:
+            returnValue = self.callback()
+            if returnValue is True:
+                self.state = EV_DONE
+            if returnValue is False:
+                self.state = EV_REQUESTS_STOP_INTEGRATION
+
+    def reset(self, time):
+        """
+        Root events don't depend on the time, so the only thing to reset is
+        the time at which the event was last triggered if that is later than
+        `time`.
+
+        """
+        if self.last is not None and self.last > time:
+            self.last = None
+
+    def skip_to(self, time):
+        """
+        Root events are located during the integration, so there is nothing
+        to skip.
+
+        """
+        pass
@@ -4,6 +4,7 @@ import functools
 from numbers import Number
 from datetime import datetime, timedelta
 from finmag.scheduler.derivedevents import SingleTimeEvent, RepeatingTimeEvent
+from finmag.scheduler.rootevent import RootEvent
 from finmag.scheduler.timeevent import same_time
 from finmag.scheduler.event import EV_DONE, EV_REQUESTS_STOP_INTEGRATION
 # This module will try to import the package apscheduler when a realtime event
@@ -53,10 +54,16 @@ class Scheduler(object):
         return self
 
     def add(self, func, args=None, kwargs=None, at=None, at_end=False,
-            every=None, after=None, realtime=False):
+            every=None, after=None, realtime=False, when=None, direction=0):
         """
         Register a function with the scheduler.
 
+        If `when` is given, it should be an event function g(t, y) of the
+        time and the state vector of the integrator returning a float, and
+        the function is called whenever g changes sign (in the direction
+        `direction`, see RootEvent). The integrator locates these roots
+        itself, see run().
+
         Returns the scheduled item, which can be removed again by
         calling Scheduler._remove(item). Note that this may change in
         the future, so use with care.
@@ -65,8 +72,11 @@ class Scheduler(object):
         if not hasattr(func, "__call__"):
             raise TypeError("The function must be callable but object '%s' is of type '%s'" %
                             (str(func), type(func)))
-        assert at or every or at_end or (
-            after and realtime), "Use either `at`, `every` or `at_end` if not in real time mode."
+        assert at or every or at_end or when or (
+            after and realtime), "Use either `at`, `every`, `at_end` or `when` if not in real time mode."
+        assert not (
+            when is not None and (at is not None or every is not None or at_end or realtime)), \
+            "Cannot mix `when` with other times. Please schedule separately."
         assert not (
             at is not None and every is not None), "Cannot mix `at` with `every`. Please schedule separately."
         assert not (
@@ -76,6 +86,11 @@ class Scheduler(object):
         kwargs = kwargs or {}
         callback = functools.partial(func, *args, **kwargs)
 
+        if when is not None:
+            root_item = RootEvent(when, direction, callback)
+            self._add(root_item)
+            return root_item
+
         if realtime:
             if at_end:
                 at_end_item = SingleTimeEvent(None, True, callback)
@@ -98,6 +113,23 @@ class Scheduler(object):
     def _remove(self, item):
         self.items.remove(item)
 
+    def _root_events(self):
+        return [item for item in self.items if isinstance(item, RootEvent)]
+
+    def _set_root_functions(self, integrator, root_events):
+        """
+        Let the integrator locate the roots of the event functions of
+        `root_events` (none if the list is empty).
+
+        """
+        if not hasattr(integrator, "set_root_functions"):
+            raise NotImplementedError(
+                "Events scheduled with `when` need an integrator which can "
+                "locate roots of event functions, which {} can't.".format(
+                    integrator.__class__.__name__))
+        integrator.set_root_functions([item.g for item in root_events],
+                                      [item.direction for item in root_events])
+
     def _add_realtime(self, func, at=None, every=None, after=None):
         """
         Add a realtime job.
@@ -212,6 +244,21 @@ class Scheduler(object):
         for item in self.items:
             item.reset(time)
 
+    def skip_to(self, time):
+        """
+        Skip the events which were due before `time`, which the integration
+        has reached without the scheduler (see Simulation.record_m). Unlike
+        with reset(), repeating events keep the times at which they trigger,
+        e.g. one scheduled every 1 ps after 0.5 ps next triggers at the first
+        of 0.5 ps, 1.5 ps, ... which is not before `time`.
+
+        """
+        self.last = None
+        for item in list(self.items):
+            item.skip_to(time)
+            if item.state == EV_DONE:
+                self._remove(item)
+
     def _print_realtime_item(self, item, func_print=log.info):
         (f, (at, every, after)) = item
         func_print("'{}': <at={}, every={}, after={}>".format(
@@ -245,22 +292,61 @@ class Scheduler(object):
         example, to keep time-dependent fields up to date with the
         simulation time.
 
+        Events scheduled with `when` are located by the integrator, whose
+        advance_time stops at the first root of one of their event
+        functions and returns False. We then trigger the events whose
+        functions have a root there (listed by the integrator's
+        `roots_found`) and carry on integrating towards t.
+
         """
         self.start_realtime_jobs()
+        root_events = self._root_events()
+        locating_roots = len(root_events) > 0
+        if locating_roots:
+            self._set_root_functions(integrator, root_events)
+
+        try:
+            for t in self:
+                # After skip_to(integrator.cur_t) (see Simulation.record_m),
+                # t may be before it by a rounding error.
+                assert(t >= integrator.cur_t or same_time(t, integrator.cur_t))  # sanity check
+
+                # If new items were scheduled after a previous time
+                # integration finished, we can have t == integrator.cur_t.
+                # However, this confuses the integrators so we don't integrate
+                # in this case.
+                if not same_time(t, integrator.cur_t):
+                    if integrator.advance_time(t) is False and locating_roots:
+                        t = integrator.cur_t
+                        for f in callbacks_at_scheduler_events:
+                            f(t)
+                        root_events = self._reached_root(integrator, root_events, t)
+                        continue
+
+                for f in callbacks_at_scheduler_events:
+                    f(t)
+                self.reached(t)
+        finally:
+            if locating_roots:
+                self._set_root_functions(integrator, [])
 
-        for t in self:
-            assert(t >= integrator.cur_t)  # sanity check
+        self.finalise(t)
+        self.stop_realtime_jobs()
 
-            # If new items were scheduled after a previous time
-            # integration finished, we can have t == integrator.cur_t.
-            # However, this confuses the integrators so we don't integrate
-            # in this case.
-            if t != integrator.cur_t:
-                integrator.advance_time(t)
+    def _reached_root(self, integrator, root_events, time):
+        """
+        Trigger the root events whose event functions the integrator found
+        a root of at `time`. Returns the root events which are still active.
 
-            for f in callbacks_at_scheduler_events:
-                f(t)
-            self.reached(t)
+        """
+        for i in integrator.roots_found:
+            root_events[i].check_and_trigger(time)
+        self.last = time
 
-        self.finalise(t)
-        self.stop_realtime_jobs()
+        active = [item for item in root_events if item.state != EV_DONE]
+        if len(active) < len(root_events):
+            for item in root_events:
+                if item.state == EV_DONE:
+                    self._remove(item)
+            self._set_root_functions(integrator, active)
+        return active
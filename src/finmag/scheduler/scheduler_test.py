@@ -1,7 +1,9 @@
+import math
 import pytest
 from timeevent import TimeEvent
 from derivedevents import SingleTimeEvent, RepeatingTimeEvent
 from scheduler import Scheduler
+from rootevent import RootEvent
 
 
 class Counter(object):
@@ -248,6 +250,10 @@ def test_illegal_arguments():
         s.add(dummy_func, at=0, after=1)  # delays don't mix with 'at'
     with pytest.raises(AssertionError):
         s.add(dummy_func, at=1, every=2)  # can't mix 'at' with 'every'
+    with pytest.raises(AssertionError):
+        s.add(dummy_func, at=1, when=lambda t, y: t)  # or 'at' with 'when'
+    with pytest.raises(ValueError):
+        s.add(dummy_func, when=lambda t, y: t, direction=2)
 
 
 def test_reset_with_every():
@@ -323,3 +329,157 @@ def test_reset_with_at():
     s.reset(30)
     s.reached(10)
     assert c.cnt_at == 2
+
+
+def test_run_after_reset_to_integrator_time():
+    c = Counter()
+    s = Scheduler()
+    s.add(c.inc_every, every=1.0)
+    s.add(lambda: False, at=5.0)
+
+    # The integrator was advanced without the scheduler, to a time at which
+    # the event is due up to a rounding error.
+    integrator = RootFindingIntegrator()
+    integrator.cur_t = 3.0 + 4e-16
+    s.skip_to(integrator.cur_t)
+    s.run(integrator)
+    assert c.cnt_every == 3  # at t = 3, 4 and 5
+    assert integrator.cur_t == 5.0
+
+
+def test_skip_to_keeps_the_phase_of_repeating_events():
+    c = Counter()
+    s = Scheduler()
+    s.add(c.inc_every, every=1e-12, after=0.5e-12)
+    s.add(c.inc_at, at=2e-12)
+    s.add(c.inc_at, at=7e-12)
+    s.reached(0.5e-12)
+    assert c.cnt_every == 1
+
+    # the integration went on without the scheduler
+    s.skip_to(5.2e-12)
+    assert len(s.items) == 2  # the event at 2 ps is gone
+    assert abs(s.next() - 5.5e-12) < 1e-24
+    s.reached(s.next())
+    assert c.cnt_every == 2
+    assert abs(s.next() - 6.5e-12) < 1e-24
+
+    # an event due at the time skipped to still triggers
+    s.skip_to(6.5e-12)
+    assert abs(s.next() - 6.5e-12) < 1e-24
+    s.skip_to(7e-12)
+    assert abs(s.next() - 7e-12) < 1e-24
+    s.reached(s.next())
+    assert c.cnt_every == 2 and c.cnt_at == 1
+    assert abs(s.next() - 7.5e-12) < 1e-24
+
+
+def test_skip_to_with_variable_interval():
+    c = Counter()
+    s = Scheduler()
+    intervals = iter([1, 2, 3, 4, 5])
+    s.add(c.inc_every, every=lambda: next(intervals), after=1)
+    s.skip_to(6.5)
+    assert s.next() == 7  # skipping 1, 2 and 4
+    assert c.cnt_every == 0
+
+
+class RootFindingIntegrator(object):
+
+    """
+    Integrates dy/dt = 1 and locates the roots of the event functions by
+    bisection, like SundialsIntegrator does with CVODE's root finding.
+
+    """
+
+    def __init__(self):
+        self.cur_t = 0.0
+        self.root_functions = []
+        self.directions = []
+        self.roots_found = []
+
+    def set_root_functions(self, functions, directions=None):
+        self.root_functions = functions
+        self.directions = directions or [0] * len(functions)
+
+    def _crosses(self, i, t0, t1):
+        g0 = self.root_functions[i](t0, t0)
+        g1 = self.root_functions[i](t1, t1)
+        direction = self.directions[i]
+        return (g0 < 0 <= g1 and direction >= 0) or (g0 > 0 >= g1 and direction <= 0)
+
+    def advance_time(self, t):
+        self.roots_found = []
+        crossing = [i for i in range(len(self.root_functions))
+                    if self._crosses(i, self.cur_t, t)]
+        if not crossing:
+            self.cur_t = t
+            return True
+        t0, t1 = self.cur_t, t
+        while t1 - t0 > 1e-12:
+            t_mid = 0.5 * (t0 + t1)
+            if any(self._crosses(i, t0, t_mid) for i in crossing):
+                t1 = t_mid
+            else:
+                t0 = t_mid
+        self.roots_found = [i for i in crossing if self._crosses(i, self.cur_t, t1)]
+        self.cur_t = t1
+        return False
+
+
+def test_root_event():
+    e = RootEvent(lambda t, y: y - 1, direction=1)
+    assert e.next_time is None
+    with pytest.raises(ValueError):
+        RootEvent(42)
+
+    c = Counter()
+    e.attach(c.inc_at)
+    e.check_and_trigger(1.0)
+    assert c.cnt_at == 1
+    assert e.last == 1.0
+    e.check_and_trigger(2.0, is_stop=True)
+    assert c.cnt_at == 1
+
+
+def test_scheduler_run_stops_at_roots():
+    c = Counter()
+    times = []
+
+    def stop():
+        times.append(integrator.cur_t)
+        return False
+
+    s = Scheduler()
+    s.add(c.inc_every, every=1.0)
+    # cos(pi y) decreases through zero at y = 0.5, 2.5, ...
+    s.add(c.inc_at, when=lambda t, y: math.cos(math.pi * y), direction=-1)
+    s.add(stop, when=lambda t, y: y - 3.25)
+    s.add(stop, at=10.0)
+
+    integrator = RootFindingIntegrator()
+    s.run(integrator)
+
+    assert abs(times[0] - 3.25) < 1e-10
+    assert abs(integrator.cur_t - 3.25) < 1e-10
+    assert c.cnt_every == 4  # at t = 0, 1, 2 and 3
+    assert c.cnt_at == 2  # at t = 0.5 and 2.5
+    assert integrator.root_functions == []
+
+
+def test_root_event_returning_true_is_removed():
+    c = Counter()
+
+    def once():
+        c.inc_at()
+        return True
+
+    s = Scheduler()
+    s.add(once, when=lambda t, y: y - 0.5)
+    s.add(lambda: False, at=2.0)
+
+    integrator = RootFindingIntegrator()
+    s.run(integrator)
+    assert c.cnt_at == 1
+    assert integrator.cur_t == 2.0
+    assert not any(isinstance(item, RootEvent) for item in s.items)
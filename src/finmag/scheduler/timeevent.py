@@ -26,6 +26,8 @@ class TimeEvent(Event):
         reset(self, time): Changes the state of this event to what it should
                            have been as defined by its time argument.
 
+        skip_to(self, time): Skips the triggers before the given time.
+
         __str__(self): Sensible string representation of this object.
 
     This base class is derived from Event.
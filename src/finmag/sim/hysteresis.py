@@ -4,9 +4,11 @@ import glob
 import logging
 import textwrap
 import fileinput
+import multiprocessing
 import numpy as np
 from finmag.energies import Zeeman
 from finmag.util.helpers import norm
+from finmag.util.worker_pool import WorkerPool
 
 log = logging.getLogger(name="finmag")
 
@@ -138,3 +140,142 @@ def hysteresis_loop(sim, H_max, direction, N, **kwargs):
     # `H_dir`
     m_vals = [np.dot(m, H_dir) for m in m_avg]
     return (H_norms, m_vals)
+
+
+def m_average(sim):
+    """
+    Return the average magnetisation of `sim`. Unlike a lambda, this can
+    be passed as `fun` to hysteresis_parallel().
+
+    """
+    return sim.m_average
+
+
+# Boundary element matrix shared by the worker processes of
+# hysteresis_parallel(), set by _init_hysteresis_worker().
+_worker_demag_bem = None
+
+
+def _init_hysteresis_worker(demag_bem):
+    global _worker_demag_bem
+    _worker_demag_bem = demag_bem
+
+
+def _run_hysteresis_branch(args):
+    index, recipe, H_ext_list, fun, kwargs = args
+    # The simulations of all branches usually have the same name, so each
+    # branch writes its .ndt and .log files to a directory of its own.
+    branch_dir = 'hysteresis_branch_{}'.format(index)
+    if not os.path.isdir(branch_dir):
+        os.makedirs(branch_dir)
+    cwd = os.getcwd()
+    os.chdir(branch_dir)
+    try:
+        sim = recipe(_worker_demag_bem)
+        try:
+            return hysteresis(sim, H_ext_list, fun=fun, **kwargs)
+        finally:
+            sim.shutdown()
+    finally:
+        os.chdir(cwd)
+
+
+def hysteresis_parallel(recipe, branches, fun=None, processes=None, **kwargs):
+    """
+    Run several independent hysteresis branches in parallel, using one
+    process per branch (but at most `processes` at a time).
+
+    Each branch is a list of external fields which is passed to
+    `hysteresis()` together with `fun` and `kwargs`, using a fresh
+    Simulation created by the worker. Since every branch starts from the
+    initial magnetisation of that Simulation, it should begin with a
+    field that saturates the sample (as do both branches of a major
+    hysteresis loop, or first-order reversal curves that are prefixed by
+    the saturating field and the descending fields up to their reversal
+    field).
+
+    Branch i runs in the directory `hysteresis_branch_<i>` (created in the
+    current directory if necessary), where its simulation writes its .ndt
+    and .log files and any other files with relative names.
+
+    *Arguments*
+
+        recipe:  callable
+
+            A picklable callable (e.g. a module-level function or a
+            functools.partial of one) which is called as `recipe(demag_bem)`
+            in each worker and returns a new Simulation. To avoid computing
+            the boundary element matrix of the demag in every worker,
+            `demag_bem` is either None or a pair (bem, b2g_map) that should
+            be passed on via `demag.precomputed_bem(*demag_bem)` before the
+            demag is added to the simulation. The matrix is computed once
+            by calling `recipe(None)` in the current process and shared by
+            the workers through a memory-mapped file (see
+            finmag.util.worker_pool).
+
+        branches:  list of lists of 3-vectors
+
+            The external fields of each branch.
+
+        fun:  callable
+
+            As for `hysteresis()`, but it must be picklable, e.g.
+            `m_average` from this module.
+
+        processes:  int
+
+            The maximum number of worker processes. Defaults to the number
+            of branches or the number of CPUs, whichever is smaller.
+
+    All other keyword arguments are passed on to the relax() method.
+
+
+    *Return value*
+
+    If `fun` is not None, the list of the return values of `fun` after
+    each stage of all branches, in the order of the branches. Otherwise
+    None.
+
+    """
+    if processes is None:
+        processes = min(len(branches), multiprocessing.cpu_count())
+
+    log.info("Running {} hysteresis branches with {} processes.".format(
+        len(branches), processes))
+    sim = recipe(None)
+    try:
+        pool = WorkerPool(sim, processes, _init_hysteresis_worker)
+    finally:
+        # the workers only need the boundary element matrix of sim
+        sim.shutdown()
+    with pool:
+        results = pool.map(_run_hysteresis_branch,
+                           [(i, recipe, branch, fun, kwargs)
+                            for i, branch in enumerate(branches)])
+
+    if fun is None:
+        return None
+    return [retval for branch_results in results for retval in branch_results]
+
+
+def hysteresis_loop_parallel(recipe, H_max, direction, N, processes=None, **kwargs):
+    """
+    Like `hysteresis_loop()`, but the descending and the ascending
+    branch of the loop are computed in parallel by separate processes
+    using `hysteresis_parallel()`.
+
+    Each branch starts from the initial magnetisation of the simulation
+    created by `recipe`, so H_max must be large enough to saturate the
+    sample. See `hysteresis_parallel()` for the requirements on `recipe`.
+
+    """
+    d = np.array(direction)
+    H_dir = d / norm(d)
+    H_norms_down = list(np.linspace(H_max, -H_max, N))
+    H_norms_up = list(np.linspace(-H_max, H_max, N))
+    branches = [[h * H_dir for h in H_norms_down],
+                [h * H_dir for h in H_norms_up]]
+    m_avg = hysteresis_parallel(recipe, branches, fun=m_average,
+                                processes=processes, **kwargs)
+    m_vals = [np.dot(m, H_dir) for m in m_avg]
+    return (H_norms_down + H_norms_up, m_vals)
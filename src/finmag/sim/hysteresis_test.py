@@ -3,8 +3,10 @@ import numpy as np
 import pytest
 import os
 from glob import glob
-from finmag import sim_with
+from finmag import sim_with, Simulation
+from finmag.energies import Exchange, Demag
 from finmag.example import barmini
+from finmag.sim.hysteresis import hysteresis_loop_parallel
 from finmag.util.plot_helpers import plot_hysteresis_loop
 
 ONE_DEGREE_PER_NS = 17453292.5  # in rad/s
@@ -72,3 +74,33 @@ def test_hysteresis_loop_and_plotting(tmpdir):
     # Test multiple filenames, too
     plot_hysteresis_loop(
         H_vals, m_vals, filename=['test_plot.pdf', 'test_plot.png'])
+
+
+def small_bar_recipe(demag_bem):
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(10, 2, 2), 5, 1, 1)
+    sim = Simulation(mesh, Ms=8.6e5, unit_length=1e-9)
+    sim.alpha = 1.0
+    sim.set_m(initial_direction)
+    sim.add(Exchange(13e-12))
+    demag = Demag()
+    if demag_bem is not None:
+        demag.precomputed_bem(*demag_bem)
+    sim.add(demag)
+    return sim
+
+
+def test_hysteresis_loop_parallel_agrees_with_serial_loop(tmpdir):
+    os.chdir(str(tmpdir))
+    H_vals, m_vals = small_bar_recipe(None).hysteresis_loop(
+        H, initial_direction, N, stopping_dmdt=10)
+    H_vals_par, m_vals_par = hysteresis_loop_parallel(
+        small_bar_recipe, H, initial_direction, N, processes=2, stopping_dmdt=10)
+
+    assert np.allclose(H_vals, H_vals_par)
+    # The ascending branch starts from the initial magnetisation rather
+    # than the end of the descending branch, but H saturates the bar.
+    assert np.allclose(m_vals, m_vals_par, atol=1e-3)
+
+    # the branches don't overwrite each other's output files
+    for i in range(2):
+        assert os.path.exists(os.path.join('hysteresis_branch_{}'.format(i), 'unnamed.log'))
@@ -4,6 +4,7 @@ import types
 import logging
 import numpy as np
 import dolfin as df
+from scipy.sparse.linalg import LinearOperator
 from finmag.sim.sim import Simulation, sim_with
 from finmag.normal_modes.eigenmodes import eigensolvers
 from finmag.util import helpers
@@ -11,7 +12,9 @@ from finmag.util.fft import \
     compute_power_spectral_density, find_peak_near_frequency, _plot_spectrum, \
     export_normal_mode_animation_from_ringdown
 from finmag.normal_modes.deprecated.normal_modes_deprecated import \
-    compute_eigenproblem_matrix, compute_generalised_eigenproblem_matrices, \
+    compute_eigenproblem_matrix, compute_eigenproblem_operator, \
+    compute_generalised_eigenproblem_matrices, \
+    compute_generalised_eigenproblem_operators, \
     export_normal_mode_animation, plot_spatially_resolved_normal_mode, \
     compute_tangential_space_basis, mf_mult
 from past.builtins import basestring
@@ -52,8 +55,9 @@ class NormalModeSimulation(Simulation):
         self.M = None
         self.D = None
         # XXX TODO: Remove me once we get rid of the option 'use_real_matrix'
-        self.use_real_matrix = None
         #           in the method 'compute_normal_modes()' below.
+        self.use_real_matrix = None
+        self.matrix_free = None
 
         # Define a few eigensolvers which can be conveniently accesses using
         # strings
@@ -166,6 +170,10 @@ class NormalModeSimulation(Simulation):
             # to do them below.
             pass
 
+        # The averages may still be buffered if they are saved to a
+        # binary .ndtb file.
+        self.tablewriter.flush()
+
         if use_averaged_m:
             log.warning("Using the averaged magnetisation to compute the "
                         "spectrum is not recommended because this is likely "
@@ -454,25 +462,52 @@ class NormalModeSimulation(Simulation):
 
     def assemble_eigenproblem_matrices(self, filename_mat_A=None, filename_mat_M=None,  use_generalized=False,
                                        force_recompute_matrices=False, check_hermitian=False,
-                                       differentiate_H_numerically=True, use_real_matrix=True):
+                                       differentiate_H_numerically=True, use_real_matrix=True,
+                                       matrix_free=False):
         if use_generalized:
-            if (self.A == None or self.M == None) or force_recompute_matrices:
+            if (self.A is None or self.M is None) or force_recompute_matrices \
+                    or (isinstance(self.A, LinearOperator) != matrix_free):
                 df.tic()
-                self.A, self.M, _, _ = compute_generalised_eigenproblem_matrices(
-                    self, frequency_unit=1e9, filename_mat_A=filename_mat_A, filename_mat_M=filename_mat_M,
-                    check_hermitian=check_hermitian, differentiate_H_numerically=differentiate_H_numerically)
+                if matrix_free:
+                    # Only the local interactions are assembled (as a
+                    # sparse matrix), the operator remembers the current
+                    # (relaxed) magnetisation for the remaining ones.
+                    m_orig = self.m
+                    self.A, self.M, _, _ = compute_generalised_eigenproblem_operators(
+                        self, frequency_unit=1e9, differentiate_H_numerically=differentiate_H_numerically)
+                    self.set_m(m_orig)
+                else:
+                    self.A, self.M, _, _ = compute_generalised_eigenproblem_matrices(
+                        self, frequency_unit=1e9, filename_mat_A=filename_mat_A, filename_mat_M=filename_mat_M,
+                        check_hermitian=check_hermitian, differentiate_H_numerically=differentiate_H_numerically)
                 log.debug("Assembling the eigenproblem matrices took {}".format(
                     helpers.format_time(df.toc())))
             else:
                 log.debug(
                     'Re-using previously computed eigenproblem matrices.')
+        elif matrix_free:
+            if self.D is None or not self.matrix_free or (self.use_real_matrix != use_real_matrix) \
+                    or force_recompute_matrices:
+                # The operator doesn't need to be assembled, it only
+                # remembers the current (relaxed) magnetisation.
+                m_orig = self.m
+                self.D = compute_eigenproblem_operator(
+                    self, frequency_unit=1e9, differentiate_H_numerically=differentiate_H_numerically,
+                    dtype=(float if use_real_matrix else complex))
+                self.set_m(m_orig)
+                self.use_real_matrix = use_real_matrix
+                self.matrix_free = True
+            else:
+                log.debug('Re-using previously created eigenproblem operator.')
         else:
-            if self.D == None or (self.use_real_matrix != use_real_matrix) or force_recompute_matrices:
+            if self.D is None or self.matrix_free or (self.use_real_matrix != use_real_matrix) \
+                    or force_recompute_matrices:
                 df.tic()
                 self.D = compute_eigenproblem_matrix(
                     self, frequency_unit=1e9, differentiate_H_numerically=differentiate_H_numerically,
                     dtype=(float if use_real_matrix else complex))
                 self.use_real_matrix = use_real_matrix
+                self.matrix_free = False
                 log.debug("Assembling the eigenproblem matrix took {}".format(
                     helpers.format_time(df.toc())))
             else:
@@ -507,7 +542,7 @@ class NormalModeSimulation(Simulation):
                              filename_mat_A=None, filename_mat_M=None,
                              use_generalized=False, force_recompute_matrices=False,
                              check_hermitian=False, differentiate_H_numerically=True,
-                             use_real_matrix=True):
+                             use_real_matrix=True, matrix_free=False):
         """
         Compute the eigenmodes of the simulation by solving a generalised
         eigenvalue problem and return the computed eigenfrequencies and
@@ -597,6 +632,26 @@ class NormalModeSimulation(Simulation):
             This option is for testing purposes only and will be removed in
             the future.
 
+        matrix_free:
+
+            If True (default: False), the eigenproblem matrix is not assembled
+            (which takes 2N products with it for N mesh nodes and stores
+            4N^2 entries), but passed to the solver as a LinearOperator
+            which evaluates the linearised LLG for each product. Shift-
+            invert mode (e.g. the solver "scipy_sparse", which uses
+            sigma=0) solves the shifted system with GMRES in this case, so
+            the number of field evaluations is proportional to the number
+            of modes times the number of iterations of both solvers. The
+            SLEPc solvers get a shell matrix.
+
+            If `use_generalised` is True, the contributions of the local
+            interactions (exchange, DMI, anisotropy) to the matrix A are
+            assembled as a sparse matrix in the tangent space and only the
+            remaining ones (e.g. demag) are evaluated in each product, and
+            M is a sparse matrix. The solver is given the equivalent real
+            eigenproblem (Mcross A) v = i omega v, where Mcross is the
+            sparse matrix i M.
+
 
         *Returns*
 
@@ -618,14 +673,15 @@ class NormalModeSimulation(Simulation):
             except KeyError:
                 raise ValueError("Unknown eigensolver: '{}'".format(solver))
 
-        if use_generalized and isinstance(solver, eigensolvers.SLEPcEigensolver):
+        if use_generalized and isinstance(solver, eigensolvers.SLEPcEigensolver) and not matrix_free:
             raise TypeError("Using the SLEPcEigensolver with a generalised "
                             "eigenvalue problemis not currently implemented.")
 
         self.assemble_eigenproblem_matrices(
             filename_mat_A=filename_mat_A, filename_mat_M=filename_mat_M, use_generalized=use_generalized,
             force_recompute_matrices=force_recompute_matrices, check_hermitian=check_hermitian,
-            differentiate_H_numerically=differentiate_H_numerically, use_real_matrix=use_real_matrix)
+            differentiate_H_numerically=differentiate_H_numerically, use_real_matrix=use_real_matrix,
+            matrix_free=matrix_free)
 
         if discard_negative_frequencies:
             # If negative frequencies should be discarded, we need to compute
@@ -636,14 +692,35 @@ class NormalModeSimulation(Simulation):
             # omega, eigenvecs = compute_normal_modes_generalised(self.A, self.M, n_values=n_values, discard_negative_frequencies=discard_negative_frequencies,
             # tol=tol, sigma=sigma, which=which, v0=v0, ncv=ncv,
             # maxiter=maxiter, Minv=Minv, OPinv=OPinv, mode=mode)
-            omega, eigenvecs, rel_errors = solver.solve_eigenproblem(
-                self.A, self.M, num=n_values)
+            if matrix_free:
+                # every product with the operator A changes m
+                m_orig = self.m
+                # M = -i Mcross is imaginary and indefinite, which neither
+                # SLEPc (real matrices only) nor the shift-invert mode of
+                # ARPACK can handle without factorising A. Since Mcross^2 = -1
+                # at each node, A v = omega M v is equivalent to the real
+                # eigenproblem Mcross A v = i omega v.
+                Mcross = (1j * self.M).real
+                A = self.A
+                MA = LinearOperator(A.shape, matvec=lambda v: Mcross.dot(A.matvec(v)), dtype=float)
+                omega, eigenvecs, rel_errors = solver.solve_eigenproblem(
+                    MA, None, num=n_values)
+                omega = -1j * omega
+                self.set_m(m_orig)
+            else:
+                omega, eigenvecs, rel_errors = solver.solve_eigenproblem(
+                    self.A, self.M, num=n_values)
         else:
             # omega, eigenvecs = compute_normal_modes(self.D, n_values, sigma=0.0, tol=tol, which='LM')
             # omega = np.real(omega)  # any imaginary part is due to numerical
             # inaccuracies so we ignore them
+            if self.matrix_free:
+                # every product with the operator changes m
+                m_orig = self.m
             omega, eigenvecs, rel_errors = solver.solve_eigenproblem(
                 self.D, None, num=n_values)
+            if self.matrix_free:
+                self.set_m(m_orig)
             if use_real_matrix:
                 # Eigenvalues are complex due to the missing factor of 1j in
                 # the matrix with real entries. Here we correct for this.
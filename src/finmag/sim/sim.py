@@ -19,20 +19,17 @@ from finmag.sim import sim_relax
 from finmag.sim import sim_savers
 from finmag.util.meshes import mesh_volume, mesh_size_plausible, \
     describe_mesh_size, plot_mesh, plot_mesh_with_paraview
-from finmag.util.fileio import Tablewriter, FieldSaver
+from finmag.util.fileio import Tablewriter, BinaryTablewriter, FieldSaver
 from finmag.util import helpers
 from finmag.util.vtk_saver import VTKSaver
 from finmag.sim.hysteresis import hysteresis as hyst, hysteresis_loop as hyst_loop
 from finmag.sim import sim_helpers, magnetisation_patterns
 from finmag.drivers.llg_integrator import llg_integrator
-from finmag.drivers.sundials_integrator import SundialsIntegrator
+from finmag.drivers.sundials_integrator import SundialsIntegrator, SundialsPetscIntegrator
 from finmag.scheduler import scheduler
 from finmag.util.pbc2d import PeriodicBoundary1D, PeriodicBoundary2D
 from finmag.energies import Exchange, Zeeman, TimeZeeman, Demag, UniaxialAnisotropy, DMI, MacroGeometry
 
-# used for parallel testing
-#from finmag.native import cvode_petsc, llg_petsc
-
 log = logging.getLogger(name="finmag")
 
 
@@ -53,7 +50,7 @@ class Simulation(object):
 
 
     @timer.method
-    def __init__(self, mesh, Ms, unit_length=1, name='unnamed', kernel='llg', integrator_backend="sundials", pbc=None, average=False, parallel=False):
+    def __init__(self, mesh, Ms, unit_length=1, name='unnamed', kernel='llg', integrator_backend="sundials", pbc=None, average=False, parallel=False, dof_order=False, ndt_format='text'):
         """Simulation object.
 
         *Arguments*
@@ -73,6 +70,16 @@ class Simulation(object):
 
           average : take the cell averaged effective field, only for test, will delete it if doesn't work.
 
+          dof_order : only for kernel 'llg'. If True, the time integrator works
+                      on m in dolfin's dof order, which avoids re-ordering
+                      the arrays in every evaluation of the right hand side.
+
+          ndt_format : 'text' (default) or 'binary'. In the latter case, the
+                       averages are saved to a '.ndtb' file by a
+                       BinaryTablewriter, which buffers the rows in memory
+                       until sim.tablewriter.flush() or sim.shutdown() is
+                       called. Tablereader reads both formats.
+
         """
         # Store the simulation name and a 'sanitized' version of it which
         # contains only alphanumeric characters and underscores. The latter
@@ -83,7 +90,12 @@ class Simulation(object):
         self.sanitized_name = helpers.clean_filename(name)
 
         self.logfilename = self.sanitized_name + '.log'
-        self.ndtfilename = self.sanitized_name + '.ndt'
+        if ndt_format == 'text':
+            self.ndtfilename = self.sanitized_name + '.ndt'
+        elif ndt_format == 'binary':
+            self.ndtfilename = self.sanitized_name + '.ndtb'
+        else:
+            raise ValueError("ndt_format must be 'text' or 'binary'.")
 
         self.logging_handler = helpers.start_logging_to_file(
             self.logfilename, mode='w', level=logging.DEBUG)
@@ -101,7 +113,10 @@ class Simulation(object):
         # Create a Tablewriter object for ourselves which will be used
         # by various methods to save the average magnetisation at given
         # timesteps.
-        self.tablewriter = Tablewriter(self.ndtfilename, self, override=True)
+        if ndt_format == 'binary':
+            self.tablewriter = BinaryTablewriter(self.ndtfilename, self, override=True)
+        else:
+            self.tablewriter = Tablewriter(self.ndtfilename, self, override=True)
 
         # Note that we pass the simulation object ("self") to the Tablewrite in the line above, and
         # that the table writer stores a reference. This is just a cyclic reference. If we want
@@ -110,13 +125,21 @@ class Simulation(object):
 
         #log.debug("__init__:sim-object '{}' refcount 31={}".format(self.name, sys.getrefcount(self)))
 
+        # The fields saved to the ndt file are taken from the most recent
+        # evaluation of the effective field if it is still current (see
+        # EffectiveField.current_field), so they are computed at most once
+        # per save. If ndt_exact_energies is set to False, the energies are
+        # estimated from these fields as well, which is cheaper but only
+        # exact for energies that are quadratic in m (see
+        # EffectiveField.estimate_energies).
+        self.ndt_exact_energies = True
         self.tablewriter.add_entity('E_total', {
             'unit': '<J>',
-            'get': lambda sim: sim.total_energy(),
+            'get': lambda sim: sim.total_energy(estimate=not sim.ndt_exact_energies),
             'header': 'E_total'})
         self.tablewriter.add_entity('H_total', {
             'unit': '<A/m>',
-            'get': lambda sim: helpers.average_field(sim.effective_field()),
+            'get': lambda sim: sim._average_field(sim.llg.effective_field.current_field(sim.t)),
             'header': ('H_total_x', 'H_total_y', 'H_total_z')})
 
         #log.debug("__init__:sim-object '{}' refcount 32={}".format(self.name, sys.getrefcount(self)))
@@ -163,7 +186,8 @@ class Simulation(object):
 
         if kernel == 'llg':
             self.llg = LLG(
-                self.S1, self.S3, average=average, unit_length=unit_length)
+                self.S1, self.S3, average=average, unit_length=unit_length,
+                dof_order=dof_order)
         elif kernel == 'sllg':
             self.llg = SLLG(self.S1, self.S3, unit_length=unit_length)
         elif kernel == 'llg_stt':
@@ -255,6 +279,7 @@ class Simulation(object):
         # now start to remove (potential) references to 'self':
 
         log.debug("   shutdown(): 1-refcount {} for {}".format(sys.getrefcount(self), self.name))
+        self.tablewriter.flush()
         self.tablewriter.delete_entity_get_methods()
         #'del self.tablewriter' would be sufficient?
         log.debug("   shutdown(): 2-refcount {} for {}".format(sys.getrefcount(self), self.name))
@@ -349,8 +374,11 @@ class Simulation(object):
     def Ms(self, value):
         self._Ms = Field(df.FunctionSpace(self.mesh, 'DG', 0), value)
         self.llg.Ms = self._Ms
-        # XXX TODO: Do we also need to reset Ms in the interactions or is this
-        #           automatically done by the llg or effective field?!?
+        # The interactions share the Ms field of the llg, but the matrices
+        # assembled from it are outdated now.
+        for interaction in self.llg.effective_field.interactions.itervalues():
+            if hasattr(interaction, 'reassemble'):
+                interaction.reassemble()
 
     @property
     def m_field(self):
@@ -452,11 +480,12 @@ class Simulation(object):
         field_name = 'H_{}'.format(interaction.name)
         self.tablewriter.add_entity(energy_name, {
             'unit': '<J>',
-            'get': lambda sim: sim.get_interaction(interaction.name).compute_energy(),
+            'get': lambda sim: sim._ndt_energy(interaction.name),
             'header': energy_name})
         self.tablewriter.add_entity(field_name, {
             'unit': '<A/m>',
-            'get': lambda sim: sim.get_interaction(interaction.name).average_field(),
+            'get': lambda sim: sim._average_field(
+                sim.llg.effective_field.current_interaction_field(interaction.name, sim.t)),
             'header': (field_name + '_x', field_name + '_y', field_name + '_z')})
 
     def effective_field(self):
@@ -466,14 +495,45 @@ class Simulation(object):
         """
         return self.llg.effective_field.compute(self.t)
 
-    def total_energy(self):
+    def total_energy(self, estimate=False):
         """
         Compute and return the total energy of all fields present in
         the simulation.
 
+        If `estimate` is True, return a cheap estimate computed from the
+        most recently evaluated fields instead (see
+        `EffectiveField.estimate_energies` for its limitations).
+
         """
+        if estimate:
+            return self.llg.effective_field.estimate_total_energy(self.t)
         return self.llg.effective_field.total_energy()
 
+    def _average_field(self, field_vals):
+        """
+        Unweighted average of the vector field with the values `field_vals`
+        over all nodes (see helpers.average_field). In parallel,
+        `field_vals` is the local part of a distributed vector.
+
+        """
+        if not self.parallel:
+            return helpers.average_field(field_vals)
+        comm = df.mpi_comm_world()
+        nodes = self.llg.local_nodes
+        n = df.MPI.sum(comm, float(nodes.shape[1]))
+        return np.array([df.MPI.sum(comm, float(np.sum(field_vals[nodes[j]])))
+                         for j in xrange(3)]) / n
+
+    def _ndt_energy(self, interaction_name):
+        """
+        Energy of the given interaction as saved to the ndt file (see
+        ndt_exact_energies).
+
+        """
+        if self.ndt_exact_energies:
+            return self.get_interaction(interaction_name).compute_energy()
+        return self.llg.effective_field.estimate_energies(self.t)[interaction_name]
+
     def compute_energy(self, name="total"):
         """
         Compute and return the energy contribution from a specific
@@ -733,12 +793,8 @@ class Simulation(object):
 
         if not self.has_integrator():
             if self.parallel:
-                # HF, the reason for commenting out the line below is that
-                # cython fails to compile the file otherwise. Will all be
-                # fixed when the parallel sundials is completed. Sep 2014
-                raise Exception(
-                    "The next line has been deactivated - fix to proceed with parallel")
-                #self._integrator = cvode_petsc.CvodeSolver(self.llg.sundials_rhs_petsc, 0, self.m_petsc, self.reltol, self.abstol)
+                self._integrator = SundialsPetscIntegrator(
+                    self.llg, reltol=self.reltol, abstol=self.abstol, **kwargs)
             elif self.kernel == 'llg_stt':
                 self._integrator = SundialsIntegrator(
                     self.llg, self.llg.dy_m, method="bdf_diag", **kwargs)
@@ -786,11 +842,7 @@ class Simulation(object):
         self.abstol = abstol
 
         if self.has_integrator():
-            if self.parallel:
-                #self.integrator.set_options(reltol, abstol)
-                pass
-            else:
-                self.integrator.integrator.set_scalar_tolerances(reltol, abstol)
+            self.integrator.integrator.set_scalar_tolerances(reltol, abstol)
 
     def advance_time(self, t):
         """
@@ -801,8 +853,9 @@ class Simulation(object):
         self.integrator.advance_time(t)
         # The following line is necessary because the time integrator may
         # slightly overshoot the requested end time, so here we make sure
-        # that the field values represent that requested time exactly.
-        self.llg.effective_field.update(t)
+        # that the field values represent that requested time exactly. The
+        # fields are kept for the energy estimate and the ndt file.
+        self.llg.effective_field.update(t, keep_fields=True)
 
     def run_until(self, t):
         """
@@ -817,23 +870,67 @@ class Simulation(object):
         # considered as False for comparison purposes in scheduler.add.
         def call_to_end_integration():
             return False
-        self.scheduler.add(call_to_end_integration, at=t, at_end=True)
+        end_item = self.scheduler.add(call_to_end_integration, at=t, at_end=True)
 
         self.scheduler.run(self.integrator, self.callbacks_at_scheduler_events)
 
-        if self.parallel:
-            # print self.llg._m_field.f.vector().array()
-            # TODO: maybe this is not necessary, check it later.
-            pass
-            # self.llg._m_field.f.vector().set_local(self.integrator.y_np)
+        # Another event (e.g. one scheduled with `when`) may have stopped the
+        # integration before t, in which case the end event is still there.
+        if end_item in self.scheduler.items:
+            self.scheduler._remove(end_item)
 
         # The following line is necessary because the time integrator may
         # slightly overshoot the requested end time, so here we make sure
-        # that the field values represent that requested time exactly.
-        self.llg.effective_field.update(t)
+        # that the field values represent that requested time exactly. The
+        # fields are kept for the energy estimate and the ndt file.
+        self.llg.effective_field.update(min(t, self.t), keep_fields=True)
 
         log.info("Simulation has reached time t = {:.2g} s.".format(self.t))
 
+    def record_m(self, t, t_step):
+        """
+        Run the simulation until the given time `t` and return the times
+        sim.t, sim.t + t_step, ... up to `t` and an array whose rows are the
+        magnetisation at these times (in the layout of `sim.llg.sundials_m`,
+        i.e. xxx...yyy...zzz).
+
+        This is meant for sampling at high rates, e.g. every picosecond over
+        tens of nanoseconds to compute a ringdown spectrum. The time
+        integration is not stopped at the sampling times (as it would be for
+        `sim.schedule('save_field', 'm', every=t_step)`), instead the
+        magnetisation is interpolated from the internal steps of the
+        integrator in native code. Only the sundials integrator supports
+        this.
+
+        The scheduled functions are not called while recording. The events
+        that would have happened in the meantime are skipped, and the
+        schedule carries on from `t` at the times it would have had anyway
+        (so an event which is due at `t` itself happens at the start of the
+        next run), see Scheduler.skip_to.
+
+        """
+        if not hasattr(self.integrator, "record"):
+            raise NotImplementedError(
+                "Recording is not supported by the integrator {}.".format(
+                    self.integrator.__class__.__name__))
+        log.info("Simulation will run until t = {:.2g} s, recording the "
+                 "magnetisation every {:.2g} s.".format(t, t_step))
+        self.t_max = t
+
+        n = int(np.floor((t - self.t) / t_step + 1e-9))
+        ts = self.t + t_step * np.arange(n + 1)
+        ts[-1] = min(ts[-1], t)
+        if ts[-1] < t:
+            # integrate until t, but don't return the sample at t
+            ms = self.integrator.record(np.append(ts, t))[:-1]
+        else:
+            ms = self.integrator.record(ts)
+        self.llg.effective_field.update(self.t, keep_fields=True)
+        self.scheduler.skip_to(self.t)
+
+        log.info("Simulation has reached time t = {:.2g} s.".format(self.t))
+        return ts, ms
+
     relax = sim_relax.relax
 
     save_restart_data = sim_helpers.save_restart_data
@@ -934,6 +1031,10 @@ class Simulation(object):
         using any type accepted by the function
         :py:func:`finmag.util.helpers.scalar_valued_function`.
 
+        Changes of the values of the returned function in place (e.g.
+        `sim.alpha.vector()[:] = 0.1`) take effect from the next call of
+        run_until, advance_time etc. onwards.
+
         """
         return self.llg.alpha
 
@@ -1063,10 +1164,26 @@ class Simulation(object):
         time by setting the `realtime` option to True. In this case you can
         use the `after` keyword on its own.
 
+        Instead of times, you can give an event function g(t, m) of the time
+        and the magnetisation (as in `sim.m`) returning a float with the
+        `when` keyword. Your function is then called whenever g changes sign,
+        at the time located by the integrator's root finding, so there is
+        no need to check for the event at regular intervals. Set `direction`
+        to 1 (-1) to only react to roots where g is increasing (decreasing).
+        While g is evaluated, the magnetisation of the simulation (and hence
+        e.g. `sim.m_average`) is the one passed to g. For example, to stop
+        the simulation when the average magnetisation switches to -z, use:
+
+            sim.schedule(lambda sim: False,
+                         when=lambda t, m: sim.m_average[2], direction=-1)
+
+        As for other scheduled functions, return True from your function to
+        unschedule it and False to stop the time integration.
+
         The function func(sim) you provide should expect the simulation object
         as its first argument. All arguments to the 'schedule' function (except
-        the special ones 'at', 'every', 'at_end' and 'realtime' mentioned
-        above) will be passed on to this function.
+        the special ones 'at', 'every', 'at_end', 'realtime', 'when' and
+        'direction' mentioned above) will be passed on to this function.
 
         If func is a string, it will be looked up in self.scheduler_shortcuts,
         which includes 'save_restart_data', 'save_ndt', 'save_vtk' and
@@ -1129,7 +1246,8 @@ class Simulation(object):
             func_args = None
 
         if func_args != None:
-            illegal_argnames = ['at', 'after', 'every', 'at_end', 'realtime']
+            illegal_argnames = ['at', 'after', 'every', 'at_end', 'realtime',
+                                'when', 'direction']
             for kw in illegal_argnames:
                 if kw in func_args:
                     raise ValueError(
@@ -1141,12 +1259,28 @@ class Simulation(object):
         after = kwargs.pop('after', self.t if (every != None) else None)
         at_end = kwargs.pop('at_end', False)
         realtime = kwargs.pop('realtime', False)
+        when = kwargs.pop('when', None)
+        direction = kwargs.pop('direction', 0)
+        if when is not None:
+            when = self._event_function(when)
 
         scheduled_item = self.scheduler.add(func, [self] + list(args), kwargs,
                                             at=at, at_end=at_end, every=every,
-                                            after=after, realtime=realtime)
+                                            after=after, realtime=realtime,
+                                            when=when, direction=direction)
         return scheduled_item
 
+    def _event_function(self, g):
+        """
+        Turn the event function g(t, m) into a function of the time and the
+        state vector of the integrator, see schedule.
+
+        """
+        def event_function(t, y):
+            self.llg.sundials_m = y
+            return g(t, self.m)
+        return event_function
+
     def unschedule(self, item):
         """
         Unschedule a previously scheduled callback function. The
@@ -1265,6 +1399,7 @@ class Simulation(object):
 
     def plot_dynamics(self, components='xyz', **kwargs):
         from finmag.util.plot_helpers import plot_dynamics
+        self.tablewriter.flush()
         ndt_file = kwargs.pop('ndt_file', self.ndtfilename)
         if not os.path.exists(ndt_file):
             raise RuntimeError(
@@ -1273,6 +1408,7 @@ class Simulation(object):
 
     def plot_dynamics_3d(self, **kwargs):
         from finmag.util.plot_helpers import plot_dynamics_3d
+        self.tablewriter.flush()
         ndt_file = kwargs.pop('ndt_file', self.ndtfilename)
         if not os.path.exists(ndt_file):
             raise RuntimeError(
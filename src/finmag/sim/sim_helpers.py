@@ -19,6 +19,10 @@ def save_ndt(sim):
 
     The filename is derived from the simulation name (as given when the
     simulation was initialised) and has the extension .ndt'.
+
+    The fields are only computed if the most recent evaluation of the
+    effective field isn't current any more, and the energies are estimated
+    from them if `sim.ndt_exact_energies` is False (it is True by default).
     """
     if sim.driver == 'cvode':
         log.debug("Saving data to ndt file at t={} "
@@ -95,7 +95,9 @@ def relax(sim, save_vtk_snapshot_as=None, save_restart_data_as=None,
         else:
             sim.relaxation['dmdts'].append([sim.t, compute_dmdt(
                 sim.relaxation['last_time'], sim.relaxation['last_m'], sim.t, sim.m)])
-            sim.relaxation['energies'].append(sim.total_energy())
+            # The energy is only used to detect divergence, so an estimate
+            # from the fields kept at this event (see keep_fields) will do.
+            sim.relaxation['energies'].append(sim.total_energy(estimate=True))
 
             # Continue iterating if dm/dt is not low enough.
             if sim.relaxation['dmdts'][-1][1] >\
@@ -150,7 +152,17 @@ def relax(sim, save_vtk_snapshot_as=None, save_restart_data_as=None,
     sim.scheduler.add(trigger, every=dt_interval,
                       after=1e-14 if sim.t < 1e-14 else sim.t)
 
-    sim.scheduler.run(sim.integrator, sim.callbacks_at_scheduler_events)
+    def keep_fields(t):
+        """
+        Compute and keep the fields at each scheduler event, after the
+        time-dependent interactions have been updated, so that the energy
+        estimate of the trigger (and e.g. save_ndt) reuses them.
+
+        """
+        sim.llg.effective_field.update(t, keep_fields=True)
+
+    sim.scheduler.run(sim.integrator,
+                      sim.callbacks_at_scheduler_events + [keep_fields])
     sim.integrator.reinit()  # TODO: Is this still needed now that set_m also calls reinit()?
                              #       However, there it happens *after* setting m.
     sim.set_m(sim.m)
@@ -14,7 +14,7 @@ from finmag import sim_with, Simulation, set_logging_level, normal_mode_simulati
 from finmag.normal_modes.eigenmodes import eigensolvers
 from finmag.example import barmini
 from math import sqrt, cos, sin, pi
-from finmag.util.helpers import assert_number_of_files, vector_valued_function, logging_status_str, fnormalise
+from finmag.util.helpers import assert_number_of_files, vector_valued_function, logging_status_str, fnormalise, average_field
 from finmag.util.meshes import nanodisk, plot_mesh_with_paraview, mesh_volume, from_csg
 from finmag.util.mesh_templates import EllipticalNanodisk, Sphere
 from finmag.sim import sim_helpers
@@ -302,6 +302,73 @@ class TestSimulation(object):
         assert 'H_Demag_y' in entities
         assert 'H_Demag_z' in entities
 
+    def test_save_ndt_reuses_fields(self, tmpdir):
+        os.chdir(str(tmpdir))
+        sim = barmini()
+        # estimate the energies from the fields, too
+        sim.ndt_exact_energies = False
+        sim.run_until(1e-12)
+
+        demag = sim.get_interaction('Demag')
+        calls = []
+        compute_field = demag.compute_field
+
+        def counting_compute_field():
+            calls.append(1)
+            return compute_field()
+        demag.compute_field = counting_compute_field
+
+        # run_until keeps the fields of the state it wrote back
+        sim.save_ndt()
+        sim.save_ndt()
+        assert len(calls) == 0
+
+        # after an update which doesn't keep them they are computed once
+        # for all entities and then reused
+        sim.llg.effective_field.update(sim.t)
+        calls[:] = []
+        sim.save_ndt()
+        assert len(calls) == 1
+        sim.save_ndt()
+        assert len(calls) == 1
+        del demag.compute_field
+
+        f = Tablereader('barmini.ndt')
+        H_total = [f['H_total_x'][-1], f['H_total_y'][-1], f['H_total_z'][-1]]
+        assert np.allclose(H_total, average_field(sim.effective_field()))
+        H_demag = [f['H_Demag_x'][-1], f['H_Demag_y'][-1], f['H_Demag_z'][-1]]
+        assert np.allclose(H_demag, demag.average_field())
+        assert abs(f['E_total'][-1] - sim.total_energy()) < 1e-2 * abs(sim.total_energy())
+
+        sim.ndt_exact_energies = True
+        sim.save_ndt()
+        f = Tablereader('barmini.ndt')
+        assert abs(f['E_Demag'][-1] - demag.compute_energy()) < 1e-12 * abs(demag.compute_energy())
+
+    def test_save_ndt_follows_changes_of_the_interactions(self, tmpdir):
+        os.chdir(str(tmpdir))
+        sim = barmini()
+        sim.set_H_ext((1e5, 0, 0))
+        sim.run_until(1e-12)
+        sim.save_ndt()
+
+        sim.set_H_ext((0, 2e5, 0))
+        sim.save_ndt()
+        f = Tablereader('barmini.ndt')
+        assert np.allclose([f['H_Zeeman_x'][-1], f['H_Zeeman_y'][-1]], [0, 2e5])
+        H_total = [f['H_total_x'][-1], f['H_total_y'][-1], f['H_total_z'][-1]]
+        assert np.allclose(H_total, average_field(sim.effective_field()))
+        assert abs(f['E_total'][-1] - sim.total_energy()) < 1e-12 * abs(sim.total_energy())
+
+        exchange = sim.get_interaction('Exchange')
+        exchange.A.set(2 * exchange.A.get_numpy_array_debug())
+        exchange.reassemble()
+        sim.save_ndt()
+        f = Tablereader('barmini.ndt')
+        assert abs(f['E_Exchange'][-1] - exchange.compute_energy()) < 1e-12 * abs(exchange.compute_energy())
+        H_exchange = [f['H_Exchange_x'][-1], f['H_Exchange_y'][-1], f['H_Exchange_z'][-1]]
+        assert np.allclose(H_exchange, exchange.average_field())
+
     def test_save_restart_data(self, tmpdir):
         """
         Simple test to check that we can save restart data via the
@@ -507,6 +574,105 @@ class TestSimulation(object):
         assert_number_of_files('a.pvd', 1)
         assert_number_of_files('a*.vtu', 5)
 
+    def test_schedule_when(self):
+        """
+        Stop a macrospin simulation when m_z, which grows like
+        tanh(p alpha H t) with p = gamma / (1 + alpha^2), reaches 0.5,
+        and count the zero crossings of m_x on the way there.
+
+        """
+        H, alpha = 1e6, 0.1
+        sim = macrospin(H_ext=(0, 0, H), alpha=alpha)
+        t_switch = np.arctanh(0.5) * (1 + alpha ** 2) / (gamma * alpha * H)
+
+        crossings = []
+        sim.schedule(lambda sim: crossings.append(sim.t),
+                     when=lambda t, m: m[0])
+        sim.schedule(lambda sim: False,
+                     when=lambda t, m: sim.m_average[2] - 0.5, direction=1)
+        sim.run_until(1e-10)
+
+        assert abs(sim.t - t_switch) < 1e-4 * t_switch
+        assert abs(sim.m_average[2] - 0.5) < 1e-5
+        # m_x = sin(theta) cos(p H t) changes sign every half period
+        expected = int(t_switch * gamma * H / ((1 + alpha ** 2) * pi) + 0.5)
+        assert len(crossings) == expected
+        for i, t in enumerate(crossings):
+            t_expected = (i + 0.5) * pi * (1 + alpha ** 2) / (gamma * H)
+            assert abs(t - t_expected) < 1e-4 * t_expected
+
+        # The simulation can carry on afterwards.
+        sim.run_until(1e-10)
+        assert sim.t == 1e-10
+
+    def test_schedule_when_with_failing_event_function(self):
+        """
+        An exception in the event function stops the integration with an
+        error that contains its message.
+
+        """
+        sim = macrospin(H_ext=(0, 0, 1e6), alpha=0.1)
+
+        def g(t, m):
+            if t > 1e-12:
+                raise ValueError("no more roots")
+            return m[0]
+        sim.schedule(lambda sim: None, when=g)
+        with pytest.raises(RuntimeError) as excinfo:
+            sim.run_until(1e-11)
+        assert "no more roots" in str(excinfo.value)
+
+    def test_record_m(self):
+        """
+        Sample the precession of a macrospin every 0.1 ps by interpolation
+        and compare it with the analytic solution.
+
+        """
+        H, alpha = 1e6, 0.1
+        sim = macrospin(H_ext=(0, 0, H), alpha=alpha)
+        sim.set_tol(1e-10, 1e-10)
+        ts, ms = sim.record_m(1e-11, 1e-13)
+        assert len(ts) == 101
+        assert ms.shape == (101, 6)
+        assert sim.t == 1e-11
+        assert np.allclose(ms[-1], sim.llg.sundials_m)
+
+        m_analytic = make_analytic_solution(H, alpha)
+        for t, m in zip(ts, ms):
+            assert np.max(np.abs(m.reshape(3, -1)[:, 0] - m_analytic(t))) < 1e-5
+
+        # The last sample is before the end time, which is reached anyway.
+        ts, ms = sim.record_m(2.05e-11, 1e-12)
+        assert len(ts) == len(ms) == 11
+        assert abs(ts[-1] - 2e-11) < 1e-20
+        assert sim.t == 2.05e-11
+
+    def test_record_m_skips_scheduled_events(self):
+        sim = macrospin(H_ext=(0, 0, 1e6), alpha=0.1)
+        times = []
+        sim.schedule(lambda sim: times.append(sim.t), every=1e-12)
+        sim.run_until(2e-12)
+        assert len(times) == 3  # at 0, 1 and 2 ps
+
+        sim.record_m(1.05e-11, 1e-13)
+        sim.run_until(1.5e-11)
+        # nothing during the recording, then at 11, 12, ..., 15 ps
+        assert len(times) == 8
+        assert np.allclose(times[3:], np.arange(11, 16) * 1e-12, rtol=1e-10)
+        assert sim.t == 1.5e-11
+
+    def test_record_m_keeps_the_phase_of_scheduled_events(self):
+        sim = macrospin(H_ext=(0, 0, 1e6), alpha=0.1)
+        times = []
+        sim.schedule(lambda sim: times.append(sim.t), every=1e-12, after=0.5e-12)
+        sim.run_until(1e-12)
+        assert len(times) == 1  # at 0.5 ps
+
+        sim.record_m(5.2e-12, 1e-13)
+        sim.run_until(8e-12)
+        # nothing during the recording, then at 5.5, 6.5 and 7.5 ps
+        assert np.allclose(times[1:], [5.5e-12, 6.5e-12, 7.5e-12], rtol=1e-10)
+
     def test_remove_interaction1(self):
 
         mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(1, 1, 1), 1, 1, 1)
@@ -1108,6 +1274,30 @@ def test_set_m_after_relaxation(tmpdir):
     assert sim.m_average[2] <= -0.9
 
 
+def test_relax_estimates_the_energy_from_the_kept_fields(tmpdir):
+    """
+    Check that the energy estimate relax() uses to detect divergence is
+    computed from the fields kept at the scheduler events, without
+    evaluating the fields again.
+
+    """
+    os.chdir(str(tmpdir))
+    sim = barmini()
+    sim.set_m([1, 0, 1])
+    field = sim.llg.effective_field
+    estimate_total_energy = field.estimate_total_energy
+    fields_were_current = []
+
+    def checked_estimate_total_energy(t=None):
+        fields_were_current.append(field._fields_are_current(t))
+        return estimate_total_energy(t)
+
+    field.estimate_total_energy = checked_estimate_total_energy
+    sim.relax(stopping_dmdt=10.0)
+    assert len(fields_were_current) > 0
+    assert all(fields_were_current)
+
+
 def test_sim_relax_accepts_filename(tmpdir):
     """
     Check that if sim.relax() is given a filename, the relaxed state
@@ -1441,6 +1631,60 @@ def test_compute_normal_modes_with_different_solvers(tmpdir):
     #assert_define_same_eigenspace(w4b, w1)
 
 
+@pytest.mark.parametrize("use_real_matrix", [True, False])
+def test_compute_normal_modes_matrix_free(tmpdir, use_real_matrix):
+    """
+    The matrix-free eigenproblem gives the same frequencies as the
+    assembled one, and the relative errors of its (complex) eigenvectors
+    are computed with the operator as well.
+    """
+    from scipy.sparse.linalg import LinearOperator
+    os.chdir(str(tmpdir))
+
+    mesh = nanodisk(d=60, h=5, maxh=10.0)
+    sim = normal_mode_simulation(
+        mesh, Ms=8e6, m_init=[1, 0, 0], alpha=0.0, unit_length=1e-9, A=13e-12,
+        H_ext=[1e5, 0, 0], name='nanodisk')
+
+    omega, _, _ = sim.compute_normal_modes(n_values=4, use_real_matrix=use_real_matrix)
+    m = sim.m
+    omega_mf, w, rel_errors = sim.compute_normal_modes(
+        n_values=4, matrix_free=True, use_real_matrix=use_real_matrix)
+
+    assert isinstance(sim.D, LinearOperator)
+    assert np.iscomplexobj(w)
+    assert np.allclose(sim.m, m)
+    assert np.allclose(omega_mf, omega, rtol=1e-5)
+    assert (rel_errors < 1e-5).all()
+
+
+def test_compute_normal_modes_generalised_sparse(tmpdir):
+    """
+    The generalised eigenproblem with the sparse matrix of the local
+    interactions and a separately applied demag gives the same frequencies
+    as the assembled eigenproblem matrix.
+    """
+    from scipy.sparse import issparse
+    from scipy.sparse.linalg import LinearOperator
+    os.chdir(str(tmpdir))
+
+    mesh = nanodisk(d=60, h=5, maxh=10.0)
+    sim = normal_mode_simulation(
+        mesh, Ms=8e6, m_init=[1, 0, 0], alpha=0.0, unit_length=1e-9, A=13e-12,
+        H_ext=[1e5, 0, 0], name='nanodisk')
+
+    omega, _, _ = sim.compute_normal_modes(n_values=4)
+    m = sim.m
+    omega_sparse, _, rel_errors = sim.compute_normal_modes(
+        n_values=4, use_generalized=True, matrix_free=True)
+
+    assert isinstance(sim.A, LinearOperator)
+    assert issparse(sim.M)
+    assert np.allclose(sim.m, m)
+    assert np.allclose(omega_sparse, omega, rtol=1e-5)
+    assert (rel_errors < 1e-5).all()
+
+
 @pytest.mark.requires_X_display
 def test_plot_spatially_resolved_normal_modes(tmpdir):
     """
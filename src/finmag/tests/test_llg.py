@@ -1,6 +1,7 @@
 import numpy as np
 import dolfin as df
 from finmag.physics.llg import LLG
+from finmag.energies import Exchange, UniaxialAnisotropy, CubicAnisotropy
 from finmag.util.helpers import components
 
 
@@ -21,3 +22,117 @@ def test_method_of_computing_the_average_matters():
     average2 = np.mean(components(llg.m_numpy), axis=1)
     diff = np.abs(average1 - average2)
     assert diff.max() > 5e-2
+
+
+def setup_llg_pair():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(20, 10, 2), 10, 5, 1)
+    S1 = df.FunctionSpace(mesh, "Lagrange", 1)
+    S3 = df.VectorFunctionSpace(mesh, "Lagrange", 1, dim=3)
+    m_init = ('cos(x[0]/5.0)', 'sin(x[0]/5.0)', '0.1')
+
+    llgs = []
+    for dof_order in [False, True]:
+        llg = LLG(S1, S3, unit_length=1e-9, dof_order=dof_order)
+        llg.set_m(m_init)
+        llg.set_alpha(0.1)
+        llg.pins = [0, 3]
+        llg.effective_field.add(Exchange(13e-12))
+        llgs.append(llg)
+    return llgs
+
+
+def test_dof_order_rhs_agrees_with_vertex_order():
+    llg, llg_dofs = setup_llg_pair()
+
+    y = llg.sundials_m
+    ydot = np.zeros(y.shape)
+    llg.sundials_rhs(0, y, ydot)
+
+    y_dofs = llg_dofs.sundials_m
+    ydot_dofs = np.zeros(y_dofs.shape)
+    llg_dofs.sundials_rhs(0, y_dofs, ydot_dofs)
+
+    assert np.allclose(ydot_dofs[llg.v2d_xxx], ydot, rtol=1e-12, atol=0)
+    assert np.allclose(llg_dofs.dmdt, llg.dmdt)
+
+
+def test_in_place_changes_of_alpha_take_effect():
+    llg, llg_dofs = setup_llg_pair()
+    llg_ref, llg_dofs_ref = setup_llg_pair()
+    for l in (llg_ref, llg_dofs_ref):
+        l.set_alpha(0.5)
+    for l in (llg, llg_dofs):
+        l.alpha.vector()[:] = 0.5
+    # the sundials integrator does this before each time integration
+    llg_dofs.refresh_alpha_cache()
+
+    for l, l_ref in ((llg, llg_ref), (llg_dofs, llg_dofs_ref)):
+        y = l.sundials_m
+        ydot, ydot_ref = np.zeros(y.shape), np.zeros(y.shape)
+        l.sundials_rhs(0, y, ydot)
+        l_ref.sundials_rhs(0, y, ydot_ref)
+        assert np.allclose(ydot, ydot_ref, rtol=1e-12, atol=0)
+
+
+def test_dof_order_jtimes_agrees_with_vertex_order():
+    llg, llg_dofs = setup_llg_pair()
+    mp_dofs = np.random.random_sample(llg_dofs.sundials_m.shape) - 0.5
+    mp = mp_dofs[llg.v2d_xxx]
+
+    m = llg.sundials_m
+    J_mp = np.zeros(m.shape)
+    llg.sundials_jtimes(mp, J_mp, 0, m, None, np.zeros(m.shape))
+
+    m_dofs = llg_dofs.sundials_m
+    J_mp_dofs = np.zeros(m_dofs.shape)
+    llg_dofs.sundials_jtimes(mp_dofs, J_mp_dofs, 0, m_dofs, None, np.zeros(m_dofs.shape))
+
+    assert np.allclose(J_mp_dofs[llg.v2d_xxx], J_mp, rtol=1e-10, atol=0)
+
+
+def test_jacobian_operator_agrees_with_finite_differences():
+    llg, _ = setup_llg_pair()
+    llg.effective_field.add(UniaxialAnisotropy(1e5, (0, 0, 1), K2=-3e4))
+    llg.effective_field.add(CubicAnisotropy((1, 0, 0), (0, 1, 0), 5e4, K2=2e4, K3=1e4))
+    m = llg.sundials_m
+    mp = np.random.random_sample(m.shape) - 0.5
+
+    Hp = np.zeros(m.shape)
+    llg.jacobian_operator.apply(0, m, mp, Hp)
+    assert llg.jacobian_operator.nonlinear == ['Anisotropy', 'CubicAnisotropy']
+    assert np.array_equal(llg.sundials_m, m)
+
+    eps = 1e-6
+    llg.sundials_m = m + eps * mp
+    H_plus = llg.effective_field.compute_jacobian_only(0)[llg.v2d_xxx]
+    llg.sundials_m = m - eps * mp
+    H_minus = llg.effective_field.compute_jacobian_only(0)[llg.v2d_xxx]
+    Hp_expected = (H_plus - H_minus) / (2 * eps)
+    assert np.allclose(Hp, Hp_expected, rtol=1e-6, atol=1e-6 * abs(Hp_expected).max())
+
+
+def test_jtimes_only_recomputes_field_for_new_state():
+    llg, _ = setup_llg_pair()
+    m = llg.sundials_m
+    mp = np.random.random_sample(m.shape) - 0.5
+    ydot = np.zeros(m.shape)
+    llg.sundials_rhs(0, m, ydot)
+
+    n_updates = [0]
+    update = llg.effective_field.update
+
+    def counting_update(t=None):
+        n_updates[0] += 1
+        update(t)
+    llg.effective_field.update = counting_update
+
+    J_mp = np.zeros(m.shape)
+    llg.sundials_jtimes(mp, J_mp, 0, m, ydot, np.zeros(m.shape))
+    llg.sundials_jtimes(mp, J_mp, 0, m, ydot, np.zeros(m.shape))
+    assert n_updates[0] == 0
+
+    llg.sundials_m = m
+    J_mp2 = np.zeros(m.shape)
+    llg.sundials_jtimes(mp, J_mp2, 0, m, ydot, np.zeros(m.shape))
+    assert n_updates[0] == 1
+    assert np.allclose(J_mp2, J_mp, rtol=1e-12, atol=0)
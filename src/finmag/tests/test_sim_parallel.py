@@ -1,11 +1,16 @@
 import os
+import pytest
 import dolfin as df
 import numpy as np
 import matplotlib as mpl
 mpl.use("Agg")
 import matplotlib.pyplot as plt
 from finmag import Simulation as Sim
-from finmag.energies import Zeeman
+from finmag.energies import Zeeman, Exchange
+
+# The parallel integrator needs the optional cvode_petsc extension module
+# (built with `make -C native cvode_petsc`).
+pytest.importorskip("finmag.native.cvode_petsc")
 
 #df.parameters.reorder_dofs_serial = True
 
@@ -13,7 +18,7 @@ alpha = 0.1
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
-def t_test_sim_ode_parallel(do_plot=False):
+def test_sim_ode_parallel(do_plot=False):
     mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(2, 2, 2), 1, 1, 1)
     sim = Sim(mesh, 8.6e5, unit_length=1e-9, pbc='2d', parallel=True)
     sim.alpha = alpha
@@ -60,6 +65,28 @@ def t_test_sim_ode_parallel(do_plot=False):
     assert np.max(np.abs(mzs - mz_ref)) < 1e-9
     #assert np.max(length_error) < 1e-9
 
+
+def test_parallel_integrator_agrees_with_serial():
+    mesh = df.BoxMesh(df.Point(0, 0, 0), df.Point(20, 10, 2), 10, 5, 1)
+
+    def create_sim(parallel):
+        sim = Sim(mesh, 8.6e5, unit_length=1e-9, parallel=parallel)
+        sim.alpha = alpha
+        sim.set_m(lambda r: (1, r[1] - 5, 5))
+        sim.add(Exchange(1.3e-11))
+        sim.add(Zeeman((0, 0, 1e5)))
+        sim.set_tol(1e-10, 1e-10)
+        return sim
+
+    sim_serial = create_sim(parallel=False)
+    sim_parallel = create_sim(parallel=True)
+    for sim in (sim_serial, sim_parallel):
+        sim.run_until(2e-11)
+
+    assert np.max(np.abs(sim_parallel.m - sim_serial.m)) < 1e-6
+    assert sim_parallel.integrator.stats()['nsteps'] > 0
+
+
 if __name__ == "__main__":
-    test_sim_ode(do_plot=True)
+    test_sim_ode_parallel(do_plot=True)
     print "Saved plit in test_sim_ode.png."
@@ -114,4 +114,13 @@ use_xpra = True
 # Tell xpra which display to use ('None' means try to find any available
 # unused X display). This setting has no effect if xpra is disabled.
 use_display = None
+
+[demag]
+# If 'bem_cache' is True, dense boundary element matrices of the FK demag
+# are stored in this directory and reused by later simulations on the same
+# mesh. When the cache grows larger than 'bem_cache_size' (in MB), the least
+# recently used matrices are removed.
+bem_cache = False
+bem_cache_dir = ~/.finmag/bem_cache
+bem_cache_size = 4096
 """
@@ -15,14 +15,15 @@ logger = logging.getLogger("finmag")
 def _aux_fft_m(filename, t_step=None, t_ini=None, t_end=None, subtract_values='first', vertex_indices=None):
     """
     Helper function to compute the Fourier transform of magnetisation
-    data, which is either read from a single .ndt file (for spatially
-    averaged magnetisation) or from a series of .npy files (for
+    data, which is either read from a single .ndt or .ndtb file (for
+    spatially averaged magnetisation) or from a series of .npy files (for
     spatially resolved data). If necessary, the data is first
     resampled at regularly spaced time intervals.
 
     """
     # Load the data; extract time steps and magnetisation
-    if filename.endswith('.ndt'):
+    if filename.endswith('.ndt') or filename.endswith('.ndtb'):
+        # Tablereader reads both the text and the binary format
         data = Tablereader(filename)
         ts = data['time']
         mx = data['m_x']
@@ -58,7 +59,7 @@ def _aux_fft_m(filename, t_step=None, t_ini=None, t_end=None, subtract_values='f
             mz[i, :] = aa[2, vertex_indices]
     else:
         raise ValueError(
-            "Expected a single .ndt file or a wildcard pattern referring to a series of .npy files. Got: {}.".format(filename))
+            "Expected a single .ndt or .ndtb file or a wildcard pattern referring to a series of .npy files. Got: {}.".format(filename))
 
     # If requested, subtract the first value of the time series
     # (= relaxed state), or the average, or some other value.
@@ -218,7 +219,8 @@ def compute_power_spectral_density(filename, t_step=None, t_ini=None, t_end=None
 
     filename:
 
-        The .ndt file or .npy files containing the magnetisation values.
+        The .ndt (or binary .ndtb) file or .npy files containing the
+        magnetisation values.
         In the second case a pattern should be given (e.g. 'm_ringdown*.npy').
 
     t_step:
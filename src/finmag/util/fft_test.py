@@ -167,6 +167,32 @@ def test_power_spectral_density_from_averaged_magnetisation(tmpdir):
     assert(np.allclose(freqs_res, freqs_np, atol=0, rtol=RTOL))
 
 
+def test_power_spectral_density_from_binary_ndt_file(tmpdir):
+    """
+    The power spectral densities computed from a .ndtb file written by
+    BinaryTablewriter are the same as those from the .ndt file with the
+    same data.
+
+    """
+    os.chdir(str(tmpdir))
+    t_step = 1e-11
+    ndt_filename = fft_test_helpers.create_test_ndt_file(
+        str(tmpdir), t_step, 0, 10e-9, gamma * 1e6, 0.5)
+
+    # same header lines, followed by the rows as raw float64 values
+    ndtb_filename = ndt_filename + 'b'
+    with open(ndt_filename) as f:
+        headers = f.readline() + f.readline()
+    with open(ndtb_filename, 'wb') as f:
+        f.write(headers)
+        np.loadtxt(ndt_filename).astype('<f8').tofile(f)
+
+    psd_ndt = compute_power_spectral_density(ndt_filename, 2 * t_step, subtract_values=None)
+    psd_ndtb = compute_power_spectral_density(ndtb_filename, 2 * t_step, subtract_values=None)
+    for a, b in zip(psd_ndt, psd_ndtb):
+        assert np.allclose(a, b, atol=0, rtol=1e-12)
+
+
 def test_power_spectral_density_from_spatially_resolved_magnetisation(tmpdir, debug=False):
     """
     First we write some 'forged' spatially resolved magnetisation
@@ -2,6 +2,7 @@ import os
 import logging
 import types
 import numpy as np
+import dolfin as df
 from glob import glob
 from types import TupleType, StringType
 from aeon import timer
@@ -29,6 +30,10 @@ class Tablewriter(object):
         # have been saved already
         self.save_head = False
 
+        # In parallel, all processes compute the values (which involves
+        # collective operations), but only the first one writes them.
+        self.is_writer = df.MPI.rank(df.mpi_comm_world()) == 0
+
         # entities:
         # Idea is to have a dictionary of keys where the keys
         # are reference names for the entities and
@@ -207,22 +212,10 @@ class Tablewriter(object):
                              self._entities[entityname]['unit'])
         return "".join(line1) + "\n" + "".join(line2) + "\n"
 
-    @timer.method
-    def save(self):
-        """Append data (spatial averages of fields) for current
-        configuration"""
-
-        if not self.save_head:
-            f = open(self.filename, 'w')
-            # Write header
-            f.write(self.headers())
-            f.close()
-            self.save_head = True
-
-        # open file
-        with open(self.filename, 'a') as f:
-            f.write(' ' * len(self.comment_symbol))  # account for comment
-            # symbol width
+    def row(self):
+        """Return the current values of all entities (in the order of the
+        columns) as a list of floats, using NaN for missing values."""
+        values = []
 # The commented lines below are Hans' initial attempt to catch when the
 # number of columns to be written changes
 # but this seems to never happen. So it's not quite right.
@@ -238,25 +231,94 @@ class Tablewriter(object):
 #                    self.ncolumn_headings_written, len(self.entity_order))
 #                logger.error(msg)
 #                raise ValueError(msg)
-            for entityname in self.entity_order:
-                value = self._entities[entityname]['get'](self.sim)
-                if isinstance(value, np.ndarray):
-
-                    for v in value:
-                        f.write(self.float_format % v)
-
-                elif isinstance(value, float) or isinstance(value, int):
-                    f.write(self.float_format % value)
-                elif isinstance(value, types.NoneType):
-                    #f.write(self.string_format % value)
-                    f.write(self.string_format % "nan")
-                else:
-                    msg = "Can only deal with numpy arrays, float and int " + \
-                        "so far, but type is %s" % type(value)
-                    raise NotImplementedError(msg)
+        for entityname in self.entity_order:
+            value = self._entities[entityname]['get'](self.sim)
+            if isinstance(value, np.ndarray):
+                values.extend(value)
+            elif isinstance(value, float) or isinstance(value, int):
+                values.append(value)
+            elif isinstance(value, types.NoneType):
+                values.append(np.NAN)
+            else:
+                msg = "Can only deal with numpy arrays, float and int " + \
+                    "so far, but type is %s" % type(value)
+                raise NotImplementedError(msg)
+        return values
+
+    @timer.method
+    def save(self):
+        """Append data (spatial averages of fields) for current
+        configuration"""
+
+        if not self.save_head:
+            if self.is_writer:
+                f = open(self.filename, 'w')
+                # Write header
+                f.write(self.headers())
+                f.close()
+            self.save_head = True
+
+        values = self.row()
+        if not self.is_writer:
+            return
 
+        # open file
+        with open(self.filename, 'a') as f:
+            f.write(' ' * len(self.comment_symbol))  # account for comment
+            # symbol width
+            f.write("".join(self.float_format % v for v in values))
             f.write('\n')
 
+    def flush(self):
+        """Nothing to do here because save() writes each row immediately."""
+        pass
+
+
+class BinaryTablewriter(Tablewriter):
+    """
+    Same as Tablewriter, but the rows are stored as raw little-endian
+    float64 values after the two header lines (see Tablewriter.headers),
+    which Tablereader memory-maps instead of parsing text. The rows are
+    collected in memory and appended to the file every `buffer_rows`
+    rows or when flush() is called, so the file is only complete after
+    flush() (which Simulation.shutdown() calls).
+
+    The conventional file extension is '.ndtb'.
+
+    """
+
+    def __init__(self, filename, simulation, override=False, entity_order=None, entities=None, buffer_rows=1000):
+        super(BinaryTablewriter, self).__init__(
+            filename, simulation, override=override, entity_order=entity_order, entities=entities)
+        self.buffer_rows = buffer_rows
+        self._buffer = []
+
+    @timer.method
+    def save(self):
+        """Append data (spatial averages of fields) for current
+        configuration to the buffer"""
+        if not self.save_head:
+            if self.is_writer:
+                with open(self.filename, 'wb') as f:
+                    f.write(self.headers())
+            self.save_head = True
+
+        values = self.row()
+        if not self.is_writer:
+            return
+        self._buffer.append(values)
+        if len(self._buffer) >= self.buffer_rows:
+            self.flush()
+
+    @timer.method
+    def flush(self):
+        """Append the buffered rows to the file."""
+        if len(self._buffer) == 0:
+            return
+        with open(self.filename, 'ab') as f:
+            np.array(self._buffer, dtype='<f8').tofile(f)
+        self._buffer = []
+
 
 class Tablereader(object):
 
@@ -273,7 +335,7 @@ class Tablereader(object):
         """Read Table data file"""
 
         try:
-            self.f = open(self.filename, 'r')
+            self.f = open(self.filename, 'rb')
         except IOError:
             raise RuntimeError("Cannot see file '%s'" % self.filename)
 
@@ -284,15 +346,32 @@ class Tablereader(object):
 
         assert len(headers) == len(units)
 
-        # use numpy to read remaining data (genfromtxt will
-        # complain if there are rows with different sizes)
-        try:
-            self.data = np.genfromtxt(self.f)
-        except ValueError:
-            raise RuntimeError("Cannot load data from file '{}'." +
-                               "Maybe the file was incompletely written?".
-                               format(self.f))
-        self.f.close()
+        if self.filename.endswith('.ndtb'):
+            # binary file written by BinaryTablewriter
+            offset = self.f.tell()
+            self.f.close()
+            ncols = len(headers) - 1
+            nbytes = os.path.getsize(self.filename) - offset
+            if nbytes % (8 * ncols) != 0:
+                raise RuntimeError("Cannot load data from file '{}'. "
+                                   "Maybe the file was incompletely written?".
+                                   format(self.filename))
+            nrows = nbytes // (8 * ncols)
+            if nrows > 0:
+                self.data = np.memmap(self.filename, dtype='<f8', mode='r',
+                                      offset=offset, shape=(nrows, ncols))
+            else:
+                self.data = np.zeros((0, ncols))
+        else:
+            # use numpy to read remaining data (genfromtxt will
+            # complain if there are rows with different sizes)
+            try:
+                self.data = np.genfromtxt(self.f)
+            except ValueError:
+                raise RuntimeError("Cannot load data from file '{}'." +
+                                   "Maybe the file was incompletely written?".
+                                   format(self.f))
+            self.f.close()
 
         # Make sure we have a 2d array even if the file only contains a single
         # line (or none)
@@ -98,6 +98,42 @@ def test_Tablewriter_complains_about_incomplete_entities():
         sim.tablewriter.add_entity('test4', {})
 
 
+def test_binary_table_writer_and_reader(tmpdir):
+    os.chdir(str(tmpdir))
+
+    class FakeSim(object):
+        t = 0.0
+        m_average = np.array([1.0, 0.0, 0.0])
+
+    sim = FakeSim()
+    ndt = BinaryTablewriter('data.ndtb', sim, buffer_rows=4)
+    text_ndt = Tablewriter('data.ndt', sim)
+    times = np.linspace(0, 1e-11, 10)
+    for t in times:
+        sim.t = t
+        sim.m_average = np.array([np.cos(t * 1e11), np.sin(t * 1e11), 0.0])
+        ndt.save()
+        text_ndt.save()
+
+    # only the full buffers have been written so far
+    assert len(Tablereader('data.ndtb').timesteps()) == 8
+    ndt.flush()
+
+    data = Tablereader('data.ndtb')
+    text_data = Tablereader('data.ndt')
+    assert sorted(data.entities()) == sorted(text_data.entities())
+    assert np.all(data.timesteps() == times)
+    assert np.allclose(data['m_x'], np.cos(times * 1e11))
+    assert np.allclose(np.array(data['m_x', 'm_y']), np.array(text_data['m_x', 'm_y']))
+    assert np.all(np.isnan(data['steps']))
+
+    # A truncated file should raise a runtime error
+    with open('data.ndtb', 'ab') as f:
+        f.write('\0' * 4)
+    with pytest.raises(RuntimeError):
+        Tablereader('data.ndtb')
+
+
 def test_field_saver(tmpdir):
     os.chdir(str(tmpdir))
 
@@ -1881,3 +1881,15 @@ def get_source(file):
         file = file[:-1]
     with open(file, 'rb') as f:
         return f.read()
+
+
+def petsc_matrix_to_csr(A):
+    """
+    Return a copy of the dolfin.PETScMatrix `A` as a scipy.sparse.csr_matrix.
+
+    """
+    from scipy.sparse import csr_matrix
+
+    mat = df.as_backend_type(A).mat()
+    indptr, indices, data = mat.getValuesCSR()
+    return csr_matrix((data, indices, indptr), shape=mat.size)
@@ -0,0 +1,146 @@
+"""
+A pool of worker processes which set up simulations of their own while
+sharing the dense boundary element matrix of the FK demag, so that the
+matrix is computed only once. It is used by hysteresis_parallel() in
+finmag.sim.hysteresis and by the worker processes of NEB_Sundials.
+
+"""
+import os
+import atexit
+import shutil
+import logging
+import weakref
+import tempfile
+import multiprocessing
+import numpy as np
+from finmag.energies.demag.fk_demag import FKDemag
+
+log = logging.getLogger(name="finmag")
+
+# Pools which haven't been closed yet, closed at exit at the latest.
+_open_pools = weakref.WeakSet()
+
+
+def demag_bem(sim):
+    """
+    Return (bem, b2g_map) of the FK demag of `sim`, or None if there is
+    no such interaction with a dense boundary element matrix.
+
+    The pair can be passed on via `demag.precomputed_bem(*demag_bem)` to
+    a demag of another simulation with the same mesh.
+
+    """
+    for interaction in sim.llg.effective_field.interactions.itervalues():
+        if isinstance(interaction, FKDemag) and isinstance(interaction._bem, np.ndarray):
+            return interaction._bem, interaction._b2g_map
+    return None
+
+
+def _init_worker(initializer, bem_file, b2g_map_file, initargs):
+    demag_bem = None
+    if bem_file is not None:
+        # Memory-mapping the file lets all workers share the same pages.
+        demag_bem = (np.load(bem_file, mmap_mode='r'), np.load(b2g_map_file))
+    initializer(demag_bem, *initargs)
+
+
+class WorkerPool(object):
+
+    """
+    A multiprocessing.Pool whose workers are initialised with the
+    boundary element matrix of the FK demag of a simulation.
+
+    The matrix is written to a temporary file, which the workers
+    memory-map. Each of them then calls `initializer(demag_bem,
+    *initargs)`, where `demag_bem` is None or the pair (bem, b2g_map)
+    returned by demag_bem(), and which typically creates the simulation
+    of the worker.
+
+    The pool can be used as a context manager. Otherwise call close()
+    to stop the worker processes and remove the temporary file. This is
+    also done when the pool is garbage collected or at exit, whichever
+    comes first.
+
+    """
+
+    def __init__(self, sim, processes, initializer, initargs=()):
+        """
+        *Arguments*
+
+            sim:  Simulation
+
+                The simulation whose demag boundary element matrix is
+                shared with the workers. It may be None, in which case
+                there is nothing to share.
+
+            processes:  int
+
+                The number of worker processes.
+
+            initializer:  callable
+
+                Called in each worker process as described above. It must
+                be picklable, e.g. a module-level function.
+
+        """
+        self.processes = processes
+        self._tmpdir = None
+        self._pool = None
+
+        shared = None if sim is None else demag_bem(sim)
+        bem_file, b2g_map_file = None, None
+        if shared is not None:
+            self._tmpdir = tempfile.mkdtemp(prefix='finmag_workers_')
+            bem_file = os.path.join(self._tmpdir, 'bem.npy')
+            b2g_map_file = os.path.join(self._tmpdir, 'b2g_map.npy')
+            np.save(bem_file, shared[0])
+            np.save(b2g_map_file, shared[1])
+        else:
+            log.debug("No dense FK demag boundary element matrix to share, "
+                      "each worker will set up its simulation from scratch.")
+
+        _open_pools.add(self)
+        try:
+            self._pool = multiprocessing.Pool(processes, _init_worker,
+                                              (initializer, bem_file, b2g_map_file, initargs))
+        except:
+            self.close()
+            raise
+
+    def map(self, func, iterable, chunksize=1):
+        """
+        Apply `func` to each element of `iterable` in the worker processes
+        and return the list of the results, see multiprocessing.Pool.map.
+
+        """
+        return self._pool.map(func, iterable, chunksize=chunksize)
+
+    def close(self):
+        """
+        Stop the worker processes and remove the temporary file.
+
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+        _open_pools.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        if self._pool is not None or self._tmpdir is not None:
+            self.close()
+
+
+@atexit.register
+def _close_open_pools():
+    for pool in list(_open_pools):
+        pool.close()
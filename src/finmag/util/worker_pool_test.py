@@ -0,0 +1,32 @@
+import os
+from finmag.util.worker_pool import WorkerPool, _open_pools
+
+_offset = None
+
+
+def _init(demag_bem, offset):
+    global _offset
+    assert demag_bem is None
+    _offset = offset
+
+
+def _add_offset(x):
+    return x + _offset
+
+
+def test_worker_pool_without_demag():
+    with WorkerPool(None, 2, _init, (10,)) as pool:
+        assert pool._tmpdir is None
+        assert pool.map(_add_offset, range(4)) == [10, 11, 12, 13]
+        assert pool in _open_pools
+    assert pool._pool is None
+    assert pool not in _open_pools
+
+
+def test_worker_pool_is_closed_when_collected():
+    pool = WorkerPool(None, 1, _init, (0,))
+    processes = pool._pool._pool
+    del pool
+    for process in processes:
+        process.join(10)
+        assert not process.is_alive()